@@ -0,0 +1,2 @@
+"""Бенчмарки. Запускаются из корня репозитория, например:
+`python -m benchmarks.wal_throughput`"""
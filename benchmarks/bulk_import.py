@@ -0,0 +1,56 @@
+"""Скорость массовой загрузки (`bulk_import.BulkLoader`) по сравнению с `Transaction.perform()`.
+
+Запуск: `python -m benchmarks.bulk_import [--transactions N] [--chunk-size 10000]`"""
+
+import argparse
+import time
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+from src.bulk_import import BulkLoader
+from src.core import Bank, Client, DebitAccount, Transaction
+
+
+def accounts():
+    # pylint: disable=missing-function-docstring
+    client = Client(Bank(), 'A', 'B', '1', '2')
+    return client.default_cash_account, client.create_account(DebitAccount)
+
+
+def perform(transactions: int) -> float:
+    """Транзакций в секунду при проведении по одной"""
+    cash, debit = accounts()
+    start = time.perf_counter()
+    for _ in range(transactions):
+        Transaction(cash, debit, 1).perform()
+    return transactions / (time.perf_counter() - start)
+
+
+def bulk(transactions: int, chunk_size: int, check_permissions: bool) -> float:
+    """Транзакций в секунду при массовой загрузке (включая разбор строк)"""
+    cash, debit = accounts()
+    moment = datetime(2023, 1, 1)
+    rows = [{'id': str(uuid4()), 'from': str(cash.id), 'to': str(debit.id), 'amount': 1,
+             'datetime': (moment + timedelta(seconds=i)).isoformat()}
+            for i in range(transactions)]
+    loader = BulkLoader(cash.client.bank, chunk_size=chunk_size,
+                        check_permissions=check_permissions)
+    start = time.perf_counter()
+    loader.load(rows)
+    return transactions / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--transactions', type=int, default=100_000)
+    parser.add_argument('--chunk-size', type=int, default=10_000)
+    args = parser.parse_args()
+
+    print(f'{"perform()":>24} {perform(args.transactions):>12.0f} tx/s')
+    print(f'{"BulkLoader":>24} {bulk(args.transactions, args.chunk_size, False):>12.0f} tx/s')
+    print(f'{"BulkLoader (checked)":>24} '
+          f'{bulk(args.transactions, args.chunk_size, True):>12.0f} tx/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Пропускная способность `engine.ShardedEngine` в зависимости от числа шардов.
+
+Несколько потоков-клиентов параллельно делают переводы между случайными счетами
+через `ClientFacade.transfer`; для сравнения первая строка — без движка
+(транзакции выполняются в потоках клиентов под блокировками счетов).
+Шарды — потоки, поэтому под GIL пропускная способность с числом шардов не растёт,
+а первая строка остаётся верхней границей; рост возможен в сборке Python без GIL.
+
+Запуск: `python -m benchmarks.engine_scaling [--shards 1 2 4 8] [--transfers N]`"""
+
+import argparse
+import os
+import random
+import time
+from threading import Thread
+
+from src.core import Bank, Client, ClientFacade
+from src.engine import ShardedEngine
+
+
+def run(shards: int, transfers: int, accounts_count: int, threads_count: int) -> float:
+    """Возвращает число переводов в секунду; shards == 0 означает работу без движка"""
+    bank = Bank()
+    engine = ShardedEngine(shards) if shards else None
+    bank.engine = engine
+    client_facade = ClientFacade(Client(bank, 'A', 'B', '1', '2'))
+    accounts = [client_facade.create_account('DebitAccount').id for _ in range(accounts_count)]
+    for account_id in accounts:
+        client_facade.deposit(account_id, 10**9)
+
+    def worker(seed: int):
+        rng = random.Random(seed)
+        for _ in range(transfers // threads_count):
+            From, To = rng.sample(accounts, 2)
+            client_facade.transfer(From, To, 1)
+
+    threads = [Thread(target=worker, args=(seed,)) for seed in range(threads_count)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    if engine is not None:
+        engine.close()
+    return transfers / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    cores = os.cpu_count() or 1
+    parser.add_argument('--shards', type=int, nargs='+',
+                        default=sorted({1, 2, 4, cores}))
+    parser.add_argument('--transfers', type=int, default=20_000)
+    parser.add_argument('--accounts', type=int, default=1000)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    print(f'{"shards":>8} {"transfers/s":>12}')
+    print(f'{"none":>8} {run(0, args.transfers, args.accounts, args.threads):>12.0f}')
+    for shards in args.shards:
+        print(f'{shards:>8} {run(shards, args.transfers, args.accounts, args.threads):>12.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Стоимость проверок перевода: план правил (`core.permission_plan`)
+по сравнению с прежней схемой, где `check_permissions()` вызывался у транзакции
+и у её `mirror`, а результаты каждого метода объединялись через `&`.
+
+Прежняя схема воспроизведена здесь (`dynamic_checks`) с теми же правилами,
+чтобы сравнивать обе на одних и тех же счетах. Замеряется только проверка,
+без изменения балансов и записи в историю.
+
+Запуск: `python -m benchmarks.permission_checks [--checks N]`"""
+
+import argparse
+import time
+from datetime import date
+from typing import Callable, List
+
+from src.core import (Account, Bank, BoolWithReason, CashAccount, Client, CreditAccount,
+                      DebitAccount, DepositAccount, Transaction)
+
+
+def _account_checks(account: Account, transaction: Transaction) -> BoolWithReason:
+    """`check_withdraw_permissions` счетов до появления плана"""
+    if isinstance(account, DepositAccount):
+        answer = BoolWithReason()
+        if transaction.datetime.date() < account.end_date and transaction.amount > 0:
+            answer = answer & BoolWithReason("Can't withdraw money before end date\n")
+        if account.balance < transaction.amount:
+            answer = answer & BoolWithReason("Not enough money\n")
+        return answer
+    if isinstance(account, CreditAccount):
+        if account.balance - transaction.amount < -account.credit_limit:
+            return BoolWithReason("Not enough money\n")
+        return BoolWithReason()
+    if isinstance(account, DebitAccount) and account.balance < transaction.amount:
+        return BoolWithReason("Not enough money\n")
+    return BoolWithReason()
+
+
+def _client_checks(client: Client, transaction: Transaction) -> BoolWithReason:
+    """`Client.check_withdraw_permissions` до появления плана"""
+    if not client.verified:
+        if isinstance(transaction.To, CashAccount) or transaction.To.client != client:
+            if transaction.amount > client.bank.unathorized_withdrawal_limit:
+                return BoolWithReason("Client doesn't have passport or address\n")
+    return BoolWithReason()
+
+
+def _side(transaction: Transaction) -> BoolWithReason:
+    return BoolWithReason(_account_checks(transaction.From, transaction).reason) \
+        & _client_checks(transaction.From.client, transaction) \
+        & transaction.From.client.bank.withdrawal_limits.check(transaction)
+
+
+def dynamic_checks(transaction: Transaction) -> BoolWithReason:
+    """Проверка обеих сторон так, как она делалась до плана"""
+    side = _side(transaction)
+    mirrored = _side(transaction.mirror)
+    return BoolWithReason(side.reason + mirrored.reason)
+
+
+def planned_checks(transaction: Transaction) -> BoolWithReason:
+    """Проверка обеих сторон по плану (`Transaction._check_both_sides`)"""
+    return transaction._check_both_sides() # pylint: disable=protected-access
+
+
+def transfers() -> List[Transaction]:
+    """Успешные переводы между счетами разных типов у клиентов с документами и без"""
+    bank = Bank(unathorized_withdrawal_limit=1000)
+    verified = Client(bank, 'A', 'B', '1', '2')
+    unverified = Client(bank, 'C', 'D')
+    debit = verified.create_account(DebitAccount)
+    credit = unverified.create_account(CreditAccount, credit_limit=10**9, interest_rate=0.1)
+    deposit = verified.create_account(DepositAccount, end_date=date(2000, 1, 1))
+    for account in (debit, deposit):
+        account.balance = 10**9
+    return [Transaction(debit, credit, 10), Transaction(credit, debit, 10),
+            Transaction(deposit, verified.default_cash_account, 10),
+            Transaction(unverified.default_cash_account, credit, 10)]
+
+
+def measure(check: Callable[[Transaction], BoolWithReason], checks: int) -> float:
+    """Наносекунд на проверку одного перевода"""
+    sample = transfers()
+    rounds = checks // len(sample)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for transaction in sample:
+            if not check(transaction):
+                raise AssertionError('Benchmark transfers must pass the checks')
+    return (time.perf_counter() - start) / (rounds * len(sample)) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    parser.add_argument('--checks', type=int, default=400_000)
+    args = parser.parse_args()
+
+    dynamic = measure(dynamic_checks, args.checks)
+    planned = measure(planned_checks, args.checks)
+    print(f'{"dynamic dispatch":>20} {dynamic:>10.0f} ns/transfer')
+    print(f'{"permission plan":>20} {planned:>10.0f} ns/transfer')
+    print(f'{"speedup":>20} {dynamic / planned:>10.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+"""Набор бенчмарков ядра банка и JSON-интерфейса.
+
+Строит синтетический банк (`--clients` клиентов по `--accounts` счетов,
+`--transactions` случайных переводов в истории) и для каждой операции
+измеряет задержку отдельных вызовов (p50, p99, max), пропускную способность
+и пик выделенной памяти (tracemalloc, отдельным проходом, чтобы не искажать время).
+
+Результат печатается таблицей в stderr и в JSON — в stdout или в файл `--output`.
+С `--baseline` результаты сравниваются с сохранённым ранее JSON:
+если p50, p99 или пик памяти выросли больше чем на `--tolerance`,
+регрессии печатаются, а код выхода равен 1 — так бенчмарк можно запускать в CI.
+
+Запуск: `python -m benchmarks.suite [--samples N] [--output results.json] [--baseline old.json]`"""
+
+import argparse
+import json
+import platform
+import random
+import resource
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+from src.core import Account, ClientFacade, Transaction
+from src.json_bridge import ClientCommands, ServerState, SuperuserCommands
+
+
+Operation = Callable[[], object]
+
+
+class SyntheticBank:
+    """Банк с клиентами, счетами и историей переводов для бенчмарков"""
+
+    def __init__(self, clients: int, accounts: int, transactions: int, seed: int = 0):
+        self.rng = random.Random(seed)
+        self.server_state = ServerState()
+        SuperuserCommands.create_bank({'name': 'bench'}, self.server_state)
+        self.facades: List[ClientFacade] = []
+        self.accounts: List[Account] = []
+        for i in range(clients):
+            token = SuperuserCommands.create_client(
+                {'bank': 'bench', 'name': f'client{i}', 'surname': 'bench',
+                 'passport': str(i), 'address': 'bench'}, self.server_state)['client_token']
+            client_facade = self.server_state.client_facades[token]
+            self.facades.append(client_facade)
+            for _ in range(accounts):
+                account = client_facade.create_account('DebitAccount')
+                client_facade.deposit(account.id, 10**12)
+                self.accounts.append(account)
+        for _ in range(transactions):
+            From, To = self.rng.sample(self.accounts, 2)
+            Transaction(From, To, 1).perform()
+
+    def random_account(self) -> Account:
+        """Случайный счёт банка"""
+        return self.rng.choice(self.accounts)
+
+    def random_pair(self) -> List[Account]:
+        """Два разных случайных счёта"""
+        return self.rng.sample(self.accounts, 2)
+
+
+def operations(bank: SyntheticBank) -> Dict[str, Operation]:
+    """Измеряемые операции; каждая при вызове выполняет одно действие над случайными счетами"""
+
+    def perform():
+        From, To = bank.random_pair()
+        return Transaction(From, To, 1).perform()
+
+    def history_see():
+        return bank.random_account().history.see(limit=100)
+
+    def show_history():
+        account = bank.random_account()
+        return ClientCommands.show_history({'account_id': str(account.id), 'limit': '100'},
+                                           ClientFacade(account.client))
+
+    def transfer():
+        From, To = bank.random_pair()
+        return ClientCommands.transfer(
+            {'from_account_id': str(From.id), 'to_account_id': str(To.id), 'amount': '1'},
+            ClientFacade(From.client), bank.server_state)
+
+    def create_account():
+        return ClientCommands.create_account({'account_type': 'DebitAccount'},
+                                             bank.rng.choice(bank.facades))
+
+    return {
+        'perform': perform,
+        'history_see': history_see,
+        'show_history': show_history,
+        'transfer': transfer,
+        'create_account': create_account,
+    }
+
+
+def percentile(sorted_samples: List[int], fraction: float) -> int:
+    """Значение, меньше или равное которому `fraction` доля отсортированных замеров"""
+    index = min(len(sorted_samples) - 1, int(fraction * len(sorted_samples)))
+    return sorted_samples[index]
+
+
+def measure(operation: Operation, samples: int, memory_samples: int) -> Dict[str, float]:
+    """Замеряет задержку `samples` вызовов и пик памяти за `memory_samples` вызовов"""
+    timings = []
+    clock = time.perf_counter_ns
+    for _ in range(samples):
+        start = clock()
+        operation()
+        timings.append(clock() - start)
+    timings.sort()
+
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    for _ in range(memory_samples):
+        operation()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'ops_per_s': round(samples / (sum(timings) / 1e9), 1),
+        'p50_us': percentile(timings, 0.50) / 1000,
+        'p99_us': percentile(timings, 0.99) / 1000,
+        'max_us': timings[-1] / 1000,
+        'peak_kib': round((peak - baseline) / 1024, 1),
+    }
+
+
+def run(args: argparse.Namespace) -> Dict:
+    """Строит банк, прогоняет все операции и возвращает результаты в виде JSON-объекта"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    bank = SyntheticBank(args.clients, args.accounts, args.transactions, args.seed)
+    build_seconds = time.perf_counter() - start
+    _, build_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    selected = operations(bank)
+    if args.only:
+        selected = {name: selected[name] for name in args.only}
+    results = {name: measure(operation, args.samples, args.memory_samples)
+               for name, operation in selected.items()}
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'clients': args.clients,
+            'accounts': args.accounts,
+            'transactions': args.transactions,
+            'samples': args.samples,
+        },
+        'build': {
+            'seconds': round(build_seconds, 3),
+            'peak_kib': round(build_peak / 1024, 1),
+        },
+        'max_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'results': results,
+    }
+
+
+def regressions(current: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Список метрик, которые стали хуже базовых больше чем на `tolerance`"""
+    found = []
+    for name, metrics in current['results'].items():
+        old = baseline.get('results', {}).get(name)
+        if old is None:
+            continue
+        for metric in ('p50_us', 'p99_us', 'peak_kib'):
+            if old[metric] > 0 and metrics[metric] > old[metric] * (1 + tolerance):
+                found.append(f'{name}.{metric}: {old[metric]} -> {metrics[metric]}')
+    return found
+
+
+def print_table(result: Dict) -> None:
+    """Печатает результаты в stderr в человекочитаемом виде"""
+    print(f'build: {result["build"]["seconds"]} s, peak {result["build"]["peak_kib"]} KiB',
+          file=sys.stderr)
+    print(f'{"operation":>16} {"ops/s":>10} {"p50 us":>9} {"p99 us":>9} {"peak KiB":>9}',
+          file=sys.stderr)
+    for name, m in result['results'].items():
+        print(f'{name:>16} {m["ops_per_s"]:>10.0f} {m["p50_us"]:>9.1f} {m["p99_us"]:>9.1f} '
+              f'{m["peak_kib"]:>9.1f}', file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--accounts', type=int, default=10, help='счетов на клиента')
+    parser.add_argument('--transactions', type=int, default=100_000)
+    parser.add_argument('--samples', type=int, default=10_000)
+    parser.add_argument('--memory-samples', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', nargs='+', help='измерить только эти операции')
+    parser.add_argument('--output', help='куда записать JSON (по умолчанию stdout)')
+    parser.add_argument('--baseline', help='JSON с предыдущими результатами для сравнения')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+
+    result = run(args)
+    print_table(result)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(result, file, indent=2)
+    else:
+        json.dump(result, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as file:
+            found = regressions(result, json.load(file), args.tolerance)
+        for line in found:
+            print('regression:', line, file=sys.stderr)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
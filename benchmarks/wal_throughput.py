@@ -0,0 +1,44 @@
+"""Пропускная способность журнала (`persistence.WriteAheadLog`) при разных размерах пачки fsync.
+
+Запуск: `python -m benchmarks.wal_throughput [--transactions N] [--group-sizes 1 8 64 512]`"""
+
+import argparse
+import tempfile
+import time
+
+from src.json_bridge import SuperuserCommands
+from src.persistence import open_server_state
+
+
+def run(transactions: int, group_size: int) -> float:
+    """Возвращает число транзакций в секунду"""
+    with tempfile.TemporaryDirectory() as directory:
+        server_state = open_server_state(directory, group_size=group_size,
+                                         group_interval=1.0, snapshot_every=10**9)
+        SuperuserCommands.create_bank({'name': 'bench'}, server_state)
+        token = SuperuserCommands.create_client(
+            {'bank': 'bench', 'name': 'A', 'surname': 'B',
+             'passport': '1', 'address': '2'}, server_state)['client_token']
+        client_facade = server_state.client_facades[token]
+        account = client_facade.create_account('DebitAccount')
+
+        start = time.perf_counter()
+        for _ in range(transactions):
+            client_facade.deposit(account.id, 1)
+        server_state.journal.close()
+        return transactions / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--transactions', type=int, default=5000)
+    parser.add_argument('--group-sizes', type=int, nargs='+', default=[1, 8, 64, 512])
+    args = parser.parse_args()
+
+    print(f'{"group size":>10} {"tx/s":>12}')
+    for group_size in args.group_sizes:
+        print(f'{group_size:>10} {run(args.transactions, group_size):>12.0f}')
+
+
+if __name__ == '__main__':
+    main()
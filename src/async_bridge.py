@@ -0,0 +1,115 @@
+"""Асинхронная обёртка над командами из `json_bridge.py`.
+
+Диалоги бота работают в одном event loop, поэтому в пуле потоков выполняются
+все команды, которые могут ждать: блокировки счетов, запись в хранилище
+или журнал (с fsync), чтение истории из хранилища. Прямо в event loop
+выполняются только чтения из памяти (`AsyncCommands.INLINE`).
+
+Чтобы один клиент не занял весь пул, у каждого клиента ограничено число
+одновременно выполняемых команд, а если у него накопилось слишком много
+ожидающих команд, новые сразу отклоняются с ошибкой `Too many requests`.
+
+Использование:
+```python
+commands = AsyncCommands(server_state)
+result = await commands.client('withdraw', {'account_id': ..., 'amount': 100}, client_facade)
+result = await commands.superuser('create_bank', {'name': 'Сбер'})
+```"""
+
+import asyncio
+import inspect
+from concurrent.futures import Executor
+from functools import partial
+from typing import Any, Callable, Dict, Hashable
+
+from .core import ClientFacade
+from .json_bridge import ClientCommands, ServerState, SuperuserCommands
+
+
+TOO_MANY_REQUESTS = {'status': 'error', 'message': 'Too many requests'}
+
+
+def _command(namespace: type, name: str) -> Callable | None:
+    # Команда ищется при каждом вызове, а не один раз в __init__,
+    # чтобы учитывать обёртки, которые добавляет `metrics.enable()`
+    if isinstance(vars(namespace).get(name), staticmethod):
+        return getattr(namespace, name)
+    return None
+
+
+class _ClientQueue:
+    """Очередь команд одного клиента"""
+    def __init__(self, max_in_flight: int):
+        self.semaphore = asyncio.Semaphore(max_in_flight)
+        self.waiting = 0
+
+
+class AsyncCommands:
+    """Выполняет команды `ClientCommands` / `SuperuserCommands` по имени.
+
+    Параметры:
+        - executor: пул для команд не из `INLINE` (по умолчанию — пул event loop-а)
+        - max_in_flight: сколько команд всего может выполняться одновременно
+        - max_in_flight_per_client: сколько команд одного клиента выполняются одновременно
+        - max_queued_per_client: сколько команд одного клиента могут ждать,
+            прежде чем новые начнут отклоняться"""
+
+    INLINE = frozenset({'show_accounts', 'show_stats'})
+    """Команды клиента, которые выполняются прямо в event loop: они только читают память,
+    не захватывая блокировок. Остальные команды (и все команды суперпользователя)
+    выполняются в пуле потоков."""
+
+    def __init__(self, server_state: ServerState, executor: Executor | None = None, *,
+                 max_in_flight: int = 64, max_in_flight_per_client: int = 2,
+                 max_queued_per_client: int = 16):
+        self.server_state = server_state
+        self.executor = executor
+        self.max_in_flight_per_client = max_in_flight_per_client
+        self.max_queued_per_client = max_queued_per_client
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self._queues: Dict[Hashable, _ClientQueue] = {}
+
+    async def client(self, name: str, command: Dict,
+                     client_facade: ClientFacade) -> Dict:
+        """Выполняет команду `ClientCommands.<name>` от имени клиента"""
+        function = _command(ClientCommands, name)
+        if function is None:
+            return {'status': 'error', 'message': 'Unknown command ' + name}
+        return await self._run(client_facade.client.id, function, command,
+                               client_facade, name not in self.INLINE)
+
+    async def superuser(self, name: str, command: Dict,
+                        client_facade: ClientFacade | None = None) -> Dict:
+        """Выполняет команду `SuperuserCommands.<name>`.
+        `client_facade` нужен командам, которые меняют конкретного клиента (`update_client`)."""
+        function = _command(SuperuserCommands, name)
+        if function is None:
+            return {'status': 'error', 'message': 'Unknown command ' + name}
+        return await self._run('superuser', function, command, client_facade, True)
+
+    def _arguments(self, function: Callable, command: Dict,
+                   client_facade: ClientFacade | None) -> Dict[str, Any]:
+        available = {'server_state': self.server_state, 'client_facade': client_facade}
+        parameters = list(inspect.signature(function).parameters)
+        return {parameters[0]: command,
+                **{name: available[name] for name in parameters[1:]}}
+
+    async def _run(self, key: Hashable, function: Callable, command: Dict,
+                   client_facade: ClientFacade | None, offload: bool) -> Dict:
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = _ClientQueue(self.max_in_flight_per_client)
+        if queue.waiting >= self.max_queued_per_client:
+            return TOO_MANY_REQUESTS
+
+        call = partial(function, **self._arguments(function, command, client_facade))
+        queue.waiting += 1
+        try:
+            async with queue.semaphore, self._in_flight:
+                if offload:
+                    return await asyncio.get_running_loop().run_in_executor(self.executor, call)
+                return call()
+        finally:
+            queue.waiting -= 1
+            if queue.waiting == 0:
+                del self._queues[key]
@@ -1,10 +1,22 @@
 """Основной модуль бота.
-Запускает бота и базу данных (если бы она была)."""
+Запускает бота и восстанавливает состояние с диска (папка из $BANK_DATA_DIR, по умолчанию data).
+Если задан $BANK_METRICS_PORT, на этом порту отдаются метрики Prometheus (`GET /metrics`).
+
+Раз в день бот выплачивает закончившиеся вклады (`maturity.MaturityScheduler`)
+и сообщает об этом клиентам, которые авторизовались в боте после его запуска."""
+import asyncio
+import os
+from typing import Dict
+from uuid import UUID
+
 from aiogram import Bot, Dispatcher, types
 
+from .async_bridge import AsyncCommands
+from . import metrics
 from .credentials import BOT_TOKEN
 from .dialogs import for_superuser, for_client, for_both
-from .json_bridge import ServerState
+from .maturity import MaturityScheduler
+from .persistence import open_server_state
 
 # pylint: disable=missing-function-docstring
 # pylint: disable=line-too-long
@@ -13,7 +25,10 @@ from .json_bridge import ServerState
 
 async def main():
 
-    server_state = ServerState()
+    server_state = open_server_state(os.environ.get('BANK_DATA_DIR', 'data'))
+    if 'BANK_METRICS_PORT' in os.environ:
+        metrics.enable(server_state)
+        metrics.serve(int(os.environ['BANK_METRICS_PORT']))
 
     bot = Bot(BOT_TOKEN)
     dp = Dispatcher()
@@ -36,9 +51,21 @@ async def main():
         types.BotCommand(command = 'show_history', description = 'Доступно для клиента'),
     ])
 
-    await dp.start_polling(bot, server_state=server_state)
+    chats: Dict[UUID, int] = {}
+    """id клиента -> id чата, в котором он авторизовался"""
+
+    async def notify(client, text: str) -> None:
+        if client.id in chats:
+            await bot.send_message(chats[client.id], text)
+
+    maturities = asyncio.create_task(MaturityScheduler(server_state, notify).run_daily())
+    try:
+        await dp.start_polling(bot, server_state=server_state, chats=chats,
+                               commands=AsyncCommands(server_state))
+    finally:
+        maturities.cancel()
+        server_state.journal.close()
 
 
 if __name__ == '__main__':
-    import asyncio
     asyncio.run(main())
@@ -0,0 +1,183 @@
+"""Массовая загрузка исторических транзакций в банк (миграция, тестовые стенды).
+
+Строки читаются из CSV или JSON Lines в формате `export.py`
+(нужны столбцы `id`, `from`, `to`, `amount`, `datetime`, остальные игнорируются),
+поэтому выгрузку можно загрузить обратно. Id и время транзакций сохраняются.
+Транзакция с уже встречавшимся id пропускается: в выгрузке банка перевод между
+его счетами записан дважды, а повторная загрузка файла ничего не дублирует.
+Повторы ищутся внутри пачки и одним запросом к реестру банка на пачку
+(`Ledger.existing`), так что память загрузчика не растёт с размером файла.
+
+В отличие от `Transaction.perform()` по одной транзакции, загрузчик
+    - не вызывает `uuid4()` и `datetime.now()` для каждой транзакции;
+    - по умолчанию не проверяет ограничения счетов и клиентов (`check_permissions=False`),
+      а балансы пересчитывает одним проходом по пачке;
+    - пишет истории и реестры пачками (`core.record_many`),
+      а счётчики `Stats` обновляет один раз на пару счетов и день.
+Журнал и лимиты снятий обновляются так же, как при `perform`.
+Каждая пачка применяется и записывается как одна операция журнала
+(`persistence.Persistence.operation`), поэтому снимок не попадает между
+изменением балансов и записью транзакций в журнал.
+
+С `check_permissions=True` каждая транзакция проверяется по текущим балансам,
+а не прошедшие проверку отклоняются — для этого строки должны идти по времени.
+
+Загрузчик не захватывает блокировки счетов: на время загрузки банк
+не должен обслуживать клиентов.
+
+Использование:
+```python
+report = BulkLoader(bank).load_file('sber.csv')
+```
+или `python -m src.bulk_import --data-dir data --bank Сбер sber.jsonl`"""
+
+import argparse
+import csv
+import json
+import os
+from contextlib import nullcontext
+from datetime import datetime
+from typing import Any, ContextManager, Dict, Iterable, Iterator, List, TextIO
+from uuid import UUID
+
+from .core import (Account, Bank, BoolWithReason, Transaction, count_withdrawal,
+                   record_many, to_timestamp)
+from .export import CHUNK_SIZE, chunks
+
+Row = Dict[str, Any]
+
+
+def read_csv(file: TextIO) -> Iterator[Row]:
+    """Строки CSV-файла с заголовком"""
+    yield from csv.DictReader(file)
+
+
+def read_jsonl(file: TextIO) -> Iterator[Row]:
+    """Объекты JSON Lines (пустые строки пропускаются)"""
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+class BulkLoader:
+    """Загружает транзакции в банк `bank`.
+
+    Счета ищутся в `accounts` (по умолчанию — счета банка; для межбанковских
+    переводов можно передать общий словарь счетов всех банков)."""
+
+    def __init__(self, bank: Bank, *, accounts: Dict[UUID, Account] | None = None,
+                 check_permissions: bool = False, chunk_size: int = CHUNK_SIZE):
+        self.bank = bank
+        self.accounts = accounts if accounts is not None else bank.accounts
+        self.check_permissions = check_permissions
+        self.chunk_size = chunk_size
+        self._by_text: Dict[str, Account] = {}
+
+    def _account(self, text: str) -> Account:
+        """Счёт по строке с id (строки повторяются, поэтому результат кэшируется)"""
+        account = self._by_text.get(text)
+        if account is None:
+            account = self._by_text[text] = self.accounts[UUID(text)]
+        return account
+
+    def _transaction(self, row: Row) -> Transaction:
+        transaction_id = row['id'].replace('-', '')
+        if len(transaction_id) != 32:
+            raise ValueError('Invalid transaction id')
+        transaction = Transaction.__new__(Transaction)
+        transaction.From = self._account(row['from'])
+        transaction.To = self._account(row['to'])
+        transaction.amount = int(row['amount'])
+        transaction._id = int(transaction_id, 16) # pylint: disable=protected-access
+        transaction._timestamp = to_timestamp(datetime.fromisoformat(row['datetime'])) # pylint: disable=protected-access
+        return transaction
+
+    def load(self, rows: Iterable[Row]) -> Dict[str, int]:
+        """Загружает строки пачками по `chunk_size`.
+
+        Возвращает число загруженных транзакций (`loaded`), пропущенных повторов
+        (`duplicates`) и отклонённых строк (`rejected`: неизвестный счёт,
+        ошибка формата или, с `check_permissions`, не прошедшая проверка)."""
+        report = {'loaded': 0, 'duplicates': 0, 'rejected': 0}
+        for chunk in chunks(rows, self.chunk_size):
+            parsed: Dict[int, Transaction] = {}
+            for row in chunk:
+                try:
+                    transaction = self._transaction(row)
+                except (KeyError, TypeError, ValueError):
+                    report['rejected'] += 1
+                    continue
+                if transaction._id in parsed: # pylint: disable=protected-access
+                    report['duplicates'] += 1
+                    continue
+                parsed[transaction._id] = transaction # pylint: disable=protected-access
+            # повторы из прошлых пачек уже записаны в реестр: одна проверка на пачку
+            loaded = self.bank.ledger.existing([transaction.id for transaction in parsed.values()])
+            transactions = [transaction for transaction in parsed.values()
+                            if transaction.id not in loaded]
+            report['duplicates'] += len(parsed) - len(transactions)
+            with self._operation():
+                applied = self._apply(transactions)
+                record_many(applied)
+            report['rejected'] += len(transactions) - len(applied)
+            report['loaded'] += len(applied)
+        return report
+
+    def _operation(self) -> ContextManager:
+        journal = self.bank.journal
+        return nullcontext() if journal is None else journal.operation()
+
+    def _apply(self, transactions: List[Transaction]) -> List[Transaction]:
+        """Меняет балансы и возвращает транзакции, которые удалось применить"""
+        if self.check_permissions:
+            applied = []
+            for transaction in transactions:
+                checks: BoolWithReason = transaction._check_both_sides() # pylint: disable=protected-access
+                if checks:
+                    transaction._apply() # pylint: disable=protected-access
+                    applied.append(transaction)
+            return applied
+
+        deltas: Dict[Account, int] = {}
+        for transaction in transactions:
+            From, To, amount = transaction.From, transaction.To, transaction.amount
+            deltas[From] = deltas.get(From, 0) - amount
+            deltas[To] = deltas.get(To, 0) + amount
+            count_withdrawal(From, To, amount, transaction._timestamp) # pylint: disable=protected-access
+        for account, delta in deltas.items():
+            account.balance += delta
+        return transactions
+
+    def load_file(self, path: str) -> Dict[str, int]:
+        """Загружает CSV (`.csv`) или JSON Lines (остальные расширения)"""
+        with open(path, newline='', encoding='utf-8') as file:
+            rows = read_csv(file) if path.lower().endswith('.csv') else read_jsonl(file)
+            return self.load(rows)
+
+
+def main():
+    # pylint: disable=missing-function-docstring
+    from .persistence import open_server_state # pylint: disable=import-outside-toplevel
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    parser.add_argument('input')
+    parser.add_argument('--data-dir', default=os.environ.get('BANK_DATA_DIR', 'data'))
+    parser.add_argument('--bank', required=True)
+    parser.add_argument('--check-permissions', action='store_true')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    server_state = open_server_state(args.data_dir)
+    try:
+        accounts = {account_id: account for bank in server_state.banks.values()
+                    for account_id, account in bank.accounts.items()}
+        loader = BulkLoader(server_state.banks[args.bank], accounts=accounts,
+                            check_permissions=args.check_permissions,
+                            chunk_size=args.chunk_size)
+        print(loader.load_file(args.input))
+    finally:
+        server_state.journal.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+"""Межбанковский клиринг с неттингом.
+
+Без клиринга перевод в другой банк (`ClientFacade.transfer(..., to_bank=...)`)
+сразу проводится как одна межбанковская транзакция. С клирингом
+(`ClearingHouse.attach(bank, ...)`) перевод из банка X в банк Y делится на части:
+    1. при отправке — списание со счёта клиента на корреспондентский счёт банка X
+       для банка Y (`Bank.service_account('clearing <id Y>')`); тут проверяются все
+       ограничения отправителя, а сам перевод встаёт в очередь пары (X, Y);
+    2. при расчёте (`settle`, раз в `window` секунд) — зачисление получателю
+       с корреспондентского счёта банка Y для банка X;
+    3. и одна межбанковская транзакция между корреспондентскими счетами X и Y
+       на разницу переводов X -> Y и Y -> X (неттинг).
+После расчёта корреспондентские счета пары снова нулевые, а межбанковских
+транзакций — по одной на пару банков за окно, сколько бы переводов ни было.
+
+Если зачислить не удалось (получатель отказал в проверке),
+деньги возвращаются отправителю с корреспондентского счёта.
+
+Перевод, ещё стоящий в очереди, можно отменить (`ClearingHouse.cancel`):
+он убирается из очереди, а списание возвращается отправителю.
+Зачисленный перевод и межбанковские транзакции отменить нельзя.
+
+Очередь переживает перезапуск: постановка в очередь и выход из неё сообщаются
+хранилищу и журналу банка отправителя (`transfer_queued`, `transfer_dequeued`)
+в той же операции, что и транзакция списания или зачисления.
+После восстановления очередь лежит в `ServerState.clearing`.
+
+Использование:
+```python
+clearing = server_state.clearing.attach(*server_state.banks.values())
+asyncio.create_task(clearing.run())
+```"""
+
+import asyncio
+from contextlib import nullcontext
+from operator import attrgetter
+from threading import Lock
+from typing import Dict, List, Tuple
+from uuid import UUID, uuid5
+
+from .core import Account, Bank, BoolWithReason, Transaction, locked
+
+
+_by_id = attrgetter('id')
+
+Transfer = Tuple[Account, Account, int]
+"""Перевод в очереди: (счёт отправителя, счёт получателя, сумма)"""
+
+
+def correspondent(bank: Bank, other: Bank) -> Account:
+    """Корреспондентский счёт банка `bank` для расчётов с банком `other`"""
+    return bank.service_account(f'clearing {other.id}')
+
+
+def is_correspondent(account: Account) -> bool:
+    """Является ли счёт корреспондентским (см. `correspondent`)"""
+    purpose = account.client.surname
+    return purpose.startswith('clearing ') \
+        and account.id == uuid5(account.client.bank.id, purpose)
+
+
+class ClearingHouse:
+    """Очередь межбанковских переводов и их расчёт с неттингом
+    по парам (банк отправителя, банк получателя)"""
+
+    def __init__(self, window: float = 60.0):
+        self.window = window
+        self._queue: Dict[UUID, Transfer] = {} # id списания -> перевод, в порядке постановки
+        self._lock = Lock()
+
+    def attach(self, *banks: Bank) -> "ClearingHouse":
+        """Направляет межбанковские переводы клиентов банков через эту клиринговую палату"""
+        for bank in banks:
+            bank.clearing = self
+        return self
+
+    def submit(self, transaction: Transaction) -> BoolWithReason:
+        """Списывает перевод с отправителя на корреспондентский счёт
+        и ставит зачисление получателю в очередь"""
+        debit = self.debit(transaction)
+        if isinstance(debit, BoolWithReason):
+            return debit
+        source = transaction.From.client.bank
+        journal = source.journal
+        with nullcontext() if journal is None else journal.operation():
+            result = debit.perform() if source.engine is None else source.engine.perform(debit)
+            if result:
+                self.enqueue(transaction)
+        return result
+
+    @staticmethod
+    def debit(transaction: Transaction) -> Transaction | BoolWithReason:
+        """Ещё не проведённое списание перевода на корреспондентский счёт
+        (или причина, по которой перевод не может идти через клиринг).
+        У списания тот же id, что и у перевода: по нему перевод ищется в очереди."""
+        From, To, amount = transaction.From, transaction.To, transaction.amount
+        source, destination = From.client.bank, To.client.bank
+        if source is destination:
+            return BoolWithReason("Clearing is only for transfers between banks\n")
+        if amount <= 0:
+            return BoolWithReason("Amount must be positive\n")
+        debit = Transaction(From, correspondent(source, destination), amount)
+        debit.id = transaction.id
+        return debit
+
+    def enqueue(self, transaction: Transaction) -> None:
+        """Ставит в очередь зачисление перевода, списание которого (`debit`) уже проведено"""
+        self._put(transaction.id, (transaction.From, transaction.To, transaction.amount))
+        bank = transaction.From.client.bank
+        bank.storage.transfer_queued(transaction)
+        if bank.journal is not None:
+            bank.journal.transfer_queued(transaction)
+
+    def cancel(self, transaction: Transaction) -> BoolWithReason:
+        """Отменяет транзакцию (`Transaction.cancel`), если она не относится к клирингу.
+        Списание перевода, который ещё стоит в очереди, убирается из очереди
+        и возвращается отправителю; остальные транзакции с корреспондентскими счетами
+        (зачисления, возвраты, межбанковские) отменить нельзя."""
+        From, To = transaction.From, transaction.To
+        if not (is_correspondent(From) or is_correspondent(To)):
+            return transaction.cancel()
+        with locked(From, To):
+            if self._take(transaction.id) is None:
+                return BoolWithReason("Can't cancel a settled clearing transfer\n")
+            self._dequeued(From.client.bank, transaction.id)
+            reverse = Transaction(From, To, -transaction.amount)
+            return reverse._perform_without_checking_permissions() # pylint: disable=protected-access
+
+    def pending(self) -> int:
+        """Число переводов, ожидающих расчёта"""
+        return len(self._queue)
+
+    def transfers(self) -> List[Tuple[UUID, Transfer]]:
+        """Переводы в очереди: (id списания, перевод) — для снимков состояния"""
+        with self._lock:
+            return list(self._queue.items())
+
+    def settle(self) -> Dict[str, int]:
+        """Зачисляет переводы из очереди и проводит по одной межбанковской транзакции
+        на пару банков. Возвращает число зачисленных (`transfers`) и возвращённых (`returned`)
+        переводов, число межбанковских транзакций (`settlements`),
+        сумму переводов (`gross`) и сумму межбанковских транзакций (`net`).
+
+        Перевод убирается из очереди в той же операции, что и его зачисление,
+        поэтому снимок посреди расчёта не потеряет ещё не зачисленные переводы."""
+        queues: Dict[Tuple[Bank, Bank], List[Tuple[UUID, Transfer]]] = {}
+        for transfer_id, (From, To, amount) in self.transfers():
+            queues.setdefault((From.client.bank, To.client.bank), []).append(
+                (transfer_id, (From, To, amount)))
+        summary = {'transfers': 0, 'returned': 0, 'settlements': 0, 'gross': 0, 'net': 0}
+
+        for first, second in {tuple(sorted(pair, key=_by_id)) for pair in queues}:
+            net = self._credit(first, second, queues.get((first, second), []), summary) \
+                - self._credit(second, first, queues.get((second, first), []), summary)
+            if net:
+                From, To = correspondent(first, second), correspondent(second, first)
+                settlement = Transaction(From, To, net)
+                with locked(From, To):
+                    settlement._perform_without_checking_permissions() # pylint: disable=protected-access
+                summary['settlements'] += 1
+                summary['net'] += abs(net)
+        return summary
+
+    def _credit(self, source: Bank, destination: Bank,
+                transfers: List[Tuple[UUID, Transfer]], summary: Dict[str, int]) -> int:
+        """Зачисляет переводы `source -> destination` получателям
+        и возвращает зачисленную сумму"""
+        incoming = correspondent(destination, source)
+        outgoing = correspondent(source, destination)
+        credited = 0
+        for transfer_id, (From, To, amount) in transfers:
+            with locked(incoming, To, outgoing, From):
+                if self._take(transfer_id) is None:
+                    continue # перевод отменили, пока шёл расчёт
+                self._dequeued(source, transfer_id)
+                # проверяется только получатель: корреспондентский счёт — служебный
+                credit = Transaction(incoming, To, amount)
+                result = credit.mirror.check_permissions()
+                if result:
+                    credit._perform_without_checking_permissions() # pylint: disable=protected-access
+                else:
+                    refund = Transaction(outgoing, From, amount)
+                    refund._perform_without_checking_permissions() # pylint: disable=protected-access
+            if result:
+                credited += amount
+                summary['transfers'] += 1
+                summary['gross'] += amount
+            else:
+                summary['returned'] += 1
+        return credited
+
+    def _put(self, transfer_id: UUID, transfer: Transfer) -> None:
+        with self._lock:
+            self._queue[transfer_id] = transfer
+
+    def _take(self, transfer_id: UUID) -> Transfer | None:
+        with self._lock:
+            return self._queue.pop(transfer_id, None)
+
+    @staticmethod
+    def _dequeued(bank: Bank, transfer_id: UUID) -> None:
+        bank.storage.transfer_dequeued(transfer_id)
+        if bank.journal is not None:
+            bank.journal.transfer_dequeued(transfer_id)
+
+    async def run(self) -> None:
+        """Проводит расчёт каждые `window` секунд (в пуле потоков)"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.window)
+            await loop.run_in_executor(None, self.settle)
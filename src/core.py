@@ -1,8 +1,16 @@
 """Модуль с основными классами банка."""
 
-from typing import Dict, List, Type, Any
-from uuid import uuid4, UUID
-from datetime import date, datetime
+from array import array
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager, nullcontext
+from heapq import heappop, heappush
+from itertools import count
+from operator import attrgetter
+from threading import Lock, RLock
+from typing import Callable, Dict, Iterator, List, NamedTuple, Set, Tuple, Type, Any, cast
+from uuid import uuid4, uuid5, UUID
+from datetime import date, datetime, timedelta
 
 
 class BoolWithReason:
@@ -16,13 +24,21 @@ class BoolWithReason:
     Позволяет объединять результаты проверок с помощью оператора &.
 
     Этот класс нужен, чтобы проверять валидность операции
-    на уровне счётов и клиентов, а также чтобы сообщать результаты клиенту."""
+    на уровне счётов и клиентов, а также чтобы сообщать результаты клиенту.
 
-    def __init__(self, reason: str = ""):
+    В `codes` лежат машиночитаемые коды причин (см. `PermissionFailure`),
+    если их сообщила проверка."""
+
+    def __init__(self, reason: str = "", codes: Tuple[str, ...] = ()):
         self.reason = reason
+        self.codes = codes
 
     def __and__(self, other: "BoolWithReason") -> "BoolWithReason":
-        return BoolWithReason(self.reason + other.reason)
+        if not other.reason:
+            return self
+        if not self.reason:
+            return other
+        return BoolWithReason(self.reason + other.reason, self.codes + other.codes)
 
     def __bool__(self) -> bool:
         return self.reason == ""
@@ -34,6 +50,48 @@ class BoolWithReason:
             return f'Error: {self.reason}'
 
 
+_OK = BoolWithReason()
+"""Общий успешный результат проверок (чтобы не создавать новый объект на каждую проверку)"""
+
+
+class PermissionFailure(NamedTuple):
+    """Причина, по которой правило проверки (`permission_plan`) отклонило перевод"""
+    code: str
+    reason: str
+
+
+NOT_ENOUGH_MONEY = PermissionFailure('not_enough_money', "Not enough money\n")
+BEFORE_END_DATE = PermissionFailure('before_end_date', "Can't withdraw money before end date\n")
+UNVERIFIED_CLIENT = PermissionFailure('unverified_client',
+                                      "Client doesn't have passport or address\n")
+
+
+_by_id = attrgetter('id')
+_by_timestamp = attrgetter('_timestamp')
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def to_timestamp(moment: datetime) -> int:
+    """Переводит datetime в число микросекунд от 1970-01-01.
+    Время в системе местное и без часового пояса, поэтому время с часовым поясом
+    сначала переводится в местное."""
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    return (moment - _EPOCH) // _MICROSECOND
+
+
+def from_timestamp(timestamp: int) -> datetime:
+    """Обратное преобразование к `to_timestamp`"""
+    return _EPOCH + timedelta(microseconds=timestamp)
+
+
+perform_observer: Any = None
+"""Если не None, `Transaction.perform` передаёт выполнение в `perform_observer.observe_perform`
+(так `metrics.enable()` замеряет время проверок и выполнения)"""
+
+
 class Transaction:
     """Структура банковской операции, содержащая поля:
         - From: Account - счёт, с которого списывается деньги 
@@ -48,23 +106,47 @@ class Transaction:
         Эти два представления эквивалентны.
         Второе представление можно получить как `transaction.mirror`.
 
-        Чтобы выполнить транзакцию, нужно вызвать метод `perform`."""
+        Чтобы выполнить транзакцию, нужно вызвать метод `perform`.
+
+        Транзакций в системе много, поэтому объект компактный: без __dict__,
+        id хранится как 128-битное число, а время — как число микросекунд от 1970 года.
+        Свойства `id` и `datetime` собирают UUID и datetime из них при обращении."""
+
+    __slots__ = ('From', 'To', 'amount', '_timestamp', '_id')
+
     def __init__(self, From: "Account", To: "Account", amount: int):
         self.From = From
         self.To = To
         self.amount = amount
-        self.datetime = datetime.now()
-        self.id = uuid4()
+        self._timestamp = to_timestamp(datetime.now())
+        self._id = uuid4().int
+
+    @property
+    def datetime(self) -> datetime:
+        """Момент проведения транзакции"""
+        return from_timestamp(self._timestamp)
+
+    @datetime.setter
+    def datetime(self, value: datetime) -> None:
+        self._timestamp = to_timestamp(value)
+
+    @property
+    def id(self) -> UUID:
+        """Идентификатор транзакции, общий с её `mirror`"""
+        return UUID(int=self._id)
+
+    @id.setter
+    def id(self, value: UUID) -> None:
+        self._id = value.int
 
     @property
     def mirror(self) -> "Transaction":
         """`Transaction(account_A, account_B, n).mirror == Transaction(account_B, account_A, -n)`
 
-        Это экивалентная транзакция, записанная с точки зрения второй стороны."""
-        mirror = Transaction(self.To, self.From, -self.amount)
-        mirror.datetime = self.datetime
-        mirror.id = self.id
-        return mirror
+        Это экивалентная транзакция, записанная с точки зрения второй стороны.
+        Данные не копируются: возвращается представление `TransactionMirror`,
+        которое читает поля исходной транзакции."""
+        return TransactionMirror(self)
 
     def check_permissions(self) -> "BoolWithReason":
         """Проверяет, есть ли ограничения на вывод средств у счёта и у клиента.
@@ -76,38 +158,82 @@ class Transaction:
             transaction.perform()
         ```
         Вторая проверка нужна, если у операции отрицательный amount.
+
+        Правила счёта, клиента и лимиты банка берутся из готового плана
+        для типа счёта `From` и статуса клиента (см. `permission_plan`).
         """
-        return self.From.check_withdraw_permissions(self) \
-            & self.From.client.check_withdraw_permissions(self)
+        return check_transfer(self.From, self.To, self.amount, self._timestamp)
 
     def perform(self) -> "BoolWithReason":
         """Проверяет допустимость транзакции и выполняет её.
-        Записывает транзакцию в историю обоих счётов."""
-        checks = self.check_permissions() & self.mirror.check_permissions()
-        if checks:
-            return self._perform_without_checking_permissions()
-        else:
-            return checks
+        Записывает транзакцию в историю обоих счётов и в реестр банка (`Bank.ledger`).
+        Во всех местах хранится один и тот же объект.
+
+        Проверка и выполнение атомарны: на это время захватываются блокировки обоих счетов,
+        поэтому `perform` можно вызывать из разных потоков."""
+        with locked(self.From, self.To):
+            if perform_observer is not None:
+                return perform_observer.observe_perform(self)
+            checks = self._check_both_sides()
+            if checks:
+                return self._perform_without_checking_permissions()
+            else:
+                return checks
+
+    def _check_both_sides(self) -> "BoolWithReason":
+        """Проверяет допустимость транзакции для обоих счетов
+        (вторая сторона проверяется как `mirror`, но без создания представления)"""
+        From, To, amount, timestamp = self.From, self.To, self.amount, self._timestamp
+        return check_transfer(From, To, amount, timestamp) \
+            & check_transfer(To, From, -amount, timestamp)
 
     def _perform_without_checking_permissions(self) -> "BoolWithReason":
+        self._apply()
+        self._record()
+        return BoolWithReason()
+
+    def _apply(self) -> None:
+        """Меняет балансы счетов и учитывает перевод в лимитах снятий"""
         self.From.balance -= self.amount
         self.To.balance += self.amount
-
+        count_withdrawal(self.From, self.To, self.amount, self._timestamp)
+
+    def _revert(self) -> None:
+        """Откатывает `_apply` (для ещё не записанной транзакции)"""
+        self.From.balance += self.amount
+        self.To.balance -= self.amount
+        count_withdrawal(self.From, self.To, self.amount, self._timestamp, -1)
+
+    def _record(self) -> None:
+        """Записывает уже проведённую транзакцию в истории, реестры, журналы банков
+        и счётчики (`Stats`) счетов и клиентов"""
+        # счётчики обновляются раньше историй: хранилище, которое сбрасывает буфер
+        # при записи в историю (`SQLiteStorage`), сохраняет их вместе с транзакцией
+        record_stats(self.From, self.To, self.amount, self._timestamp)
         self.To.history.save(self)
-        self.From.history.save(self.mirror)
-        return BoolWithReason()
+        self.From.history.save(self)
+
+        from_bank, to_bank = self.From.client.bank, self.To.client.bank
+        from_bank.ledger.save(self)
+        if from_bank.journal is not None:
+            from_bank.journal.transaction_recorded(self)
+        if to_bank is not from_bank:
+            to_bank.ledger.save(self)
+            if to_bank.journal is not None and to_bank.journal is not from_bank.journal:
+                to_bank.journal.transaction_recorded(self)
 
     def cancel(self) -> "BoolWithReason":
         """Безусловно отменяет транзакцию.
         Даже если у бывшего получателя, например, окажется отрицательный баланс.
         Записывает отменяющую транзакцию в списки транзакций."""
-        return Transaction(self.From, self.To, -self.amount)._perform_without_checking_permissions() # pylint: disable=protected-access
+        with locked(self.From, self.To):
+            return Transaction(self.From, self.To, -self.amount)._perform_without_checking_permissions() # pylint: disable=protected-access
 
     def __hash__(self) -> int:
-        return hash(self.id)
+        return hash(self._id)
 
     def __lt__(self, other: "Transaction") -> bool:
-        return self.datetime.__lt__(other.datetime)
+        return self._timestamp < other._timestamp
 
     def __repr__(self) -> str:
         return f'{str(self.From)} -> {str(self.To)}: {self.amount} at {self.datetime}'
@@ -116,8 +242,8 @@ class Transaction:
         if not isinstance(other, Transaction):
             return False
 
-        return self.id == other.id \
-            and self.datetime == other.datetime \
+        return self._id == other._id \
+            and self._timestamp == other._timestamp \
             and self.From.id == other.From.id \
             and self.To.id == other.To.id \
             and self.amount == other.amount
@@ -133,28 +259,740 @@ class Transaction:
         }
 
 
+class TransactionMirror(Transaction):
+    """Представление транзакции с точки зрения второй стороны:
+    From и To поменяны местами, amount с обратным знаком.
+    Хранит только ссылку на исходную транзакцию, изменения полей передаются в неё."""
+
+    __slots__ = ('_original',)
+
+    def __init__(self, original: Transaction): # pylint: disable=super-init-not-called
+        self._original = original
+
+    @property
+    def From(self) -> "Account": # type: ignore[override]
+        return self._original.To
+
+    @From.setter
+    def From(self, value: "Account") -> None:
+        self._original.To = value
+
+    @property
+    def To(self) -> "Account": # type: ignore[override]
+        return self._original.From
+
+    @To.setter
+    def To(self, value: "Account") -> None:
+        self._original.From = value
+
+    @property
+    def amount(self) -> int: # type: ignore[override]
+        return -self._original.amount
+
+    @amount.setter
+    def amount(self, value: int) -> None:
+        self._original.amount = -value
+
+    @property
+    def _timestamp(self) -> int: # type: ignore[override]
+        return self._original._timestamp # pylint: disable=protected-access
+
+    @_timestamp.setter
+    def _timestamp(self, value: int) -> None:
+        self._original._timestamp = value # pylint: disable=protected-access
+
+    @property
+    def _id(self) -> int: # type: ignore[override]
+        return self._original._id # pylint: disable=protected-access
+
+    @_id.setter
+    def _id(self, value: int) -> None:
+        self._original._id = value # pylint: disable=protected-access
+
+    @property
+    def mirror(self) -> Transaction:
+        return self._original
+
+    def _record(self) -> None:
+        # Это та же операция, поэтому в историю и реестр пишется исходный объект
+        self._original._record() # pylint: disable=protected-access
+
+
 class TransactionsHistory:
     """Класс для хранения истории транзакций, играющий роль БД.
     Есть у каждого счёта.
 
+    Транзакции хранятся по столбцам, упорядоченным по времени:
+    массив времён (`array` из int64, микросекунды) и параллельный список транзакций.
+    Порядок поддерживается при каждом `save`, поэтому чтение не требует сортировки.
+    Обычно транзакции приходят в хронологическом порядке и просто дописываются в конец,
+    иначе вставляются на своё место бинарным поиском по массиву времён.
+    Параллельно хранится словарь id -> транзакция для поиска по идентификатору.
+
+    Для расчёта прошлых балансов (`change_after`, `Account.balance_at`) хранятся
+    контрольные точки: суммы изменений баланса за каждые `CHECKPOINT_EVERY` первых транзакций.
+    Они дописываются лениво при запросе, а вставка в середину отбрасывает точки после неё,
+    поэтому запрос стоит O(log n + CHECKPOINT_EVERY) (амортизированно).
+
+    История счёта хранит ссылки на те же объекты транзакций, что и `Bank.ledger`
+    (одна транзакция на перевод, без копии для второй стороны).
+    Наружу транзакции отдаются с точки зрения счёта-владельца:
+    если он отправитель, то возвращается `transaction.mirror`.
+
     Возможно, в будущем будет заменен на настоящую БД. 
     Остальные классы менять при этом не придётся."""
 
+    CHECKPOINT_EVERY = 64
+
+    def __init__(self, account: "Account | None" = None):
+        self._account = account
+        self._transactions: Dict[int, Transaction] = {}
+        self._timestamps = array('q')
+        self._ordered: List[Transaction] = []
+        self._checkpoints = array('q')
+        self._total_change = 0
+
+    def save(self, transaction: Transaction) -> None:
+        """Добавляет транзакцию в список транзакций.
+        Если транзакция уже есть в списке, заменяет её."""
+        transaction_id, timestamp = transaction._id, transaction._timestamp # pylint: disable=protected-access
+        if transaction_id in self._transactions:
+            self._remove(self._transactions[transaction_id])
+        self._transactions[transaction_id] = transaction
+        self._total_change += self._change(transaction)
+
+        if not self._timestamps or self._timestamps[-1] <= timestamp:
+            self._timestamps.append(timestamp)
+            self._ordered.append(transaction)
+        else:
+            i = bisect_right(self._timestamps, timestamp)
+            self._timestamps.insert(i, timestamp)
+            self._ordered.insert(i, transaction)
+            del self._checkpoints[i // self.CHECKPOINT_EVERY:]
+
+    def save_many(self, transactions: List[Transaction]) -> None:
+        """Добавляет пачку транзакций (например, при массовой загрузке).
+        Если все они новые и не раньше последней в истории, пачка дописывается
+        в конец столбцов целиком, иначе транзакции добавляются по одной через `save`."""
+        ordered = sorted(transactions, key=_by_timestamp)
+        if not ordered:
+            return
+        if (self._timestamps and self._timestamps[-1] > ordered[0]._timestamp) \
+                or any(t._id in self._transactions for t in ordered): # pylint: disable=protected-access
+            for transaction in ordered:
+                self.save(transaction)
+            return
+        self._transactions.update((t._id, t) for t in ordered) # pylint: disable=protected-access
+        self._total_change += sum(map(self._change, ordered))
+        self._timestamps.extend(t._timestamp for t in ordered) # pylint: disable=protected-access
+        self._ordered.extend(ordered)
+
+    def _remove(self, transaction: Transaction) -> None:
+        i = bisect_left(self._timestamps, transaction._timestamp) # pylint: disable=protected-access
+        while self._ordered[i] is not transaction:
+            i += 1
+        del self._timestamps[i]
+        del self._ordered[i]
+        del self._checkpoints[i // self.CHECKPOINT_EVERY:]
+        self._total_change -= self._change(transaction)
+
+    def _change(self, transaction: Transaction) -> int:
+        """Изменение баланса владельца истории от транзакции"""
+        if self._account is None:
+            return transaction.amount
+        change = 0
+        if transaction.To is self._account:
+            change += transaction.amount
+        if transaction.From is self._account:
+            change -= transaction.amount
+        return change
+
+    def change_after(self, moment: datetime) -> int:
+        """На сколько изменился баланс счёта-владельца из-за транзакций позже `moment`"""
+        position = bisect_right(self._timestamps, to_timestamp(moment))
+        every = self.CHECKPOINT_EVERY
+        checkpoint = position // every
+        while len(self._checkpoints) < checkpoint:
+            start = len(self._checkpoints) * every
+            previous = self._checkpoints[-1] if self._checkpoints else 0
+            self._checkpoints.append(
+                previous + sum(map(self._change, self._ordered[start:start + every])))
+        before = self._checkpoints[checkpoint - 1] if checkpoint else 0
+        before += sum(map(self._change, self._ordered[checkpoint * every:position]))
+        return self._total_change - before
+
+    def see(self, *, after: datetime | None = None, before: datetime | None = None,
+            limit: int | None = None, cursor: str | None = None) -> List["Transaction"]:
+        """Возвращает список транзакций, от самых старых к самым новым.
+
+        Необязательные параметры:
+            - after, before: вернуть только транзакции строго между этими моментами
+            - limit: вернуть не больше `limit` транзакций
+            - cursor: продолжить с места, где закончилась предыдущая страница
+                (см. `TransactionsHistory.cursor`)
+
+        Границы ищутся бинарным поиском, поэтому страница из k транзакций
+        стоит O(log n + k)."""
+        start, end = 0, len(self._ordered)
+        if after is not None:
+            start = bisect_right(self._timestamps, to_timestamp(after))
+        if cursor is not None:
+            start = max(start, self._position_after(cursor))
+        if before is not None:
+            end = bisect_left(self._timestamps, to_timestamp(before))
+        if limit is not None:
+            if limit < 0:
+                raise ValueError("Limit must be non-negative")
+            end = min(end, start + limit)
+        return [self._oriented(transaction) for transaction in self._ordered[start:end]]
+
+    def _oriented(self, transaction: Transaction) -> Transaction:
+        if self._account is None or transaction.To is self._account:
+            return transaction
+        return transaction.mirror
+
+    @staticmethod
+    def cursor(transaction: Transaction) -> str:
+        """Непрозрачный курсор, указывающий на место сразу после транзакции.
+        Его можно передать в `see(cursor=...)`, чтобы получить следующую страницу."""
+        raw = f'{transaction._timestamp}|{transaction._id:x}' # pylint: disable=protected-access
+        return urlsafe_b64encode(raw.encode()).decode()
+
+    @staticmethod
+    def _decode_cursor(cursor: str) -> Tuple[int, int]:
+        """Возвращает (время в микросекундах, id) транзакции, на которую указывает курсор"""
+        try:
+            raw_timestamp, raw_id = urlsafe_b64decode(cursor.encode()).decode().split('|')
+            return int(raw_timestamp), int(raw_id, 16)
+        except (ValueError, UnicodeDecodeError) as e:
+            raise ValueError("Invalid cursor") from e
+
+    def _position_after(self, cursor: str) -> int:
+        timestamp, transaction_id = self._decode_cursor(cursor)
+        i = bisect_left(self._timestamps, timestamp)
+        while i < len(self._timestamps) and self._timestamps[i] == timestamp:
+            i += 1
+            if self._ordered[i - 1]._id == transaction_id: # pylint: disable=protected-access
+                break
+        return i
+
+    def __getitem__(self, transaction_id: UUID) -> Transaction:
+        return self._oriented(self._transactions[transaction_id.int])
+
+    def __len__(self) -> int:
+        return len(self._ordered)
+
+
+class Ledger:
+    """Реестр всех транзакций банка с поиском по id за O(1).
+
+    Каждая транзакция хранится один раз; истории счетов ссылаются на те же объекты.
+    Межбанковский перевод попадает в реестры обоих банков."""
+
     def __init__(self):
         self._transactions: Dict[UUID, Transaction] = {}
 
     def save(self, transaction: Transaction) -> None:
-        """Добавляет транзакцию в список транзакций.
-        Если транзакция уже есть в списке, ничего не делает."""
+        """Добавляет транзакцию в реестр."""
         self._transactions[transaction.id] = transaction
 
-    def see(self) -> List["Transaction"]:
-        """Возвращает список транзакций, от самых старых к самым новым"""
-        return sorted(self._transactions.values())
+    def save_many(self, transactions: List[Transaction]) -> None:
+        """Добавляет пачку транзакций в реестр."""
+        for transaction in transactions:
+            self.save(transaction)
+
+    def get(self, transaction_id: UUID) -> Transaction | None:
+        """Возвращает транзакцию по id или None, если её нет"""
+        return self._transactions.get(transaction_id)
+
+    def existing(self, transaction_ids: List[UUID]) -> Set[UUID]:
+        """Те из `transaction_ids`, что уже есть в реестре (проверка пачкой)"""
+        return {transaction_id for transaction_id in transaction_ids
+                if transaction_id in self._transactions}
 
     def __getitem__(self, transaction_id: UUID) -> Transaction:
         return self._transactions[transaction_id]
 
+    def __contains__(self, transaction_id: object) -> bool:
+        return transaction_id in self._transactions
+
+    def __iter__(self) -> Iterator[Transaction]:
+        return iter(self._transactions.values())
+
+    def __len__(self) -> int:
+        return len(self._transactions)
+
+
+def record_stats(From: "Account", To: "Account", amount: int, timestamp: int,
+                 number: int = 1) -> None:
+    """Учитывает `number` транзакций `From -> To` на общую сумму `amount`
+    в счётчиках счетов и клиентов (см. `Stats.add`). Переводы между своими счетами
+    считаются у клиента одной операцией (и списанием, и зачислением)."""
+    if amount < 0:
+        From, To, amount = To, From, -amount
+    if From is To:
+        From.stats.add(amount, amount, timestamp, number)
+    else:
+        From.stats.add(amount, 0, timestamp, number)
+        To.stats.add(0, amount, timestamp, number)
+    from_client, to_client = From.client, To.client
+    if from_client is to_client:
+        from_client.stats.add(amount, amount, timestamp, number)
+    else:
+        from_client.stats.add(amount, 0, timestamp, number)
+        to_client.stats.add(0, amount, timestamp, number)
+
+
+def record_many(transactions: List["Transaction"]) -> None:
+    """Записывает пачку уже проведённых транзакций в истории, реестры, журналы
+    и счётчики (как `Transaction._record` для каждой, но истории и реестры —
+    через `save_many`, а `Stats` — один раз на пару счетов и день)"""
+    histories: Dict["Account", List[Transaction]] = {}
+    ledgers: Dict["Bank", List[Transaction]] = {}
+    stats: Dict[Tuple["Account", "Account", bool, int], List[int]] = {}
+    for transaction in transactions:
+        From, To, amount = transaction.From, transaction.To, transaction.amount
+        timestamp = transaction._timestamp # pylint: disable=protected-access
+        histories.setdefault(From, []).append(transaction)
+        if To is not From:
+            histories.setdefault(To, []).append(transaction)
+        group = stats.get((From, To, amount < 0, timestamp // DAY))
+        if group is None:
+            stats[(From, To, amount < 0, timestamp // DAY)] = [1, amount, timestamp]
+        else:
+            group[0] += 1
+            group[1] += amount
+            group[2] = max(group[2], timestamp)
+        from_bank, to_bank = From.client.bank, To.client.bank
+        ledgers.setdefault(from_bank, []).append(transaction)
+        if from_bank.journal is not None:
+            from_bank.journal.transaction_recorded(transaction)
+        if to_bank is not from_bank:
+            ledgers.setdefault(to_bank, []).append(transaction)
+            if to_bank.journal is not None and to_bank.journal is not from_bank.journal:
+                to_bank.journal.transaction_recorded(transaction)
+    for (From, To, _, _), (number, amount, last) in stats.items():
+        record_stats(From, To, amount, last, number)
+    for account, account_transactions in histories.items():
+        account.history.save_many(account_transactions)
+    for bank, bank_transactions in ledgers.items():
+        bank.ledger.save_many(bank_transactions)
+
+class MaturityIndex:
+    """Очередь вкладов (`DepositAccount`) банка по дате окончания (куча).
+
+    Пополняется при добавлении счёта в банк, в том числе при восстановлении из хранилища.
+    `pop_matured` достаёт вклады, срок которых истёк, за O(k log n), где k — их число,
+    без просмотра всех счетов банка."""
+
+    def __init__(self):
+        self._heap: List[Tuple[date, int, "DepositAccount"]] = []
+        self._order = count()
+        self._lock = Lock()
+
+    def add(self, account: "DepositAccount") -> None:
+        """Добавляет вклад в очередь"""
+        with self._lock:
+            heappush(self._heap, (account.end_date, next(self._order), account))
+
+    def pop_matured(self, today: date, limit: int | None = None) -> List["DepositAccount"]:
+        """Убирает из очереди и возвращает вклады с `end_date <= today`
+        (не больше `limit` штук, самые ранние первыми)"""
+        matured: List["DepositAccount"] = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= today \
+                    and (limit is None or len(matured) < limit):
+                matured.append(heappop(self._heap)[2])
+        return matured
+
+    def next_date(self) -> date | None:
+        """Ближайшая дата окончания вклада или None, если вкладов нет"""
+        return self._heap[0][0] if self._heap else None
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+
+DAY = 24 * 3600 * 10**6
+"""Сутки в микросекундах (единицах `Transaction._timestamp`)"""
+
+
+class Stats:
+    """Счётчики операций счёта или клиента, которые обновляются при записи каждой транзакции
+    (`Transaction._record`), поэтому сводка не требует просмотра истории:
+        - count: число транзакций
+        - debit / credit: сколько всего списано / зачислено
+        - last_activity: время последней транзакции или None
+        - суммы списаний и зачислений по дням за последние `DAYS_KEPT` дней (`day`)
+
+    Транзакция с отрицательной суммой учитывается как встречная с положительной
+    (`Transaction(A, B, -n)` — это `Transaction(B, A, n)`), поэтому отмена списания
+    считается зачислением, а не уменьшает сумму списаний."""
+
+    __slots__ = ('count', 'debit', 'credit', '_last_activity', '_days', '_lock')
+
+    DAYS_KEPT = 32
+
+    def __init__(self):
+        self.count = 0
+        self.debit = 0
+        self.credit = 0
+        self._last_activity: int | None = None
+        self._days: Dict[int, List[int]] = {}
+        self._lock = Lock()
+
+    def add(self, debit: int, credit: int, timestamp: int, number: int = 1) -> None:
+        """Учитывает `number` транзакций со списанием `debit` и зачислением `credit`"""
+        day = timestamp // DAY
+        with self._lock:
+            self.count += number
+            self.debit += debit
+            self.credit += credit
+            if self._last_activity is None or timestamp > self._last_activity:
+                self._last_activity = timestamp
+            totals = self._days.get(day)
+            if totals is None:
+                totals = self._days[day] = [0, 0]
+                if len(self._days) > self.DAYS_KEPT:
+                    newest = max(self._days)
+                    for old in [d for d in self._days if d <= newest - self.DAYS_KEPT]:
+                        del self._days[old]
+            totals[0] += debit
+            totals[1] += credit
+
+    @property
+    def last_activity(self) -> datetime | None:
+        """Время последней транзакции"""
+        return None if self._last_activity is None else from_timestamp(self._last_activity)
+
+    def day(self, moment: date) -> Tuple[int, int]:
+        """Суммы списаний и зачислений за день (0, 0 — если операций не было или день слишком давний)"""
+        totals = self._days.get((moment - _EPOCH.date()).days)
+        return (0, 0) if totals is None else (totals[0], totals[1])
+
+    def info(self) -> Dict[str, Any]:
+        """Сводка в виде словаря (для JSON-ответов)"""
+        today_debit, today_credit = self.day(date.today())
+        return {
+            'count': self.count,
+            'debit': self.debit,
+            'credit': self.credit,
+            'last_activity': self.last_activity,
+            'today_debit': today_debit,
+            'today_credit': today_credit,
+        }
+
+    def dump(self) -> Dict[str, Any]:
+        """Все счётчики в виде, пригодном для JSON (для хранилищ, см. `load`)"""
+        with self._lock:
+            return {'count': self.count, 'debit': self.debit, 'credit': self.credit,
+                    'last_activity': self._last_activity,
+                    'days': [[day, debit, credit]
+                             for day, (debit, credit) in self._days.items()]}
+
+    def load(self, data: Dict[str, Any]) -> None:
+        """Заменяет счётчики сохранёнными через `dump`"""
+        with self._lock:
+            self.count, self.debit, self.credit = data['count'], data['debit'], data['credit']
+            self._last_activity = data['last_activity']
+            self._days = {day: [debit, credit] for day, debit, credit in data['days']}
+
+
+class SlidingWindow:
+    """Сумма значений за последние `window` микросекунд.
+
+    Окно разбито на `buckets` корзин одинаковой ширины, хранится кольцевой массив
+    сумм по корзинам и их общая сумма. При сдвиге окна вычитаются только выпавшие
+    корзины, поэтому `add` и `total` стоят O(1) (амортизированно), сколько бы
+    операций ни было в окне. Точность — одна корзина: учитываются значения
+    за последние от `window - window / buckets` до `window` микросекунд."""
+
+    __slots__ = ('width', '_sums', '_head', '_total')
+
+    def __init__(self, window: int, buckets: int = 60):
+        self.width = max(1, window // buckets)
+        self._sums = array('q', bytes(8 * buckets))
+        self._head = 0
+        self._total = 0
+
+    def _advance(self, bucket: int) -> None:
+        size = len(self._sums)
+        if bucket - self._head >= size:
+            self._sums = array('q', bytes(8 * size))
+            self._total = 0
+        else:
+            for expired in range(self._head + 1, bucket + 1):
+                self._total -= self._sums[expired % size]
+                self._sums[expired % size] = 0
+        self._head = bucket
+
+    def add(self, value: int, timestamp: int) -> None:
+        """Добавляет значение в момент `timestamp`.
+        Значения старше окна (например, при восстановлении истории) игнорируются."""
+        bucket = timestamp // self.width
+        if bucket > self._head:
+            self._advance(bucket)
+        elif bucket <= self._head - len(self._sums):
+            return
+        self._sums[bucket % len(self._sums)] += value
+        self._total += value
+
+    def total(self, timestamp: int) -> int:
+        """Сумма за окно, заканчивающееся в `timestamp`
+        (для моментов раньше последнего добавленного — за текущее окно)"""
+        bucket = timestamp // self.width
+        if bucket > self._head:
+            self._advance(bucket)
+        return self._total
+
+
+class WithdrawalLimits:
+    """Лимиты банка на сумму снятий за скользящее окно (например, за час или за сутки).
+
+    Лимит задаётся для каждого клиента (`scope='client'`) или каждого счёта (`scope='account'`)
+    и по умолчанию действует только для клиентов без паспорта или адреса.
+    Снятием считается то же, что и в `Client.check_withdraw_permissions`:
+    перевод на наличные или другому клиенту.
+
+    Суммы снятий хранятся в счётчиках `SlidingWindow` (по одному на лимит и владельца:
+    счёт или клиента — по `scope`), которые обновляются при изменении балансов
+    (`Transaction._apply`), поэтому проверка не зависит от длины истории.
+    Счётчики заводятся только для лимитов, которые действуют на владельца,
+    и удаляются, когда их окно опустело.
+
+    Проверка и запись выполняются под блокировками счетов транзакции, но не клиента,
+    поэтому параллельные снятия с разных счетов клиента могут превысить
+    клиентский лимит на одну операцию."""
+
+    SCOPES = ('client', 'account')
+    SWEEP_AT = 1024
+    """Число счётчиков, после которого из них убираются пустые (порог затем удваивается)"""
+
+    def __init__(self):
+        self._limits: Dict[Tuple[str, int], Tuple[int, bool]] = {}
+        self._counters: Dict[Tuple[str, int, UUID], SlidingWindow] = {}
+        self._sweep_at = self.SWEEP_AT
+        self._lock = Lock()
+
+    def set(self, scope: str, window: timedelta, amount: int | None,
+            unverified_only: bool = True) -> None:
+        """Устанавливает лимит `amount` на снятия за `window`; `amount=None` снимает лимит"""
+        if scope not in self.SCOPES:
+            raise ValueError("Unknown limit scope")
+        window_length = window // _MICROSECOND
+        if window_length <= 0:
+            raise ValueError("Window must be positive")
+        with self._lock:
+            if amount is None:
+                self._limits.pop((scope, window_length), None)
+            else:
+                self._limits[(scope, window_length)] = (amount, unverified_only)
+
+    def info(self) -> List[Dict[str, Any]]:
+        """Список лимитов (для JSON-ответов и сохранения); окно — в секундах"""
+        return [{'scope': scope, 'window': window // 10**6, 'amount': amount,
+                 'unverified_only': unverified_only}
+                for (scope, window), (amount, unverified_only) in self._limits.items()]
+
+    def load(self, limits: List[Dict[str, Any]]) -> None:
+        """Заменяет лимиты на список из `info`"""
+        with self._lock:
+            self._limits.clear()
+        for limit in limits:
+            self.set(limit['scope'], timedelta(seconds=limit['window']),
+                     limit['amount'], limit['unverified_only'])
+
+    @property
+    def longest_window(self) -> timedelta:
+        """Самое длинное окно среди лимитов"""
+        return timedelta(microseconds=max((window for _, window in self._limits), default=0))
+
+    def __bool__(self) -> bool:
+        return bool(self._limits)
+
+    @staticmethod
+    def is_withdrawal(From: "Account", To: "Account") -> bool:
+        """Считается ли перевод `From -> To` снятием для клиента `From`"""
+        return isinstance(To, CashAccount) or To.client is not From.client
+
+    def check(self, transaction: "Transaction") -> "BoolWithReason":
+        """Проверяет, что снятие не превышает лимиты (вместе с уже сделанными в окне)"""
+        failure = self.failure(transaction.From, transaction.To, transaction.amount,
+                               transaction._timestamp) # pylint: disable=protected-access
+        return _OK if failure is None else BoolWithReason(failure.reason, (failure.code,))
+
+    def failure(self, From: "Account", To: "Account", amount: int,
+                timestamp: int) -> PermissionFailure | None:
+        """То же, что `check`, но для правил `permission_plan`:
+        возвращает причину отказа или None"""
+        if not self._limits or amount <= 0 or not self.is_withdrawal(From, To):
+            return None
+        verified = From.client.verified
+        with self._lock:
+            for (scope, window), (limit, unverified_only) in self._limits.items():
+                if verified and unverified_only:
+                    continue
+                owner = From.client if scope == 'client' else From
+                counter = self._counters.get((scope, window, owner.id))
+                used = 0 if counter is None else counter.total(timestamp)
+                if used + amount > limit:
+                    return PermissionFailure(
+                        'withdrawal_limit', f"Withdrawal limit {limit} per "
+                        f"{timedelta(microseconds=window)} for {scope} exceeded\n")
+        return None
+
+    def record(self, From: "Account", To: "Account", amount: int, timestamp: int) -> None:
+        """Учитывает снятие `amount` (отрицательное — откат снятия) в счётчиках окон"""
+        if not self.is_withdrawal(From, To):
+            return
+        verified = From.client.verified
+        counters = self._counters
+        with self._lock:
+            for (scope, window), (_, unverified_only) in self._limits.items():
+                if verified and unverified_only:
+                    continue
+                key = (scope, window, (From.client if scope == 'client' else From).id)
+                counter = counters.get(key)
+                if counter is None:
+                    counter = counters[key] = SlidingWindow(window)
+                counter.add(amount, timestamp)
+                if not counter.total(timestamp):
+                    del counters[key]
+            if len(counters) >= self._sweep_at:
+                self._sweep(timestamp)
+
+    def _sweep(self, timestamp: int) -> None:
+        """Удаляет счётчики, окно которых к `timestamp` опустело"""
+        counters = self._counters
+        for key in [key for key, counter in counters.items() if not counter.total(timestamp)]:
+            del counters[key]
+        self._sweep_at = max(self.SWEEP_AT, 2 * len(counters))
+
+
+def count_withdrawal(From: "Account", To: "Account", amount: int, timestamp: int,
+                     sign: int = 1) -> None:
+    """Учитывает перевод `From -> To` в лимитах снятий банка плательщика
+    (`sign=-1` — откат перевода, см. `Transaction._revert`)"""
+    if amount < 0:
+        From, To, amount = To, From, -amount
+    limits = From.client.bank.withdrawal_limits
+    if limits:
+        limits.record(From, To, sign * amount, timestamp)
+
+
+@contextmanager
+def locked(*accounts: "Account") -> Iterator[None]:
+    """Захватывает блокировки счетов на время блока `with`.
+
+    Блокировки берутся в порядке возрастания `Account.id`,
+    поэтому два потока, которым нужны одни и те же счета, не заблокируют друг друга навсегда.
+    Повторы в `accounts` допустимы.
+
+    Если у банка есть журнал, блок выполняется как его операция
+    (`persistence.Persistence.operation`): пока он не завершится, снимок не снимается.
+    У всех банков сервера журнал общий, поэтому берётся журнал первого банка, где он есть."""
+    ordered = sorted({id(account): account for account in accounts}.values(),
+                     key=_by_id)
+    journal = next((account.client.bank.journal for account in ordered
+                    if account.client.bank.journal is not None), None)
+    with nullcontext() if journal is None else journal.operation():
+        for account in ordered:
+            account.lock.acquire()
+        try:
+            yield
+        finally:
+            for account in reversed(ordered):
+                account.lock.release()
+
+
+class Storage:
+    """Хранилище данных банка. Определяет, где живут истории счетов и реестр транзакций,
+    и получает уведомления о новых банках, клиентах, счетах и токенах.
+
+    Эта реализация (по умолчанию) держит всё в памяти и ничего не делает в уведомлениях.
+    Другие реализации (например, `sqlite_storage.SQLiteStorage`) переопределяют методы,
+    остальным классам об этом знать не нужно."""
+
+    def create_ledger(self, bank: "Bank") -> Ledger: # pylint: disable=unused-argument
+        """Создаёт реестр транзакций банка"""
+        return Ledger()
+
+    def create_history(self, account: "Account") -> TransactionsHistory:
+        """Создаёт историю транзакций счёта"""
+        return TransactionsHistory(account)
+
+    def bank_created(self, name: str, bank: "Bank") -> None:
+        """Банк создан и зарегистрирован под именем `name`"""
+
+    def bank_updated(self, name: str, bank: "Bank") -> None:
+        """Настройки банка (например, лимиты снятий) изменились"""
+
+    def client_created(self, client: "Client") -> None:
+        """Клиент создан (до создания его служебного счёта)"""
+
+    def client_updated(self, client: "Client") -> None:
+        """Данные клиента изменились"""
+
+    def account_created(self, account: "Account") -> None:
+        """Счёт создан и записан в словари банка и клиента"""
+
+    def token_issued(self, token_hash: bytes, client: "Client") -> None:
+        """Клиенту выдан токен (передаётся только его хеш, см. `sessions.hash_token`)"""
+
+    def command_completed(self, client: "Client", key: str, result: Dict,
+                          expires: float, fingerprint: str) -> None:
+        """Команда клиента с ключом идемпотентности `key` и отпечатком `fingerprint`
+        выполнена (результат хранится до `expires`, см. `idempotency.py`)"""
+
+    def transfer_queued(self, transaction: "Transaction") -> None:
+        """Межбанковский перевод встал в очередь клиринга (см. `clearing.py`)"""
+
+    def transfer_dequeued(self, transfer_id: UUID) -> None:
+        """Перевод вышел из очереди клиринга: зачислен, возвращён или отменён"""
+
+    def flush(self) -> None:
+        """Записывает изменения, которые хранилище копит в буфере"""
+
+    def reopen(self) -> None:
+        """Вызывается в дочернем процессе после fork (см. `reconcile.py`):
+        хранилище должно заново открыть файлы и соединения, а не делить их с родителем"""
+
+
+Rule = Callable[["Account", "Account", int, int], PermissionFailure | None]
+"""Правило проверки снятия: (счёт, счёт получателя, сумма, время) -> причина отказа или None"""
+
+
+def _enough_money(account: "Account", _To: "Account", amount: int,
+                  _timestamp: int) -> PermissionFailure | None:
+    return NOT_ENOUGH_MONEY if account.balance < amount else None
+
+
+def _matured(account: "Account", _To: "Account", amount: int,
+             timestamp: int) -> PermissionFailure | None:
+    if amount > 0 and from_timestamp(timestamp).date() < cast("DepositAccount", account).end_date:
+        return BEFORE_END_DATE
+    return None
+
+
+def _within_credit_limit(account: "Account", _To: "Account", amount: int,
+                         _timestamp: int) -> PermissionFailure | None:
+    credit_limit = cast("CreditAccount", account).credit_limit
+    return NOT_ENOUGH_MONEY if account.balance - amount < -credit_limit else None
+
+
+def _unverified_withdrawal(account: "Account", To: "Account", amount: int,
+                           _timestamp: int) -> PermissionFailure | None:
+    client = account.client
+    if amount > client.bank.unathorized_withdrawal_limit \
+            and (isinstance(To, CashAccount) or To.client is not client):
+        return UNVERIFIED_CLIENT
+    return None
+
+
+def _withdrawal_limits(account: "Account", To: "Account", amount: int,
+                       timestamp: int) -> PermissionFailure | None:
+    return account.client.bank.withdrawal_limits.failure(account, To, amount, timestamp)
+
 
 class Account:
     """Базовый класс для банковских счетов.
@@ -163,14 +1001,22 @@ class Account:
         - client: Client
         - balance: int
         - history: TransactionList
+        - lock: блокировка, которую держат, пока меняют баланс и историю (см. `locked`)
+        - stats: счётчики операций (`Stats`)
 
     Дочерние классы отличаются правилами вывода средств,
-    которые задаются в методе `check_withdraw_permissions`."""
+    которые задаются списком правил `withdraw_rules` (см. `permission_plan`)
+    или переопределением метода `check_withdraw_permissions`."""
+
+    withdraw_rules: Tuple["Rule", ...] = ()
+
     def __init__(self, client: "Client"):
         self.id = uuid4()
         self.client = client
         self.balance = 0
-        self.history: "TransactionsHistory" = TransactionsHistory()
+        self.history: "TransactionsHistory" = client.bank.storage.create_history(self)
+        self.lock = Lock()
+        self.stats = Stats()
 
     def __str__(self):
         return '*' + str(self.id)[-5:-1]
@@ -183,30 +1029,34 @@ class Account:
             'type': self.__class__.__name__,
         }
 
-    def check_withdraw_permissions(self, transaction: "Transaction") -> "BoolWithReason": # pylint: disable=unused-argument
+    def balance_at(self, moment: datetime) -> int:
+        """Баланс счёта на момент `moment` (с учётом транзакций, проведённых ровно в `moment`).
+        Считается от текущего баланса по контрольным точкам истории
+        (`TransactionsHistory.change_after`), без просмотра всей истории."""
+        with locked(self):
+            return self.balance - self.history.change_after(moment)
+
+    def check_withdraw_permissions(self, transaction: "Transaction") -> "BoolWithReason":
         """Проверяет, можно ли совершить транзакцию со счёта данного типа."""
-        return NotImplemented
+        return _run_rules(type(self).withdraw_rules, self, transaction.To,
+                          transaction.amount, transaction._timestamp) # pylint: disable=protected-access
 
 class DebitAccount(Account):
     """счёт, на котором должно находиться неотрицательное количество средств"""
-    def check_withdraw_permissions(self, transaction: "Transaction") -> "BoolWithReason":
-        if self.balance < transaction.amount:
-            return BoolWithReason("Not enough money\n")
-        return BoolWithReason()
+    withdraw_rules = (_enough_money,)
 
 class DepositAccount(Account):
-    """Счёт, с которого нельзя выводить деньги до его окончания."""
-    def __init__(self, client: "Client", *, end_date: date):
+    """Счёт, с которого нельзя выводить деньги до его окончания.
+
+    После окончания срока `maturity.MaturityScheduler` переводит остаток
+    на счёт клиента `payout_account_id` (если не задан — снимает наличными)."""
+    def __init__(self, client: "Client", *, end_date: date,
+                 payout_account_id: UUID | None = None):
         super().__init__(client)
         self.end_date = end_date
+        self.payout_account_id = payout_account_id
 
-    def check_withdraw_permissions(self, transaction: "Transaction") -> "BoolWithReason":
-        answer = BoolWithReason()
-        if transaction.datetime.date() < self.end_date and transaction.amount > 0:
-            answer = answer & BoolWithReason("Can't withdraw money before end date\n")
-        if self.balance < transaction.amount:
-            answer = answer & BoolWithReason("Not enough money\n")
-        return answer
+    withdraw_rules = (_matured, _enough_money)
 
 class CreditAccount(Account):
     """Счёт, в котором можно уходить в минус до определённого предела.
@@ -216,47 +1066,171 @@ class CreditAccount(Account):
         self.credit_limit = credit_limit
         self.interest_rate = interest_rate
 
-    def check_withdraw_permissions(self, transaction: "Transaction") -> "BoolWithReason":
-        if self.balance - transaction.amount < -self.credit_limit:
-            return BoolWithReason("Not enough money\n")
-        else:
-            return BoolWithReason()
+    withdraw_rules = (_within_credit_limit,)
 
 class CashAccount(Account):
     """Счёт - черная дыра. Служебный.
     Является полем 'From' в операции внесения наличных и полем 'To' в операции снятия наличных."""
-    def check_withdraw_permissions(self, transaction: "Transaction") -> "BoolWithReason":
-        return BoolWithReason()
+
+
+def _custom_rules(account: Account, To: Account, amount: int,
+                  timestamp: int) -> PermissionFailure | None:
+    """Правило для счетов, которые переопределяют `check_withdraw_permissions`"""
+    transaction = Transaction.__new__(Transaction)
+    transaction.From, transaction.To, transaction.amount = account, To, amount
+    transaction._timestamp, transaction._id = timestamp, 0 # pylint: disable=protected-access
+    result = account.check_withdraw_permissions(transaction)
+    return None if result else PermissionFailure('account_rules', result.reason)
+
+
+_plans: Tuple[Dict[type, Tuple["Rule", ...]], Dict[type, Tuple["Rule", ...]]] = ({}, {})
+"""Планы проверки: `_plans[verified][тип счёта]`"""
+
+
+def permission_plan(account_type: Type[Account], verified: bool) -> Tuple["Rule", ...]:
+    """Правила, которые проверяются при снятии со счёта типа `account_type`
+    клиента с документами (`verified`) или без: правила счёта (`withdraw_rules`),
+    клиента (`Client.check_withdraw_permissions`) и лимиты снятий банка.
+
+    План составляется один раз на пару (тип счёта, статус клиента),
+    поэтому при проверке не нужно заново выбирать методы по типам."""
+    plan = _plans[verified].get(account_type)
+    if plan is None:
+        if account_type.check_withdraw_permissions is Account.check_withdraw_permissions:
+            rules = account_type.withdraw_rules
+        else:
+            rules = (_custom_rules,)
+        client_rules = () if verified else (_unverified_withdrawal,)
+        plan = _plans[verified][account_type] = rules + client_rules + (_withdrawal_limits,)
+    return plan
+
+
+def check_transfer(From: Account, To: Account, amount: int, timestamp: int) -> BoolWithReason:
+    """Проверяет снятие `amount` со счёта `From` на счёт `To`
+    (то же, что `Transaction(From, To, amount).check_permissions()`)"""
+    return _run_rules(permission_plan(type(From), From.client.verified),
+                      From, To, amount, timestamp)
+
+
+def _run_rules(rules: Tuple["Rule", ...], account: Account, To: Account, amount: int,
+               timestamp: int) -> BoolWithReason:
+    """Применяет правила по порядку. Пока все проходят, новых объектов не создаётся;
+    иначе возвращаются все причины отказа (как при объединении через &)."""
+    failures = None
+    for rule in rules:
+        failure = rule(account, To, amount, timestamp)
+        if failure is not None:
+            if failures is None:
+                failures = [failure]
+            else:
+                failures.append(failure)
+    if failures is None:
+        return _OK
+    return BoolWithReason(''.join(failure.reason for failure in failures),
+                          tuple(failure.code for failure in failures))
 
 
 class Bank:
-    """Класс банка, содержит словарь с счетами клиентов 
-    и лимит на вывод без предоставления документов."""
-    def __init__(self, unathorized_withdrawal_limit: int = 0) -> None:
+    """Класс банка, содержит словарь с счетами клиентов,
+    реестр транзакций и лимит на вывод без предоставления документов.
+
+    Поле `storage` определяет, где хранятся истории и реестр (по умолчанию — в памяти).
+    Поле `journal` — необязательный журнал изменений (см. `persistence.Persistence`).
+    Если он задан, банк сообщает ему о новых клиентах, счетах и транзакциях.
+    Поле `engine` — необязательный движок (см. `engine.ShardedEngine`),
+    через который `ClientFacade` выполняет транзакции клиентов банка.
+    Поле `maturities` — очередь вкладов по дате окончания (см. `MaturityIndex`).
+    Поле `withdrawal_limits` — лимиты на снятия за час, сутки и т.п. (см. `WithdrawalLimits`).
+    Поле `clearing` — необязательная клиринговая палата (см. `clearing.ClearingHouse`),
+    через которую идут переводы клиентов в другие банки.
+    Поле `interest_accrued` — последняя дата, за которую списаны проценты (см. `interest.py`).
+    Поле `lock` — блокировка операций над банком в целом (например, начисления процентов)."""
+    def __init__(self, unathorized_withdrawal_limit: int = 0,
+                 storage: "Storage | None" = None) -> None:
+        self.id = uuid4()
+        self.storage = storage if storage is not None else Storage()
         self.accounts: Dict[UUID, "Account"] = {}
+        self.ledger = self.storage.create_ledger(self)
         self.unathorized_withdrawal_limit = unathorized_withdrawal_limit
+        self.journal: Any = None
+        self.engine: Any = None
+        self.maturities = MaturityIndex()
+        self.withdrawal_limits = WithdrawalLimits()
+        self.clearing: Any = None
+        self.interest_accrued: date | None = None
+        self.lock = RLock()
+
+    def service_account(self, purpose: str) -> "Account":
+        """Служебный счёт банка для `purpose` (например, для начисленных процентов).
+        Создаётся при первом обращении вместе со служебным клиентом.
+
+        Id счёта вычисляется из id банка и `purpose`, поэтому после восстановления
+        из журнала или хранилища находится тот же самый счёт."""
+        account_id = uuid5(self.id, purpose)
+        account = self.accounts.get(account_id)
+        if account is None:
+            client = Client(self, 'service', purpose, '-', '-')
+            account = CashAccount(client)
+            account.id = account_id
+            client._register_account(account) # pylint: disable=protected-access
+        return account
 
 
 class Client:
     """Класс c информацией о клиенте,
-    содержит в том числе словарь со счетами и ссылку на банк."""
+    содержит в том числе словарь со счетами, ссылку на банк и счётчики операций (`stats`)."""
     def __init__(self, bank: "Bank", name: str, surname: str,
                  passport: str | None = None, address: str | None = None):
+        self.id = uuid4()
         self.bank = bank
         self.name = name
         self.surname = surname
         self.passport = passport
         self.address = address
         self.accounts: Dict[UUID, "Account"] = {}
-        self.default_cash_account = self.create_account(CashAccount)
+        self.stats = Stats()
+        # в операции журнала: снимок не должен застать счёт в словаре банка
+        # без записи о нём в журнале (иначе после восстановления счёт создастся дважды)
+        with nullcontext() if bank.journal is None else bank.journal.operation():
+            bank.storage.client_created(self)
+            self.default_cash_account = self._add_account(CashAccount(self))
+            bank.storage.account_created(self.default_cash_account)
+            if bank.journal is not None:
+                bank.journal.client_created(self)
 
     def create_account(self, account_type: Type["Account"], **kwargs) -> "Account":
         """Создаёт счёт и записывает его в объекты банка и клиента."""
-        account = account_type(self, **kwargs)
+        return self._register_account(account_type(self, **kwargs))
+
+    def _register_account(self, account: "Account") -> "Account":
+        journal = self.bank.journal
+        with nullcontext() if journal is None else journal.operation():
+            self._add_account(account)
+            self.bank.storage.account_created(account)
+            if journal is not None:
+                journal.account_created(account)
+        return account
+
+    def _add_account(self, account: "Account") -> "Account":
         self.accounts[account.id] = account
         self.bank.accounts[account.id] = account
+        if isinstance(account, DepositAccount):
+            self.bank.maturities.add(account)
         return account
 
+    def _rekey_account(self, account: "Account", account_id: UUID) -> None:
+        """Меняет id счёта. Нужно при восстановлении клиента из хранилища:
+        служебный счёт создаётся в конструкторе со случайным id."""
+        del self.accounts[account.id]
+        del self.bank.accounts[account.id]
+        account.id = account_id
+        self._add_account(account)
+
+    @property
+    def verified(self) -> bool:
+        """Указаны ли паспорт и адрес клиента"""
+        return self.passport is not None and self.address is not None
+
     def check_withdraw_permissions(self, transaction: "Transaction") -> "BoolWithReason":
         """Проверяет, можно ли совершить транзакцию с учётом документов клиента.
 
@@ -265,11 +1239,10 @@ class Client:
         но может за раз снять / перевести другому человеку только
         до определённого предела, установленного банком."""
 
-        if self.passport is None or self.address is None:
-            if isinstance(transaction.To, CashAccount) or transaction.To.client != self:
-                if transaction.amount > self.bank.unathorized_withdrawal_limit:
-                    return BoolWithReason("Client doesn't have passport or address\n")
-        return BoolWithReason()
+        if self.verified:
+            return _OK
+        return _run_rules((_unverified_withdrawal,), transaction.From, transaction.To,
+                          transaction.amount, transaction._timestamp) # pylint: disable=protected-access
 
 
 class ClientFacade:
@@ -292,7 +1265,7 @@ class ClientFacade:
             return BoolWithReason("Account not found\n")
 
         account = self.client.accounts[account_id]
-        return Transaction(account, self.client.default_cash_account, amount).perform()
+        return self._perform(Transaction(account, self.client.default_cash_account, amount))
 
 
     def deposit(self, account_id: UUID, amount: int) -> "BoolWithReason":
@@ -301,7 +1274,7 @@ class ClientFacade:
             return BoolWithReason("Account not found\n")
 
         account = self.client.accounts[account_id]
-        return Transaction(self.client.default_cash_account, account, amount).perform()
+        return self._perform(Transaction(self.client.default_cash_account, account, amount))
 
 
     def transfer(self, from_account_id: UUID, to_account_id: UUID,
@@ -310,6 +1283,23 @@ class ClientFacade:
 
         Если банк не указан, то считается, что счёт получателя находится 
         в том же банке, что и счёт отправителя."""
+        transaction = self._make_transfer(from_account_id, to_account_id, amount, to_bank)
+        if isinstance(transaction, BoolWithReason):
+            return transaction
+        return self._perform(transaction)
+
+    def _perform(self, transaction: "Transaction") -> "BoolWithReason":
+        """Выполняет транзакцию через движок банка, если он есть, иначе напрямую.
+        Переводы в другой банк идут через клиринг (`clearing.ClearingHouse`), если он подключён."""
+        bank = self.client.bank
+        if bank.clearing is not None and transaction.To.client.bank is not bank:
+            return bank.clearing.submit(transaction)
+        if bank.engine is not None:
+            return bank.engine.perform(transaction)
+        return transaction.perform()
+
+    def _make_transfer(self, from_account_id: UUID, to_account_id: UUID,
+                       amount: int, to_bank: Bank | None) -> "Transaction | BoolWithReason":
         if to_bank is None:
             to_bank = self.client.bank
         if to_account_id not in to_bank.accounts:
@@ -317,15 +1307,94 @@ class ClientFacade:
         if from_account_id not in self.client.accounts:
             return BoolWithReason("Sender account not found\n")
         return Transaction(self.client.accounts[from_account_id],
-                           to_bank.accounts[to_account_id], amount).perform()
+                           to_bank.accounts[to_account_id], amount)
+
+
+    def transfer_batch(self, transfers: List[Tuple[UUID, UUID, int, Bank | None]],
+                       atomic: bool = False) -> List["BoolWithReason"]:
+        """Выполняет пачку переводов `(from_account_id, to_account_id, amount, to_bank)`
+        и возвращает результат для каждого.
+
+        Переводы проверяются по очереди с учётом уже применённых в этой пачке
+        (то есть по текущим балансам). Истории, реестры и журналы пишутся
+        один раз в конце, после того как известно, что пачка проходит.
+
+        Если `atomic`, то при первой же ошибке все балансы откатываются
+        и не выполняется ни один перевод, иначе неудачные переводы просто пропускаются.
+
+        Переводы в другой банк при подключённом клиринге, как и в `transfer`,
+        списываются на корреспондентский счёт (`clearing.ClearingHouse.debit`)
+        и вместе с записью пачки встают в очередь на зачисление.
+
+        Счета всех переводов находятся заранее, и на время пачки
+        захватываются их блокировки."""
+        bank = self.client.bank
+        prepared: List["Transaction | BoolWithReason"] = []
+        cleared: Dict[int, Transaction] = {} # id() списания -> перевод через клиринг
+        for transfer in transfers:
+            transaction = self._make_transfer(*transfer)
+            if isinstance(transaction, Transaction) and bank.clearing is not None \
+                    and transaction.To.client.bank is not bank:
+                original, transaction = transaction, bank.clearing.debit(transaction)
+                cleared[id(transaction)] = original
+            prepared.append(transaction)
+        accounts = [account for transaction in prepared if isinstance(transaction, Transaction)
+                    for account in (transaction.From, transaction.To)]
+
+        results: List[BoolWithReason] = []
+        applied: List[Transaction] = []
+        with locked(*accounts):
+            for transaction in prepared:
+                if isinstance(transaction, BoolWithReason):
+                    result = transaction
+                else:
+                    result = transaction._check_both_sides() # pylint: disable=protected-access
+                    if result:
+                        transaction._apply() # pylint: disable=protected-access
+                        applied.append(transaction)
+                results.append(result)
+                if atomic and not result:
+                    for transaction in reversed(applied):
+                        transaction._revert() # pylint: disable=protected-access
+                    rolled_back = BoolWithReason("Rolled back because another transfer failed\n")
+                    return [rolled_back if result else result for result in results] \
+                        + [rolled_back] * (len(transfers) - len(results))
+
+            for transaction in applied:
+                transaction._record() # pylint: disable=protected-access
+                if id(transaction) in cleared:
+                    bank.clearing.enqueue(cleared[id(transaction)])
+        return results
 
 
     def get_accounts(self) -> List[Account]:
         """Список счетов клиента (за исключением служебного CashAccount)))"""
         return [account for account in self.client.accounts.values()
                 if account != self.client.default_cash_account]
-    def get_account_history(self, account_id: UUID) -> List[Transaction]:
-        """Возвращает список транзакций по счёту"""
+
+    def get_stats(self, account_id: UUID | None = None) -> Stats:
+        """Счётчики операций счёта или, если `account_id` не указан, всего клиента.
+        Значения поддерживаются при каждой транзакции, так что вызов стоит O(1)."""
+        if account_id is None:
+            return self.client.stats
         if account_id not in self.client.accounts:
             raise ValueError("Account not found")
-        return self.client.accounts[account_id].history.see()
+        return self.client.accounts[account_id].stats
+
+    def get_balance_at(self, account_id: UUID, moment: datetime) -> int:
+        """Баланс счёта на момент `moment` (см. `Account.balance_at`)"""
+        if account_id not in self.client.accounts:
+            raise ValueError("Account not found")
+        return self.client.accounts[account_id].balance_at(moment)
+
+    def get_account_history(self, account_id: UUID, *,
+                            after: datetime | None = None, before: datetime | None = None,
+                            limit: int | None = None, cursor: str | None = None
+                            ) -> List[Transaction]:
+        """Возвращает список транзакций по счёту.
+        Параметры фильтрации и постраничного вывода — как у `TransactionsHistory.see`"""
+        if account_id not in self.client.accounts:
+            raise ValueError("Account not found")
+        account = self.client.accounts[account_id]
+        with locked(account):
+            return account.history.see(after=after, before=before, limit=limit, cursor=cursor)
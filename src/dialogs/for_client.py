@@ -1,11 +1,15 @@
+from typing import Dict
+from uuid import UUID
+
 from aiogram import types, Router
 from aiogram.filters import Command, Text
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
 from ..core import ClientFacade
-from ..json_bridge import ServerState, ClientCommands
-from .utils import require_auth, clean_state_preserving_user
+from ..async_bridge import AsyncCommands
+from ..json_bridge import ServerState
+from .utils import require_auth, clean_state_preserving_user, get_client_facade
 
 
 router = Router()
@@ -20,13 +24,16 @@ async def auth1(message: types.Message, state: FSMContext):
     await state.set_state(AuthState.wait_for_user_id)
 
 @router.message(AuthState.wait_for_user_id)
-async def auth2(message: types.Message, state: FSMContext, server_state: ServerState):
+async def auth2(message: types.Message, state: FSMContext, server_state: ServerState,
+                chats: Dict[UUID, int]):
     if message.text is None:
         return
     if (client_facade := server_state.get_client_facade_by_token(message.text)) is None:
         await message.answer('Неверный токен')
     else:
-        await state.update_data({'client_facade': client_facade})
+        chats[client_facade.client.id] = message.chat.id
+        previous = (await state.get_data()).get('session')
+        await state.update_data({'session': server_state.open_session(message.text, previous)})
         await state.update_data({'mode': 'client'})
         await message.answer('Вы авторизованы')
         await state.set_state(None)
@@ -60,10 +67,11 @@ async def ask_type(message: types.Message, state: FSMContext):
     await state.set_state(CreateAccountState.wait_for_account_type)
 
 @router.message(CreateAccountState.wait_for_account_type, Text(['DebitAccount', 'DepositAccount', 'CreditAccount', 'CashAccount']))
-async def create_account2(message: types.Message, state: FSMContext):
+async def create_account2(message: types.Message, state: FSMContext, commands: AsyncCommands,
+                          server_state: ServerState):
     await state.update_data({'account_type': message.text})
     if message.text == 'DebitAccount' or message.text == 'CashAccount':
-        await create_account_finalize(message, state)
+        await create_account_finalize(message, state, commands, server_state)
     elif message.text == 'DepositAccount':
         await message.answer('Введите дату окончания срока действия счёта в формате YYYY-MM-DD')
         await state.set_state(CreateAccountState.wait_for_end_date)
@@ -72,9 +80,10 @@ async def create_account2(message: types.Message, state: FSMContext):
         await state.set_state(CreateAccountState.wait_for_credit_limit)
 
 @router.message(CreateAccountState.wait_for_end_date)
-async def create_account3(message: types.Message, state: FSMContext):
+async def create_account3(message: types.Message, state: FSMContext, commands: AsyncCommands,
+                          server_state: ServerState):
     await state.update_data({'end_date': message.text})
-    await create_account_finalize(message, state)
+    await create_account_finalize(message, state, commands, server_state)
 
 @router.message(CreateAccountState.wait_for_credit_limit)
 async def create_account4(message: types.Message, state: FSMContext):
@@ -83,29 +92,31 @@ async def create_account4(message: types.Message, state: FSMContext):
     await state.set_state(CreateAccountState.wait_for_interest_rate)
 
 @router.message(CreateAccountState.wait_for_interest_rate)
-async def create_account5(message: types.Message, state: FSMContext):
+async def create_account5(message: types.Message, state: FSMContext, commands: AsyncCommands,
+                          server_state: ServerState):
     await state.update_data({'interest_rate': message.text})
-    await create_account_finalize(message, state)
+    await create_account_finalize(message, state, commands, server_state)
 
-async def create_account_finalize(message: types.Message, state: FSMContext):
+async def create_account_finalize(message: types.Message, state: FSMContext, commands: AsyncCommands,
+                                  server_state: ServerState):
+    if (client_facade := await get_client_facade(message, state, server_state)) is None:
+        return
     command = await state.get_data()
-    client_facade = command['client_facade']
 
     posiible_kwargs = ['end_date', 'credit_limit', 'interest_rate']
     kwargs = {key: command[key] for key in posiible_kwargs if key in command}
     command = {'account_type': command['account_type'], 'kwargs': kwargs}
 
-    result = ClientCommands.create_account(command, client_facade)
+    result = await commands.client('create_account', command, client_facade)
     await message.answer(str(result), reply_markup=types.ReplyKeyboardRemove(remove_keyboard=True))
     await clean_state_preserving_user(state)
 
 
 
 
-async def select_account(message: types.Message, state: FSMContext):
-    data = await state.get_data()
-    client_facade: ClientFacade = data['client_facade']
-    accounts = ClientCommands.show_accounts({}, client_facade)['accounts']
+async def select_account(message: types.Message, state: FSMContext, commands: AsyncCommands,
+                         client_facade: ClientFacade):
+    accounts = (await commands.client('show_accounts', {}, client_facade))['accounts']
     if accounts == []:
         await message.answer('У вас нет счетов')
         await clean_state_preserving_user(state)
@@ -128,8 +139,11 @@ class DepositState(StatesGroup):
 
 @router.message(Command('deposit'))
 @require_auth
-async def deposit1(message: types.Message, state: FSMContext):
-    await select_account(message, state)
+async def deposit1(message: types.Message, state: FSMContext, commands: AsyncCommands,
+                   server_state: ServerState):
+    if (client_facade := await get_client_facade(message, state, server_state)) is None:
+        return
+    await select_account(message, state, commands, client_facade)
     await state.set_state(DepositState.wait_for_account_id)
 
 @router.message(DepositState.wait_for_account_id)
@@ -139,12 +153,16 @@ async def deposit2(message: types.Message, state: FSMContext):
     await state.set_state(DepositState.wait_for_amount)
 
 @router.message(DepositState.wait_for_amount)
-async def deposit3(message: types.Message, state: FSMContext):
+async def deposit3(message: types.Message, state: FSMContext, commands: AsyncCommands,
+                   server_state: ServerState):
+    if (client_facade := await get_client_facade(message, state, server_state)) is None:
+        return
     command = await state.get_data()
     command['amount'] = message.text
-    client_facade = command['client_facade']
+    # Telegram повторяет доставку того же сообщения, если не дождался ответа
+    command['idempotency_key'] = f'telegram {message.chat.id} {message.message_id}'
 
-    result = ClientCommands.deposit(command, client_facade)
+    result = await commands.client('deposit', command, client_facade)
     await message.answer(str(result))
     await clean_state_preserving_user(state)
 
@@ -155,10 +173,11 @@ async def deposit3(message: types.Message, state: FSMContext):
 
 @router.message(Command('show_accounts'))
 @require_auth
-async def show_accounts(message: types.Message, state: FSMContext):
-    data = await state.get_data()
-    client_facade: ClientFacade = data['client_facade']
-    result = ClientCommands.show_accounts({}, client_facade)
+async def show_accounts(message: types.Message, state: FSMContext, commands: AsyncCommands,
+                        server_state: ServerState):
+    if (client_facade := await get_client_facade(message, state, server_state)) is None:
+        return
+    result = await commands.client('show_accounts', {}, client_facade)
     await message.answer(str(result))
 
 
@@ -169,16 +188,21 @@ class ShowHistoryState(StatesGroup):
 
 @router.message(Command('show_history'))
 @require_auth
-async def show_history(message: types.Message, state: FSMContext):
-    await select_account(message, state)
+async def show_history(message: types.Message, state: FSMContext, commands: AsyncCommands,
+                       server_state: ServerState):
+    if (client_facade := await get_client_facade(message, state, server_state)) is None:
+        return
+    await select_account(message, state, commands, client_facade)
     await state.set_state(ShowHistoryState.wait_for_account_id)
 
 @router.message(ShowHistoryState.wait_for_account_id)
-async def show_history2(message: types.Message, state: FSMContext):
-    client_facade = (await state.get_data())['client_facade']
+async def show_history2(message: types.Message, state: FSMContext, commands: AsyncCommands,
+                        server_state: ServerState):
     if message.text is None:
         return
-    result = ClientCommands.show_history({'account_id': message.text}, client_facade)
+    if (client_facade := await get_client_facade(message, state, server_state)) is None:
+        return
+    result = await commands.client('show_history', {'account_id': message.text}, client_facade)
     await message.answer(str(result),reply_markup=types.ReplyKeyboardRemove(remove_keyboard=True))
     await clean_state_preserving_user(state)
 
@@ -3,7 +3,8 @@ from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
-from ..json_bridge import ServerState, SuperuserCommands
+from ..async_bridge import AsyncCommands
+from ..json_bridge import ServerState
 from .utils import sudo, clean_state_preserving_user
 
 
@@ -32,7 +33,7 @@ async def create_bank2(message: types.Message, state: FSMContext):
 
 
 @router.message(BankCreationState.wait_for_unathorized_withdrawal_limit)
-async def create_bank3(message: types.Message, state: FSMContext, server_state: ServerState):
+async def create_bank3(message: types.Message, state: FSMContext, commands: AsyncCommands):
     if message.text is None:
         return
     try:
@@ -42,7 +43,7 @@ async def create_bank3(message: types.Message, state: FSMContext, server_state:
         return
     command = await state.get_data()
     command['unathorized_withdrawal_limit'] = limit
-    result = SuperuserCommands.create_bank(command, server_state)
+    result = await commands.superuser('create_bank', command)
     await message.answer(str(result))
     await clean_state_preserving_user(state)
 
@@ -89,8 +90,8 @@ async def create_client4(message: types.Message, state: FSMContext):
     await state.set_state(ClientCreationState.wait_for_client_passport)
 
 @router.message(ClientCreationState.wait_for_client_passport, Command('skip'))
-async def create_client5(message: types.Message, state: FSMContext, server_state: ServerState):
-    result = SuperuserCommands.create_client(await state.get_data(), server_state)
+async def create_client5(message: types.Message, state: FSMContext, commands: AsyncCommands):
+    result = await commands.superuser('create_client', await state.get_data())
     await message.answer(str(result))
     await clean_state_preserving_user(state)
 
@@ -103,8 +104,8 @@ async def create_client6(message: types.Message, state: FSMContext):
     await state.set_state(ClientCreationState.wait_for_client_address)
 
 @router.message(ClientCreationState.wait_for_client_address)
-async def create_client7(message: types.Message, state: FSMContext, server_state: ServerState):
+async def create_client7(message: types.Message, state: FSMContext, commands: AsyncCommands):
     if message.text is None:
         return
     await state.update_data({'address': message.text})
-    await create_client5(message, state, server_state)
+    await create_client5(message, state, commands)
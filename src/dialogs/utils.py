@@ -2,30 +2,44 @@ from functools import wraps
 from aiogram import types
 from aiogram.fsm.context import FSMContext
 
+from ..core import ClientFacade
+from ..json_bridge import ServerState
+
 def sudo(func):
     @wraps(func)
-    async def wrapper(message: types.Message, state: FSMContext):
+    async def wrapper(message: types.Message, state: FSMContext, **kwargs):
         data = await state.get_data()
         if data.get('mode') != 'superuser':
             await message.answer('Недоступно, нужно поменять /mode')
             return
-        await func(message, state)
+        await func(message, state, **kwargs)
     return wrapper
 
 def require_auth(func):
     @wraps(func)
-    async def wrapper(message: types.Message, state: FSMContext):
+    async def wrapper(message: types.Message, state: FSMContext, **kwargs):
         data = await state.get_data()
-        if data.get('client_facade') is None:
+        if data.get('session') is None:
             await message.answer('Нужно авторизоваться')
             return
-        await func(message, state)
+        await func(message, state, **kwargs)
     return wrapper
 
 async def clean_state_preserving_user(state: FSMContext):
     data = await state.get_data()
     await state.set_data({
         'mode': data.get('mode'),
-        'client_facade': data.get('client_facade'),
+        'session': data.get('session'),
     })
     await state.set_state(None)
+
+async def get_client_facade(message: types.Message, state: FSMContext,
+                            server_state: ServerState) -> ClientFacade | None:
+    """Клиент текущей сессии. Если сессия истекла, просит авторизоваться заново."""
+    data = await state.get_data()
+    client_facade = server_state.get_client_facade_by_session(data.get('session'))
+    if client_facade is None:
+        await message.answer('Сессия истекла, нужно авторизоваться заново: /auth')
+        await state.set_data({'mode': data.get('mode')})
+        await state.set_state(None)
+    return client_facade
@@ -0,0 +1,136 @@
+"""Шардированное выполнение транзакций.
+
+Счета распределяются по `shards` рабочим потокам по id счёта.
+Балансы счетов шарда меняет только его поток, и свои операции он выполняет
+строго по очереди.
+
+Перевод между счетами одного шарда целиком проверяется и применяется в его потоке.
+Перевод между шардами проходит в две фазы:
+    1. поток отправителя проверяет ограничения отправителя и резервирует сумму
+       (списывает её с баланса);
+    2. поток получателя проверяет ограничения получателя и зачисляет сумму.
+Если вторая фаза не прошла, поток отправителя возвращает резерв.
+
+Поток, вызвавший `perform`, на всё это время держит блокировки обоих счетов
+(`core.locked`, а значит, и операцию журнала): остальные пути, меняющие балансы
+под блокировками (пачки переводов, проценты, отмена, клиринг), не видят
+зарезервированную, но ещё не зачисленную сумму, а снимок журнала не снимается
+между фазами. После успешной второй фазы он же записывает транзакцию в истории,
+реестры и журналы.
+
+Потоки шардов ничего не ждут, кроме своей очереди, поэтому взаимных блокировок
+с вызывающими потоками нет. Шарды — потоки, а не процессы: все банки живут
+в одном графе объектов в памяти, и делить его между процессами пришлось бы
+через сериализацию каждого счёта. Поэтому под GIL движок не ускоряет переводы,
+а упорядочивает их (см. `benchmarks/engine_scaling.py`).
+
+Движок подключается к банку (`Bank.engine`) и используется `ClientFacade`,
+так что json_bridge и диалоги бота про него не знают:
+```python
+engine = ShardedEngine(4)
+bank.engine = engine
+...
+engine.close()
+```"""
+
+import os
+from concurrent.futures import Future
+from functools import partial
+from queue import SimpleQueue
+from threading import Thread
+from typing import Any, Callable, List
+
+from . import core
+from .core import Account, BoolWithReason, Transaction, check_transfer, count_withdrawal, locked
+
+
+class ShardedEngine:
+    """Пул из `shards` потоков, каждый из которых обслуживает свою часть счетов."""
+
+    def __init__(self, shards: int | None = None):
+        self.shards = shards or os.cpu_count() or 1
+        self._queues: List[SimpleQueue] = [SimpleQueue() for _ in range(self.shards)]
+        self._workers = [Thread(target=self._run, args=(queue,), daemon=True,
+                                name=f'shard-{i}')
+                         for i, queue in enumerate(self._queues)]
+        for worker in self._workers:
+            worker.start()
+
+    def shard_of(self, account: Account) -> int:
+        """Номер шарда, которому принадлежит счёт"""
+        return account.id.int % self.shards
+
+    def submit(self, shard: int, function: Callable[[], Any]) -> Future:
+        """Ставит функцию в очередь шарда и возвращает Future с её результатом"""
+        future: Future = Future()
+        self._queues[shard].put((function, future))
+        return future
+
+    @staticmethod
+    def _run(queue: SimpleQueue) -> None:
+        while (task := queue.get()) is not None:
+            function, future = task
+            try:
+                future.set_result(function())
+            except BaseException as e: # pylint: disable=broad-exception-caught
+                future.set_exception(e)
+
+    def perform(self, transaction: Transaction) -> BoolWithReason:
+        """Выполняет транзакцию в потоках шардов её счетов и ждёт результата.
+        Результат такой же, как у `transaction.perform()`."""
+        if core.perform_observer is not None:
+            # наблюдатель (`metrics.enable()`) замеряет проверки и проведение целиком
+            return transaction.perform()
+        From, To = transaction.From, transaction.To
+        from_shard, to_shard = self.shard_of(From), self.shard_of(To)
+        with locked(From, To):
+            if from_shard == to_shard:
+                result = self.submit(from_shard, partial(_execute, transaction)).result()
+            else:
+                result = self.submit(from_shard, partial(_reserve, transaction)).result()
+                if result:
+                    result = self.submit(to_shard, partial(_credit, transaction)).result()
+                    if not result:
+                        self.submit(from_shard, partial(_release, transaction)).result()
+            if result:
+                transaction._record() # pylint: disable=protected-access
+        return result
+
+    def close(self) -> None:
+        """Дожидается выполнения поставленных задач и останавливает потоки"""
+        for queue in self._queues:
+            queue.put(None)
+        for worker in self._workers:
+            worker.join()
+
+
+# Задачи шардов. Блокировки счетов держит поток, вызвавший `ShardedEngine.perform`.
+
+def _execute(transaction: Transaction) -> BoolWithReason:
+    checks = transaction._check_both_sides() # pylint: disable=protected-access
+    if checks:
+        transaction._apply() # pylint: disable=protected-access
+    return checks
+
+
+def _reserve(transaction: Transaction) -> BoolWithReason:
+    checks = transaction.check_permissions()
+    if checks:
+        transaction.From.balance -= transaction.amount
+        count_withdrawal(transaction.From, transaction.To, transaction.amount,
+                         transaction._timestamp) # pylint: disable=protected-access
+    return checks
+
+
+def _credit(transaction: Transaction) -> BoolWithReason:
+    checks = check_transfer(transaction.To, transaction.From, -transaction.amount,
+                            transaction._timestamp) # pylint: disable=protected-access
+    if checks:
+        transaction.To.balance += transaction.amount
+    return checks
+
+
+def _release(transaction: Transaction) -> None:
+    transaction.From.balance += transaction.amount
+    count_withdrawal(transaction.From, transaction.To, transaction.amount,
+                     transaction._timestamp, -1) # pylint: disable=protected-access
@@ -0,0 +1,184 @@
+"""Потоковая выгрузка истории транзакций в CSV, JSON Lines или Parquet.
+
+История читается страницами по `chunk_size` транзакций (`TransactionsHistory.see`
+с курсором), строки передаются дальше генераторами и пишутся в файл пачками,
+поэтому память не зависит от длины истории — и для истории в памяти,
+и для `sqlite_storage.SQLiteStorage`.
+
+Каждая строка — выписка с точки зрения счёта `account` (как в `show_history`):
+входящие переводы с положительной суммой, исходящие — с отрицательной.
+В выгрузке банка (`bank_rows`) перевод между двумя счетами банка поэтому
+попадает в неё дважды — в выписку каждого из счетов.
+
+Для Parquet нужен pyarrow; без него доступны только CSV и JSON Lines.
+
+Использование:
+```python
+with open('sber.csv', 'w', newline='') as file:
+    write_csv(bank_rows(bank, after=datetime(2023, 1, 1), account_types={'DebitAccount'}), file)
+```
+или из командной строки:
+`python -m src.export --data-dir data --bank Сбер --after 2023-01-01 --type DebitAccount sber.parquet`"""
+
+import argparse
+import csv
+import json
+import os
+from datetime import datetime
+from itertools import islice
+from typing import Any, Collection, Dict, Iterable, Iterator, List, TextIO
+
+from .core import Account, Bank, Transaction, TransactionsHistory
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+FIELDS = ['account', 'account_type', 'id', 'from', 'to', 'amount', 'datetime']
+"""Столбцы выгрузки"""
+
+CHUNK_SIZE = 10_000
+
+Row = Dict[str, Any]
+
+
+def iter_history(history: TransactionsHistory, *, after: datetime | None = None,
+                 before: datetime | None = None,
+                 chunk_size: int = CHUNK_SIZE) -> Iterator[Transaction]:
+    """Транзакции истории от старых к новым (строго между `after` и `before`),
+    прочитанные страницами по `chunk_size`"""
+    cursor = None
+    while True:
+        page = history.see(after=after, before=before, limit=chunk_size, cursor=cursor)
+        yield from page
+        if len(page) < chunk_size:
+            return
+        cursor = TransactionsHistory.cursor(page[-1])
+
+
+def account_rows(account: Account, *, after: datetime | None = None,
+                 before: datetime | None = None, chunk_size: int = CHUNK_SIZE) -> Iterator[Row]:
+    """Строки выписки счёта"""
+    account_id, account_type = str(account.id), type(account).__name__
+    for transaction in iter_history(account.history, after=after, before=before,
+                                    chunk_size=chunk_size):
+        yield {
+            'account': account_id,
+            'account_type': account_type,
+            'id': str(transaction.id),
+            'from': str(transaction.From.id),
+            'to': str(transaction.To.id),
+            'amount': transaction.amount,
+            'datetime': transaction.datetime.isoformat(),
+        }
+
+
+def bank_rows(bank: Bank, *, after: datetime | None = None, before: datetime | None = None,
+              account_types: Collection[str] | None = None,
+              chunk_size: int = CHUNK_SIZE) -> Iterator[Row]:
+    """Строки выписок всех счетов банка (или только счетов типов `account_types`,
+    например `{'DebitAccount', 'CreditAccount'}`), счёт за счётом"""
+    for account in list(bank.accounts.values()):
+        if account_types is None or type(account).__name__ in account_types:
+            yield from account_rows(account, after=after, before=before, chunk_size=chunk_size)
+
+
+def chunks(rows: Iterable[Row], size: int = CHUNK_SIZE) -> Iterator[List[Row]]:
+    """Разбивает поток строк на списки по `size` строк"""
+    iterator = iter(rows)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def write_csv(rows: Iterable[Row], file: TextIO, chunk_size: int = CHUNK_SIZE) -> int:
+    """Пишет строки в CSV с заголовком и возвращает их число.
+    Файл нужно открывать с `newline=''`."""
+    writer = csv.DictWriter(file, FIELDS)
+    writer.writeheader()
+    written = 0
+    for chunk in chunks(rows, chunk_size):
+        writer.writerows(chunk)
+        written += len(chunk)
+    return written
+
+
+def write_jsonl(rows: Iterable[Row], file: TextIO, chunk_size: int = CHUNK_SIZE) -> int:
+    """Пишет строки в JSON Lines (объект на строку) и возвращает их число"""
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    written = 0
+    for chunk in chunks(rows, chunk_size):
+        file.write(''.join(encoder.encode(row) + '\n' for row in chunk))
+        written += len(chunk)
+    return written
+
+
+def write_parquet(rows: Iterable[Row], path: str, chunk_size: int = CHUNK_SIZE) -> int:
+    """Пишет строки в Parquet (группа строк на пачку) и возвращает их число.
+    Время сохраняется как timestamp с точностью до микросекунд."""
+    if pyarrow is None:
+        raise ImportError('Parquet export requires pyarrow')
+    schema = pyarrow.schema([
+        ('account', pyarrow.string()), ('account_type', pyarrow.string()),
+        ('id', pyarrow.string()), ('from', pyarrow.string()), ('to', pyarrow.string()),
+        ('amount', pyarrow.int64()), ('datetime', pyarrow.timestamp('us')),
+    ])
+    written = 0
+    with pyarrow.parquet.ParquetWriter(path, schema) as writer:
+        for chunk in chunks(rows, chunk_size):
+            columns = {field: [row[field] for row in chunk] for field in FIELDS}
+            columns['datetime'] = list(map(datetime.fromisoformat, columns['datetime']))
+            writer.write_table(pyarrow.table(columns, schema=schema))
+            written += len(chunk)
+    return written
+
+
+FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.parquet': 'parquet'}
+
+
+def export(rows: Iterable[Row], path: str, file_format: str | None = None,
+           chunk_size: int = CHUNK_SIZE) -> int:
+    """Пишет строки в файл `path` в формате `file_format` ('csv', 'jsonl', 'parquet';
+    по умолчанию — по расширению файла) и возвращает их число"""
+    if file_format is None:
+        file_format = FORMATS.get(os.path.splitext(path)[1].lower())
+    if file_format == 'parquet':
+        return write_parquet(rows, path, chunk_size)
+    if file_format == 'csv':
+        with open(path, 'w', newline='', encoding='utf-8') as file:
+            return write_csv(rows, file, chunk_size)
+    if file_format == 'jsonl':
+        with open(path, 'w', encoding='utf-8') as file:
+            return write_jsonl(rows, file, chunk_size)
+    raise ValueError('Unknown export format')
+
+
+def main():
+    # pylint: disable=missing-function-docstring
+    from .persistence import open_server_state # pylint: disable=import-outside-toplevel
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    parser.add_argument('output')
+    parser.add_argument('--data-dir', default=os.environ.get('BANK_DATA_DIR', 'data'))
+    parser.add_argument('--bank', required=True)
+    parser.add_argument('--format', choices=sorted(set(FORMATS.values())))
+    parser.add_argument('--after', type=datetime.fromisoformat)
+    parser.add_argument('--before', type=datetime.fromisoformat)
+    parser.add_argument('--type', action='append', dest='account_types',
+                        help='тип счёта (можно указать несколько раз)')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    server_state = open_server_state(args.data_dir)
+    try:
+        rows = bank_rows(server_state.banks[args.bank], after=args.after, before=args.before,
+                         account_types=args.account_types, chunk_size=args.chunk_size)
+        print(export(rows, args.output, args.format, args.chunk_size), 'rows written')
+    finally:
+        server_state.journal.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,280 @@
+"""HTTP-сервер для JSON-интерфейса из `json_bridge.py` — для клиентов, которые ходят не через Telegram.
+
+Запросы:
+    POST /client/<команда>     — команды `ClientCommands`, токен клиента в заголовке `X-Client-Token`
+    POST /superuser/<команда>  — команды `SuperuserCommands`, ключ суперпользователя
+                                 в заголовке `X-Superuser-Key` (для `update_client`
+                                 ещё нужен `X-Client-Token`)
+    GET /metrics               — метрики Prometheus, если включены (`--metrics`)
+
+Тело запроса — JSON-объект с аргументами команды или массив таких объектов:
+тогда команды выполняются по порядку, а в ответе массив результатов.
+Заголовок `Idempotency-Key` у запроса с одной командой работает как её ключ
+`idempotency_key` (см. `idempotency.py`): повтор запроса не проведёт операцию дважды.
+
+Соединения по умолчанию keep-alive (HTTP/1.1). Можно отправлять запросы конвейером,
+не дожидаясь ответов: они выполняются и получают ответы строго по порядку.
+
+Запуск: `python -m src.http_server [--port 8080] [--data-dir data] [--superuser-key KEY] [--metrics]`
+(ключ можно передать и через $BANK_SUPERUSER_KEY; без ключа команды суперпользователя недоступны)."""
+
+import argparse
+import asyncio
+import hmac
+import json
+import logging
+import os
+from datetime import date, datetime
+from http import HTTPStatus
+from typing import Any, Callable, Dict, List, Tuple
+from uuid import UUID
+
+from . import metrics
+from .async_bridge import AsyncCommands
+from .json_bridge import ServerState
+
+
+_logger = logging.getLogger(__name__)
+
+MAX_HEADER_SIZE = 16 * 1024
+MAX_BODY_SIZE = 16 * 1024 * 1024
+WRITE_BUFFER_LIMIT = 256 * 1024
+"""Сколько байт ответов можно накопить в буфере сокета, прежде чем ждать клиента"""
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+try:
+    import orjson
+
+    def dumps(value: Any) -> bytes:
+        """Сериализует ответ в JSON (UUID и datetime — строками)"""
+        return orjson.dumps(value, default=_default) # pylint: disable=no-member
+
+    loads: Callable[[bytes], Any] = orjson.loads # pylint: disable=no-member
+
+except ImportError:
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=_default)
+
+    def dumps(value: Any) -> bytes:
+        """Сериализует ответ в JSON (UUID и datetime — строками)"""
+        return _encoder.encode(value).encode()
+
+    loads = json.loads
+
+
+class HTTPError(Exception):
+    """Ошибка, на которую отвечают статусом `status` вместо результата команды"""
+    def __init__(self, status: HTTPStatus, message: str | None = None):
+        super().__init__(message or status.phrase)
+        self.status = status
+        self.message = message or status.phrase
+
+
+class Request:
+    """Разобранный HTTP-запрос"""
+    __slots__ = ('method', 'path', 'version', 'headers', 'body')
+
+    def __init__(self, method: str, path: str, version: str,
+                 headers: Dict[str, str], body: bytes):
+        self.method = method
+        self.path = path
+        self.version = version
+        self.headers = headers
+        self.body = body
+
+    @property
+    def keep_alive(self) -> bool:
+        """Оставлять ли соединение открытым после ответа"""
+        connection = self.headers.get('connection', '').lower()
+        if self.version == 'HTTP/1.0':
+            return connection == 'keep-alive'
+        return connection != 'close'
+
+
+async def read_request(reader: asyncio.StreamReader) -> Request | None:
+    """Читает один запрос из потока. Возвращает None, если клиент закрыл соединение."""
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError as e:
+        if e.partial.strip():
+            raise HTTPError(HTTPStatus.BAD_REQUEST) from e
+        return None
+    except asyncio.LimitOverrunError as e:
+        raise HTTPError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE) from e
+
+    try:
+        request_line, *header_lines = head[:-4].decode('latin-1').split('\r\n')
+        method, path, version = request_line.split(' ')
+        headers = {}
+        for line in header_lines:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get('content-length', 0))
+    except ValueError as e:
+        raise HTTPError(HTTPStatus.BAD_REQUEST) from e
+
+    if 'chunked' in headers.get('transfer-encoding', ''):
+        raise HTTPError(HTTPStatus.LENGTH_REQUIRED)
+    if not 0 <= length <= MAX_BODY_SIZE:
+        raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+    body = await reader.readexactly(length) if length else b''
+    return Request(method, path, version, headers, body)
+
+
+def render_response(status: HTTPStatus, body: bytes, keep_alive: bool,
+                    content_type: str = 'application/json') -> bytes:
+    """Собирает HTTP-ответ"""
+    return (f'HTTP/1.1 {status.value} {status.phrase}\r\n'
+            f'Content-Type: {content_type}\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            f'Connection: {"keep-alive" if keep_alive else "close"}\r\n'
+            f'\r\n').encode('latin-1') + body
+
+
+class JSONServer:
+    """Асинхронный HTTP-сервер, который передаёт команды в `AsyncCommands`.
+
+    `superuser_key` — секрет для команд суперпользователя;
+    если он None, эти команды отклоняются."""
+
+    def __init__(self, server_state: ServerState, superuser_key: str | None = None,
+                 commands: AsyncCommands | None = None):
+        self.server_state = server_state
+        self.superuser_key = superuser_key
+        self.commands = commands if commands is not None else AsyncCommands(server_state)
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8080) -> asyncio.AbstractServer:
+        """Начинает принимать соединения и возвращает объект сервера asyncio"""
+        return await asyncio.start_server(self.handle_connection, host, port,
+                                          limit=MAX_HEADER_SIZE)
+
+    async def handle_connection(self, reader: asyncio.StreamReader,
+                                writer: asyncio.StreamWriter) -> None:
+        """Обслуживает одно соединение: запросы читаются и выполняются по очереди,
+        а ответы пишутся в сокет без ожидания, пока буфер не переполнится."""
+        try:
+            while True:
+                keep_alive = False
+                content_type = 'application/json'
+                try:
+                    request = await read_request(reader)
+                    if request is None:
+                        break
+                    keep_alive = request.keep_alive
+                    if request.method == 'GET' and request.path == '/metrics':
+                        status, body = HTTPStatus.OK, self.render_metrics()
+                        content_type = metrics.CONTENT_TYPE
+                    else:
+                        status, body = HTTPStatus.OK, dumps(await self.handle(request))
+                except HTTPError as e:
+                    status, body = e.status, dumps({'status': 'error', 'message': e.message})
+                    content_type = 'application/json'
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    raise
+                except Exception: # pylint: disable=broad-except
+                    # ошибка в команде не должна рвать соединение и сбивать порядок ответов
+                    _logger.exception('Request failed')
+                    status = HTTPStatus.INTERNAL_SERVER_ERROR
+                    body = dumps({'status': 'error', 'message': 'Internal server error'})
+                    content_type = 'application/json'
+                writer.write(render_response(status, body, keep_alive, content_type))
+                if not keep_alive:
+                    break
+                if writer.transport.get_write_buffer_size() > WRITE_BUFFER_LIMIT:
+                    await writer.drain()
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def render_metrics() -> bytes:
+        """Метрики в формате Prometheus (см. `metrics.py`), если они включены"""
+        if metrics.registry is None:
+            raise HTTPError(HTTPStatus.NOT_FOUND, 'Metrics are disabled')
+        return metrics.registry.render().encode()
+
+    async def handle(self, request: Request) -> Any:
+        """Выполняет команду (или массив команд) из запроса и возвращает JSON-ответ"""
+        if request.method != 'POST':
+            raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED)
+        run = self._route(request)
+        try:
+            payload = loads(request.body)
+        except ValueError as e:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'Invalid JSON') from e
+
+        if isinstance(payload, list):
+            return [await self._run_one(run, command) for command in payload]
+        idempotency_key = request.headers.get('idempotency-key')
+        if idempotency_key is not None and isinstance(payload, dict):
+            payload.setdefault('idempotency_key', idempotency_key)
+        return await self._run_one(run, payload)
+
+    @staticmethod
+    async def _run_one(run: Callable, command: Any) -> Dict:
+        if not isinstance(command, dict):
+            return {'status': 'error', 'message': 'Command must be a JSON object'}
+        return await run(command)
+
+    def _route(self, request: Request) -> Callable:
+        scope, name = _split_path(request.path)
+        if scope == 'client':
+            client_facade = self._client_facade(request)
+            if client_facade is None:
+                raise HTTPError(HTTPStatus.UNAUTHORIZED, 'Invalid client token')
+            return lambda command: self.commands.client(name, command, client_facade)
+        if scope == 'superuser':
+            key = request.headers.get('x-superuser-key', '')
+            if self.superuser_key is None \
+                    or not hmac.compare_digest(key.encode(), self.superuser_key.encode()):
+                raise HTTPError(HTTPStatus.FORBIDDEN, 'Invalid superuser key')
+            client_facade = self._client_facade(request)
+            return lambda command: self.commands.superuser(name, command, client_facade)
+        raise HTTPError(HTTPStatus.NOT_FOUND)
+
+    def _client_facade(self, request: Request):
+        token = request.headers.get('x-client-token')
+        return None if token is None else self.server_state.get_client_facade_by_token(token)
+
+
+def _split_path(path: str) -> Tuple[str, str]:
+    parts: List[str] = path.split('?', 1)[0].strip('/').split('/')
+    if len(parts) != 2:
+        raise HTTPError(HTTPStatus.NOT_FOUND)
+    return parts[0], parts[1]
+
+
+async def main():
+    # pylint: disable=missing-function-docstring
+    from .persistence import open_server_state # pylint: disable=import-outside-toplevel
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--data-dir', default=os.environ.get('BANK_DATA_DIR', 'data'))
+    parser.add_argument('--superuser-key', default=os.environ.get('BANK_SUPERUSER_KEY'))
+    parser.add_argument('--metrics', action='store_true', help='собирать метрики (GET /metrics)')
+    args = parser.parse_args()
+
+    server_state = open_server_state(args.data_dir)
+    if args.metrics:
+        metrics.enable(server_state)
+    server = await JSONServer(server_state, args.superuser_key).start(args.host, args.port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        server_state.journal.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,158 @@
+"""Ключи идемпотентности для команд, которые двигают деньги.
+
+Telegram и HTTP-клиенты повторяют запрос, если не дождались ответа, и без защиты
+повтор `withdraw` / `deposit` / `transfer` провёл бы операцию второй раз.
+Клиент передаёт в команде ключ `idempotency_key` (любую строку, уникальную для операции);
+результат первого выполнения запоминается в `IdempotencyCache`, а повтор с тем же
+ключом того же клиента возвращает его, не вызывая `perform()` снова.
+Вместе с результатом хранится отпечаток команды (`command_fingerprint`): если ключ
+пришёл с другой командой или другими аргументами, возвращается ошибка,
+а не чужой результат.
+
+Кэш ограничен по размеру (`size`) и по времени (`ttl` секунд с первого выполнения).
+Время — настенное (`time.time`), чтобы срок записи можно было сохранить
+в журнал (`persistence.py`) или в SQLite и восстановить после перезапуска."""
+
+import hashlib
+import json
+from collections import OrderedDict
+from contextlib import nullcontext
+from functools import wraps
+from inspect import signature
+from threading import Lock
+from time import time
+from typing import Any, Callable, Dict, Iterator, Tuple
+from uuid import UUID
+
+CacheKey = Tuple[UUID, str]
+
+KEY_REUSED = {'status': 'error', 'message': 'Idempotency key reused with a different request'}
+
+
+def command_fingerprint(name: str, command: Dict[str, Any]) -> str:
+    """Отпечаток команды: SHA-256 от её имени и аргументов (без самого ключа)"""
+    payload = {field: value for field, value in command.items() if field != 'idempotency_key'}
+    data = json.dumps([name, payload], sort_keys=True, default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+class IdempotencyCache:
+    """Результаты команд (с отпечатками команд) по (id клиента, ключ идемпотентности).
+
+    Хранит не больше `size` записей, каждую — `ttl` секунд. Записи лежат в порядке
+    добавления, а срок у всех одинаковый, поэтому истёкшие всегда в начале
+    и удаляются за O(1) на запись."""
+
+    def __init__(self, size: int = 100_000, ttl: float = 24 * 3600.0):
+        self.size = size
+        self.ttl = ttl
+        self._results: OrderedDict[CacheKey, Tuple[Dict, float, str]] = OrderedDict()
+        self._running: Dict[CacheKey, Lock] = {}
+        self._lock = Lock()
+
+    def get(self, key: CacheKey, fingerprint: str = '') -> Dict | None:
+        """Сохранённый результат или None, если его нет или он истёк.
+        Если результат сохранён для команды с другим отпечатком — `KEY_REUSED`"""
+        entry = self._results.get(key)
+        if entry is None or entry[1] <= time():
+            return None
+        if entry[2] != fingerprint:
+            return dict(KEY_REUSED)
+        return entry[0]
+
+    def put(self, key: CacheKey, result: Dict, expires: float | None = None,
+            fingerprint: str = '') -> float:
+        """Сохраняет результат и возвращает момент, когда он истечёт"""
+        now = time()
+        if expires is None:
+            expires = now + self.ttl
+        with self._lock:
+            if expires > now:
+                self._results[key] = (result, expires, fingerprint)
+            self._evict(now)
+        return expires
+
+    def _evict(self, now: float) -> None:
+        results = self._results
+        while results and (len(results) > self.size or next(iter(results.values()))[1] <= now):
+            results.popitem(last=False)
+
+    def run(self, key: CacheKey, perform: Callable[[], Dict],
+            stored: Callable[[Dict, float], None] | None = None,
+            fingerprint: str = '') -> Dict:
+        """Возвращает сохранённый результат по ключу или выполняет `perform()`
+        и сохраняет его результат (после чего вызывает `stored(result, expires)`).
+
+        Повтор, пришедший, пока первый запрос ещё выполняется, ждёт его результата."""
+        result = self.get(key, fingerprint)
+        if result is not None:
+            return result
+        with self._lock:
+            running = self._running.setdefault(key, Lock())
+        with running:
+            result = self.get(key, fingerprint)
+            if result is not None:
+                return result
+            try:
+                result = perform()
+                expires = self.put(key, result, fingerprint=fingerprint)
+                if stored is not None:
+                    stored(result, expires)
+            finally:
+                with self._lock:
+                    self._running.pop(key, None)
+        return result
+
+    def items(self) -> Iterator[Tuple[CacheKey, Dict, float, str]]:
+        """Неистёкшие записи: (ключ, результат, срок, отпечаток) — для снимков состояния"""
+        now = time()
+        with self._lock:
+            entries = list(self._results.items())
+        for key, (result, expires, command) in entries:
+            if expires > now:
+                yield key, result, expires, command
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+
+def idempotent(command_function: Callable[..., Dict]) -> Callable[..., Dict]:
+    """Декоратор команд клиента из `json_bridge.ClientCommands`.
+
+    Если в команде есть `idempotency_key`, результат берётся из
+    `server_state.idempotency` или сохраняется туда (а также в хранилище банка
+    и журнал, если они есть). Обёртка принимает `server_state`,
+    даже если сама команда его не использует."""
+    takes_server_state = 'server_state' in signature(command_function).parameters
+
+    @wraps(command_function)
+    def wrapper(command: Dict[str, Any], client_facade, server_state=None) -> Dict:
+        def perform() -> Dict:
+            if takes_server_state:
+                return command_function(command, client_facade, server_state)
+            return command_function(command, client_facade)
+
+        key = command.get('idempotency_key')
+        if key is None or server_state is None:
+            return perform()
+
+        client = client_facade.client
+        cache_key = (client.id, str(key))
+        fingerprint = command_fingerprint(command_function.__name__, command)
+
+        def stored(result: Dict, expires: float) -> None:
+            client.bank.storage.command_completed(client, cache_key[1], result, expires,
+                                                  fingerprint)
+            if server_state.journal is not None:
+                server_state.journal.command_completed(client, cache_key[1], result, expires,
+                                                       fingerprint)
+
+        # транзакции команды и её результат попадают в журнал одной операцией
+        journal = server_state.journal
+        with nullcontext() if journal is None else journal.operation():
+            return server_state.idempotency.run(cache_key, perform, stored, fingerprint)
+
+    # сигнатура обёртки (с `server_state`), а не команды: по ней её аргументы
+    # подставляют `AsyncCommands` и `metrics`
+    del wrapper.__wrapped__ # type: ignore
+    return wrapper
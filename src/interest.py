@@ -0,0 +1,130 @@
+"""Начисление процентов по кредитным счетам (`CreditAccount`).
+
+За каждый день с отрицательным балансом со счёта списывается
+`-balance * interest_rate / days_in_year` (округление до целого, половины — вверх).
+Списания проводятся транзакциями на служебный счёт банка `Bank.service_account('interest')`
+без проверки ограничений — как и отмена транзакции, банк списывает проценты безусловно.
+
+Проценты за все счета банка считаются одним векторным проходом:
+балансы и ставки собираются в массивы NumPy (если NumPy не установлен —
+в списки, и расчёт идёт обычным циклом), а транзакции создаются только для
+счетов, с которых действительно нужно что-то списать, и записываются одной
+пачкой (`core.record_many`).
+
+Повторный запуск за ту же или более раннюю дату ничего не списывает: начисление
+идёт по датам вперёд, поэтому в `Bank.interest_accrued` хранится только последняя
+завершённая дата (команда `accrue_interest` сохраняет её в хранилище и журнал
+через `bank_updated`), и повтор завершённого запуска не просматривает счета.
+Проверка и отметка даты выполняются под `Bank.lock` внутри операции журнала.
+Кроме того, id транзакции с процентами вычисляется из id счёта и даты,
+так что прерванный запуск при повторе находит уже проведённые транзакции в `Bank.ledger` и списывает только то, что не успел.
+
+Использование:
+```python
+accrual = InterestAccrual(bank)
+accrual.run(date(2023, 5, 1))
+```"""
+
+from contextlib import nullcontext
+from datetime import date, datetime, time
+from itertools import islice
+from operator import attrgetter
+from typing import Any, Dict, List
+from uuid import uuid5
+
+from .core import Bank, CreditAccount, Transaction, locked, record_many
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+SERVICE_ACCOUNT = 'interest'
+
+_balance = attrgetter('balance')
+
+
+class InterestAccrual:
+    """Начисляет проценты по всем кредитным счетам банка.
+
+    Список кредитных счетов и их ставки кэшируются: при каждом запуске
+    просматриваются только счета, открытые после предыдущего."""
+
+    def __init__(self, bank: Bank, days_in_year: int = 365):
+        self.bank = bank
+        self.days_in_year = days_in_year
+        self._accounts: List[CreditAccount] = []
+        self._rates: Any = []
+        self._seen = 0
+
+    def _refresh(self) -> None:
+        new = [account for account in islice(self.bank.accounts.values(), self._seen, None)
+               if isinstance(account, CreditAccount)]
+        self._seen = len(self.bank.accounts)
+        if not new:
+            return
+        self._accounts.extend(new)
+        rates = [float(account.interest_rate) for account in self._accounts]
+        self._rates = rates if numpy is None else numpy.array(rates, dtype=numpy.float64)
+
+    def charges(self, days: int = 1) -> List[int]:
+        """Проценты за `days` дней для каждого кредитного счёта при текущих балансах
+        (в том же порядке, что и `accounts`)"""
+        self._refresh()
+        factor = days / self.days_in_year
+        if numpy is None:
+            return [int(-balance * rate * factor + 0.5) if balance < 0 else 0
+                    for balance, rate in zip(map(_balance, self._accounts), self._rates)]
+        balances = numpy.fromiter(map(_balance, self._accounts), dtype=numpy.float64,
+                                  count=len(self._accounts))
+        debt = numpy.maximum(-balances, 0)
+        return numpy.floor(debt * self._rates * factor + 0.5).astype(numpy.int64).tolist()
+
+    @property
+    def accounts(self) -> List[CreditAccount]:
+        """Кредитные счета банка, известные на момент последнего расчёта"""
+        return self._accounts
+
+    def run(self, on: date, days: int = 1) -> Dict[str, Any]:
+        """Списывает проценты за `days` дней, заканчивающихся датой `on`.
+        Транзакции датируются концом дня `on`.
+
+        Возвращает число счетов с начисленными процентами (`charged`),
+        общую сумму (`total`) и число счетов, пропущенных,
+        потому что за эту дату проценты уже списаны (`skipped`).
+        Запуск за дату не позже последней начисленной ничего не списывает."""
+        journal = self.bank.journal
+        # проверка и отметка даты — под блокировкой банка, иначе два одновременных
+        # запуска за одну дату оба спишут проценты
+        with journal.operation() if journal is not None else nullcontext(), self.bank.lock:
+            last = self.bank.interest_accrued
+            if last is not None and on <= last:
+                self._refresh()
+                return {'date': on, 'charged': 0, 'skipped': len(self._accounts), 'total': 0}
+
+            service = self.bank.service_account(SERVICE_ACCOUNT)
+            moment = datetime.combine(on, time(23, 59, 59))
+            key = 'interest ' + on.isoformat()
+            skipped = 0
+            transactions: List[Transaction] = []
+            amounts = self.charges(days)
+            for account, amount in zip(self._accounts[:len(amounts)], amounts):
+                if amount <= 0:
+                    continue
+                transaction_id = uuid5(account.id, key)
+                if transaction_id in self.bank.ledger:
+                    skipped += 1
+                    continue
+                transaction = Transaction(account, service, amount)
+                transaction.id = transaction_id
+                transaction.datetime = moment
+                transactions.append(transaction)
+
+            with locked(service, *(transaction.From for transaction in transactions)):
+                for transaction in transactions:
+                    transaction._apply() # pylint: disable=protected-access
+                record_many(transactions)
+            self.bank.interest_accrued = on
+        return {'date': on, 'charged': len(transactions), 'skipped': skipped,
+                'total': sum(transaction.amount for transaction in transactions)}
@@ -5,43 +5,125 @@
 Есть словарь всех банков и словарь всех клиентов,
 которые в будущем можно заменить на БД."""
 
-from datetime import date
-from typing import Dict
+from contextlib import nullcontext
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterator, Tuple
 from uuid import UUID, uuid4
 
-from .core import Bank, Client, ClientFacade
+from .clearing import ClearingHouse
+from .core import Bank, Client, ClientFacade, Storage, Transaction, TransactionsHistory
+from .idempotency import IdempotencyCache, idempotent
+from .interest import InterestAccrual
+from .sessions import FacadeCache, SessionStore, hash_token
 
 
 class BankDict(Dict[str, Bank]):
     """Словарь, чтобы находить банки по названию.
     Может проксировать доступ к БД."""
 
-class ClientFacadeDict(Dict[UUID, ClientFacade]):
+class ClientFacadeDict:
     """Словарь, чтобы находить клиентов по токену.
 
-    В будущем имеет смысл давать клиентам пароли вместо токенов,
-    сохранять их хеши на диск, а также использовать сессионные куки."""
+    Сами токены не хранятся: ключ — их хеш (`sessions.hash_token`), значение — id клиента,
+    а объекты `ClientFacade` создаются по требованию и кэшируются (`sessions.FacadeCache`).
+
+    Снаружи выглядит как словарь токен -> ClientFacade:
+    `client_facades[token] = facade`, `client_facades[token]`, `token in client_facades`."""
+
+    def __init__(self, cache: FacadeCache | None = None):
+        self.clients: Dict[UUID, Client] = {}
+        self.token_hashes: Dict[bytes, UUID] = {}
+        self.cache = cache if cache is not None else FacadeCache()
+
+    def add_hash(self, token_hash: bytes, client: Client) -> None:
+        """Регистрирует токен клиента по его хешу"""
+        self.clients[client.id] = client
+        self.token_hashes[token_hash] = client.id
+
+    def client_id(self, token: UUID | str) -> UUID | None:
+        """id клиента по токену или None"""
+        try:
+            return self.token_hashes.get(hash_token(token))
+        except ValueError:
+            return None
+
+    def facade(self, client_id: UUID) -> ClientFacade:
+        """ClientFacade клиента по его id"""
+        return self.cache.get(self.clients[client_id])
+
+    def __setitem__(self, token: UUID | str, client_facade: ClientFacade) -> None:
+        self.add_hash(hash_token(token), client_facade.client)
+
+    def __getitem__(self, token: UUID | str) -> ClientFacade:
+        client_id = self.client_id(token)
+        if client_id is None:
+            raise KeyError(token)
+        return self.facade(client_id)
+
+    def __contains__(self, token: object) -> bool:
+        return isinstance(token, (UUID, str)) and self.client_id(token) is not None
+
+    def __len__(self) -> int:
+        return len(self.token_hashes)
+
+    def hashed_items(self) -> Iterator[Tuple[bytes, Client]]:
+        """Пары (хеш токена, клиент)"""
+        for token_hash, client_id in list(self.token_hashes.items()):
+            yield token_hash, self.clients[client_id]
 
 class ServerState:
     """Словари банков и клиентов с токенами.
     Нужно инициализировать при запуске сервера — как и Flask() / aiogram.Bot().
 
-    На данный момент они нигде не хранятся, но теоретически могут быть на диске."""
-    def __init__(self):
+    Сами словари хранятся в памяти. Чтобы состояние переживало перезапуск,
+    его нужно создавать через `persistence.open_server_state`:
+    тогда в поле `journal` будет журнал, куда записываются все изменения.
+
+    `storage` — хранилище, которое получают новые банки (см. `core.Storage`).
+    `sessions` — сессии авторизованных клиентов (см. `sessions.SessionStore`).
+    `idempotency` — результаты команд с ключом идемпотентности (см. `idempotency.py`).
+    `interest` — начисление процентов по банкам (`interest.InterestAccrual` по id банка),
+    чтобы список кредитных счетов не собирался заново при каждом запуске.
+    `clearing` — клиринговая палата сервера (см. `clearing.py`); сюда восстанавливается
+    очередь межбанковских переводов, а банки подключаются через `clearing.attach`."""
+    def __init__(self, storage: Storage | None = None):
         self.banks = BankDict()
         self.client_facades = ClientFacadeDict()
+        self.sessions = SessionStore()
+        self.idempotency = IdempotencyCache()
+        self.interest: Dict[UUID, InterestAccrual] = {}
+        self.clearing = ClearingHouse()
+        self.storage = storage if storage is not None else Storage()
+        self.journal: Any = None
 
     def get_client_facade_by_token(self, token: str) -> ClientFacade | None:
         """Возвращает клиента по токену или None, если такого токена нет"""
-        try:
-            return self.client_facades[UUID(token)]
-        except (KeyError, ValueError):
+        client_id = self.client_facades.client_id(token)
+        return None if client_id is None else self.client_facades.facade(client_id)
+
+    def open_session(self, token: str, previous: str | None = None) -> str | None:
+        """Авторизует клиента по токену и возвращает id новой сессии
+        (None, если такого токена нет). Прошлая сессия `previous` закрывается."""
+        client_id = self.client_facades.client_id(token)
+        return None if client_id is None else self.sessions.open(client_id, previous)
+
+    def get_client_facade_by_session(self, session_id: str | None) -> ClientFacade | None:
+        """Возвращает клиента по id сессии или None, если сессии нет или она истекла"""
+        if session_id is None or (client_id := self.sessions.resolve(session_id)) is None:
             return None
-            # KeyError: нет такого токена
-            # ValueError: неверный формат токена
+        return self.client_facades.facade(client_id)
 
+    def find_transaction(self, transaction_id: UUID) -> Transaction | None:
+        """Ищет транзакцию по id в реестрах всех банков"""
+        for bank in self.banks.values():
+            if (transaction := bank.ledger.get(transaction_id)) is not None:
+                return transaction
+        return None
 
 
+WINDOWS = {'hour': timedelta(hours=1), 'day': timedelta(days=1)}
+"""Названия окон для `SuperuserCommands.set_withdrawal_limit`"""
+
 
 class SuperuserCommands:
     """Namespace for commands such as 'create_bank'
@@ -54,16 +136,24 @@ class SuperuserCommands:
         и опциональным ключом `unathorized_withdrawal_limit`"""
 
         if 'unathorized_withdrawal_limit' in command:
-            bank = Bank(int(command['unathorized_withdrawal_limit']))
+            bank = Bank(int(command['unathorized_withdrawal_limit']), server_state.storage)
         else:
-            bank = Bank()
-        server_state.banks[command['name']] = bank
+            bank = Bank(storage=server_state.storage)
+        journal = server_state.journal
+        bank.journal = journal
+        # в операции журнала, чтобы снимок не застал банк в словаре без записи о нём
+        with nullcontext() if journal is None else journal.operation():
+            server_state.banks[command['name']] = bank
+            server_state.storage.bank_created(command['name'], bank)
+            if journal is not None:
+                journal.bank_created(command['name'], bank)
         return {'status': 'ok', 'message': 'Created bank ' + command['name']}
 
 
     @staticmethod
     def create_client(command: Dict[str, str], server_state: ServerState) -> Dict:
-        """Создаёт клиента и записывает его в словарь client_facades.
+        """Создаёт клиента и записывает хеш его токена в словарь client_facades.
+        Сам токен возвращается только в ответе.
 
         Принимает на вход JSON с обязательными ключами `bank`, `name`, `surname`
         и опциональными ключами `passport`, `address`.
@@ -71,11 +161,16 @@ class SuperuserCommands:
         Возвращает JSON с ключами `status`, `message` и `client_token`"""
 
         bank = server_state.banks[command['bank']]
-        client = Client(bank, command['name'], command['surname'],
-                        command.get('passport'), command.get('address'))
-        client_facade = ClientFacade(client)
         client_token = uuid4()
-        server_state.client_facades[client_token] = client_facade
+        token_hash = hash_token(client_token)
+        journal = server_state.journal
+        with nullcontext() if journal is None else journal.operation():
+            client = Client(bank, command['name'], command['surname'],
+                            command.get('passport'), command.get('address'))
+            server_state.client_facades.add_hash(token_hash, client)
+            bank.storage.token_issued(token_hash, client)
+            if journal is not None:
+                journal.token_issued(token_hash, client)
         return {'status': 'ok', 'message': 'Created client', 'client_token': client_token}
 
 
@@ -88,36 +183,105 @@ class SuperuserCommands:
         for key, value in command.items():
             if key in ['name', 'surname', 'passport', 'address']:
                 setattr(client, key, value)
+        client.bank.storage.client_updated(client)
+        if client.bank.journal is not None:
+            client.bank.journal.client_updated(client)
         return {'status': 'ok', 'message': 'Now client is ' + str(vars(client))}
 
 
     @staticmethod
-    def cancel_transaction(command: Dict[str, str], client_facade: ClientFacade) -> Dict:
+    def cancel_transaction(command: Dict[str, str], server_state: ServerState) -> Dict:
         """Отменяет транзакцию по её идентификатору.
-        Принимает на вход JSON с ключами `transaction_id` и `account_id`.
+        Принимает на вход JSON с ключом `transaction_id`.
 
-        `account_id` и `client_token`, который тоже должен быть в запросе,
-        нужны для того, чтобы найти транзакцию
-        (сейчас нет единого реестра транзакций)."""
+        Транзакция ищется в реестрах банков (`Bank.ledger`),
+        поэтому ни счёт, ни токен клиента не нужны.
+        Перевод через клиринг можно отменить, только пока он в очереди (`ClearingHouse.cancel`)."""
 
         try:
             transaction_id = UUID(command['transaction_id'])
-            account_id = UUID(command['account_id'])
-            account = client_facade.client.accounts[account_id]
-            transaction = account.history[transaction_id]
-            result = transaction.cancel()
+            transaction = server_state.find_transaction(transaction_id)
+            if transaction is None:
+                return {'status': 'error', 'message': 'Transaction not found'}
+            # переводы через клиринг отменяет палата: списание на корреспондентский счёт
+            # нельзя просто развернуть, не убрав перевод из очереди
+            clearing = transaction.From.client.bank.clearing or server_state.clearing
+            result = clearing.cancel(transaction)
             assert result
             return {'status': 'ok', 'message': 'Canceled transaction ' + str(transaction_id)}
-        except KeyError as e:
-            return {'status': 'error', 'message': str(e)}
+        except KeyError:
+            return {'status': 'error', 'message': 'No transaction id in request'}
+        except ValueError:
+            return {'status': 'error', 'message': 'Invalid transaction id'}
         except AssertionError:
             return {'status': 'error', 'message': repr(result)} # type: ignore
 
+    @staticmethod
+    def accrue_interest(command: Dict[str, str], server_state: ServerState) -> Dict:
+        """Списывает проценты по кредитным счетам банка (см. `interest.py`).
+        Принимает JSON с ключом `bank` и опциональным ключом `date` в формате 'YYYY-MM-DD'
+        (по умолчанию — сегодня). Повторный вызов за ту же дату ничего не списывает."""
+        try:
+            name = command['bank']
+            bank = server_state.banks[name]
+            on = date.fromisoformat(command['date']) if 'date' in command else date.today()
+        except KeyError:
+            return {'status': 'error', 'message': 'Bank not found'}
+        except ValueError:
+            return {'status': 'error', 'message': 'Invalid date'}
+        accrual = server_state.interest.get(bank.id)
+        if accrual is None:
+            accrual = server_state.interest[bank.id] = InterestAccrual(bank)
+        journal = server_state.journal
+        # отметка о дате пишется в той же операции журнала и под той же блокировкой,
+        # что и списания, — иначе более старая отметка может лечь в журнал позже новой
+        with journal.operation() if journal is not None else nullcontext(), bank.lock:
+            last = bank.interest_accrued
+            result = accrual.run(on)
+            if bank.interest_accrued != last:
+                server_state.storage.bank_updated(name, bank)
+                if journal is not None:
+                    journal.bank_updated(name, bank)
+        return {'status': 'ok', 'message': f'Charged {result["charged"]} accounts', **result}
+
+    @staticmethod
+    def set_withdrawal_limit(command: Dict, server_state: ServerState) -> Dict:
+        """Устанавливает лимит банка на сумму снятий за скользящее окно (см. `core.WithdrawalLimits`).
+        Принимает JSON с ключами `bank`, `scope` ('client' или 'account'),
+        `window` ('hour', 'day' или число секунд), `amount` (null — снять лимит)
+        и опциональным `unverified_only` (по умолчанию true — только для клиентов без документов).
+        Возвращает все лимиты банка."""
+        try:
+            name = command['bank']
+            bank = server_state.banks[name]
+        except KeyError:
+            return {'status': 'error', 'message': 'Bank not found'}
+        try:
+            window = command['window']
+            window = WINDOWS[window] if window in WINDOWS else timedelta(seconds=int(window))
+            amount = command.get('amount')
+            bank.withdrawal_limits.set(command['scope'], window,
+                                       None if amount is None else int(amount),
+                                       bool(command.get('unverified_only', True)))
+        except KeyError as e:
+            return {'status': 'error', 'message': f'No {e.args[0]} in request'}
+        except (TypeError, ValueError) as e:
+            return {'status': 'error', 'message': str(e) or 'Invalid limit'}
+        server_state.storage.bank_updated(name, bank)
+        if server_state.journal is not None:
+            server_state.journal.bank_updated(name, bank)
+        return {'status': 'ok', 'message': 'Limits updated', 'limits': bank.withdrawal_limits.info()}
 
 
 class ClientCommands:
     """Namespace for commands such as 'create_account',
-    that are performed by ordinary clients"""
+    that are performed by ordinary clients.
+
+    Команды, которые двигают деньги (`withdraw`, `deposit`, `transfer`, `transfer_batch`),
+    принимают опциональный ключ `idempotency_key`: повтор команды с тем же ключом
+    возвращает результат первого выполнения (см. `idempotency.py`).
+    Если перевод не прошёл проверки, в ответе есть список кодов причин `codes`
+    (см. `core.PermissionFailure`)."""
 
     @staticmethod
     def create_account(command: Dict, client_facade: ClientFacade) -> Dict:
@@ -129,6 +293,7 @@ class ClientCommands:
 
         `kwargs` может содержать ключи: 
             - для DepositAccount: `end_date` в формате 'YYYY-MM-DD'
+              и `payout_account_id` — счёт, куда перевести вклад после окончания
             - для CreditAccount: `credit_limit` и `interest_rate` (в долях единицы)"""
         try:
             account_type = command['account_type']
@@ -136,6 +301,8 @@ class ClientCommands:
             if 'end_date' in kwargs:
                 year, month, day = kwargs['end_date'].split('-')
                 kwargs['end_date'] = date(int(year), int(month), int(day))
+            if kwargs.get('payout_account_id') is not None:
+                kwargs['payout_account_id'] = UUID(kwargs['payout_account_id'])
             account = client_facade.create_account(account_type, **kwargs)
             return {'status': 'ok', 'message': 'Created account', 'info': account.info()}
         except KeyError:
@@ -146,6 +313,7 @@ class ClientCommands:
             return {'status': 'error', 'message': str(e)}
 
     @staticmethod
+    @idempotent
     def withdraw(command: Dict[str, str], client_facade: ClientFacade) -> Dict:
         """Снимает деньги со счёта, передавая вызов в ClientFacade.
         Принимает на вход JSON с ключами `account_id` и `amount`"""
@@ -158,9 +326,11 @@ class ClientCommands:
         except KeyError:
             return {'status': 'error', 'message': 'No account id or amount in request'}
         except AssertionError:
-            return {'status': 'error', 'message': repr(result)} # type: ignore
+            return {'status': 'error', 'message': repr(result),
+                    'codes': list(result.codes)} # type: ignore
 
     @staticmethod
+    @idempotent
     def deposit(command: Dict[str, str], client_facade: ClientFacade) -> Dict:
         """Пополняет счёт, передавая вызов в ClientFacade.
         Принимает на вход JSON с ключами `account_id` и `amount`"""
@@ -175,9 +345,11 @@ class ClientCommands:
         except ValueError:
             return {'status': 'error', 'message': 'Invalid amount / account id'}
         except AssertionError:
-            return {'status': 'error', 'message': repr(result)} # type: ignore
+            return {'status': 'error', 'message': repr(result),
+                    'codes': list(result.codes)} # type: ignore
 
     @staticmethod
+    @idempotent
     def transfer(command: Dict[str, str],
                  client_facade: ClientFacade, server_state: ServerState) -> Dict:
         """Переводит деньги с одного счёта на другой, передавая вызов в ClientFacade.
@@ -199,7 +371,43 @@ class ClientCommands:
         except ValueError:
             return {'status': 'error', 'message': 'Invalid amount / account id'}
         except AssertionError:
-            return {'status': 'error', 'message': repr(result)} # type: ignore
+            return {'status': 'error', 'message': repr(result),
+                    'codes': list(result.codes)} # type: ignore
+
+    @staticmethod
+    @idempotent
+    def transfer_batch(command: Dict, client_facade: ClientFacade,
+                       server_state: ServerState) -> Dict:
+        """Выполняет пачку переводов, передавая вызов в ClientFacade.transfer_batch.
+
+        Принимает JSON с ключом `transfers` — списком объектов с теми же ключами,
+        что у команды `transfer`, — и опциональным ключом `atomic`
+        (если true, то переводы выполняются либо все, либо ни одного).
+
+        Возвращает список `results` со статусом каждого перевода."""
+        try:
+            transfers = []
+            for i, item in enumerate(command['transfers']):
+                try:
+                    transfers.append((UUID(item['from_account_id']), UUID(item['to_account_id']),
+                                      int(item['amount']),
+                                      server_state.banks.get(item.get('to_bank_name'))))
+                except (KeyError, ValueError, TypeError):
+                    return {'status': 'error', 'message': f'Invalid transfer #{i}'}
+            results = client_facade.transfer_batch(transfers, bool(command.get('atomic', False)))
+            succeeded = sum(map(bool, results))
+            return {
+                'status': 'ok' if succeeded == len(results) else 'error',
+                'message': f'Transferred {succeeded} of {len(results)}',
+                'results': [{'status': 'ok', 'message': ''} if result
+                            else {'status': 'error', 'message': repr(result),
+                                  'codes': list(result.codes)}
+                            for result in results],
+            }
+        except KeyError:
+            return {'status': 'error', 'message': 'No transfers in request'}
+        except TypeError:
+            return {'status': 'error', 'message': 'Transfers must be a list'}
 
     @staticmethod
     def show_accounts(_command: Dict, client_facade: ClientFacade) -> Dict:
@@ -208,16 +416,60 @@ class ClientCommands:
         accounts_info = [account.info() for account in accounts]
         return {'status': 'ok', 'message': '', 'accounts': accounts_info}
 
+    @staticmethod
+    def show_stats(command: Dict[str, str], client_facade: ClientFacade) -> Dict:
+        """Отдаёт сводку операций (число, суммы списаний и зачислений — всего и за сегодня,
+        время последней операции) по счёту `account_id` или, если он не указан, по клиенту"""
+        try:
+            account_id = UUID(command['account_id']) if 'account_id' in command else None
+            stats = client_facade.get_stats(account_id)
+            return {'status': 'ok', 'message': '', 'stats': stats.info()}
+        except ValueError as e:
+            return {'status': 'error', 'message': str(e)}
+
+    @staticmethod
+    def show_balance(command: Dict[str, str], client_facade: ClientFacade) -> Dict:
+        """Отдаёт баланс счёта `account_id` на момент `datetime` (в формате ISO)"""
+        try:
+            account_id = UUID(command['account_id'])
+            moment = datetime.fromisoformat(command['datetime'])
+            balance = client_facade.get_balance_at(account_id, moment)
+            return {'status': 'ok', 'message': '', 'balance': balance}
+        except KeyError as e:
+            return {'status': 'error', 'message': f'No {e.args[0]} in request'}
+        except ValueError as e:
+            return {'status': 'error', 'message': str(e)}
+
     @staticmethod
     def show_history(command: Dict[str, str], client_facade: ClientFacade) -> Dict:
         """Отдаёт список транзакций (id, from, to, amount, datetime [ISO]).
 
-        Принимает JSON с обязательным полем `account_id`."""
+        Принимает JSON с обязательным полем `account_id`
+        и опциональными полями:
+            - `after`, `before`: границы по времени в формате ISO
+            - `limit`: размер страницы
+            - `cursor`: значение `next_cursor` из ответа на предыдущий запрос
+
+        Если указан `limit`, в ответе есть поле `next_cursor`
+        (None, если транзакций больше нет)."""
         try:
             account_id = UUID(command['account_id'])
-            history = client_facade.get_account_history(account_id)
-            history_json = [transaction.info() for transaction in history]
-            return {'status': 'ok', 'message': '', 'history': history_json}
+            after = datetime.fromisoformat(command['after']) if 'after' in command else None
+            before = datetime.fromisoformat(command['before']) if 'before' in command else None
+            limit = int(command['limit']) if 'limit' in command else None
+            if limit is not None and limit < 1:
+                return {'status': 'error', 'message': 'Limit must be positive'}
+            history = client_facade.get_account_history(
+                account_id, after=after, before=before, cursor=command.get('cursor'),
+                limit=None if limit is None else limit + 1)
+            answer: Dict[str, Any] = {'status': 'ok', 'message': ''}
+            if limit is not None:
+                has_more = len(history) > limit
+                history = history[:limit]
+                answer['next_cursor'] = TransactionsHistory.cursor(history[-1]) \
+                    if has_more and history else None
+            answer['history'] = [transaction.info() for transaction in history]
+            return answer
         except KeyError:
             return {'status': 'error', 'message': 'No account id in request'}
         except ValueError as e:
@@ -0,0 +1,115 @@
+"""Выплата вкладов (`DepositAccount`), срок которых закончился.
+
+Вклады, срок которых истёк к дате `today`, достаются из очереди банка
+`Bank.maturities` (куча по `end_date`), поэтому ежедневный запуск стоит O(k log n),
+где k — число закончившихся вкладов, а не O(число счетов).
+
+Остаток вклада переводится на счёт клиента `payout_account_id`
+(если он не задан или не принадлежит клиенту — снимается наличными),
+после чего клиенту отправляется уведомление.
+
+Вклады с нулевым остатком пропускаются, поэтому повторный запуск
+(например, после перезапуска, когда очередь заполняется заново) ничего не выплачивает дважды.
+
+Использование в боте:
+```python
+scheduler = MaturityScheduler(server_state, notify)
+asyncio.create_task(scheduler.run_daily())
+```"""
+
+import asyncio
+from datetime import date, datetime, time, timedelta
+from typing import Awaitable, Callable, Dict, List
+
+from .core import Account, Bank, BoolWithReason, Client, DepositAccount, Transaction
+from .json_bridge import ServerState
+
+
+Notify = Callable[[Client, str], Awaitable[None]]
+
+
+class Payout:
+    """Результат выплаты одного вклада"""
+    __slots__ = ('deposit', 'target', 'amount', 'result')
+
+    def __init__(self, deposit: DepositAccount, target: Account, amount: int,
+                 result: BoolWithReason):
+        self.deposit = deposit
+        self.target = target
+        self.amount = amount
+        self.result = result
+
+    def message(self) -> str:
+        """Текст уведомления для клиента"""
+        if self.result:
+            return (f'Срок вклада {self.deposit} закончился, '
+                    f'{self.amount} переведено на счёт {self.target}')
+        return (f'Срок вклада {self.deposit} закончился, '
+                f'но перевести {self.amount} не удалось: {self.result.reason.strip()}')
+
+
+def payout_target(deposit: DepositAccount) -> Account:
+    """Счёт, на который выплачивается вклад"""
+    client = deposit.client
+    target = client.accounts.get(deposit.payout_account_id) \
+        if deposit.payout_account_id is not None else None
+    return target if target is not None else client.default_cash_account
+
+
+def pay_out(bank: Bank, today: date, batch_size: int = 1000) -> List[Payout]:
+    """Выплачивает вклады банка, срок которых истёк к `today`.
+    Вклады достаются из очереди пачками по `batch_size`.
+    Вклады, которые не удалось выплатить, возвращаются в очередь до следующего запуска."""
+    payouts = []
+    failed = []
+    while batch := bank.maturities.pop_matured(today, batch_size):
+        for deposit in batch:
+            amount = deposit.balance
+            if amount <= 0:
+                continue
+            target = payout_target(deposit)
+            result = Transaction(deposit, target, amount).perform()
+            payouts.append(Payout(deposit, target, amount, result))
+            if not result:
+                failed.append(deposit)
+    for deposit in failed:
+        bank.maturities.add(deposit)
+    return payouts
+
+
+class MaturityScheduler:
+    """Раз в день выплачивает закончившиеся вклады всех банков и уведомляет клиентов.
+    `notify(client, text)` — корутина, которая отправляет клиенту сообщение (например, в бот)."""
+
+    def __init__(self, server_state: ServerState, notify: Notify | None = None,
+                 at: time = time(0, 5), batch_size: int = 1000):
+        self.server_state = server_state
+        self.notify = notify
+        self.at = at
+        self.batch_size = batch_size
+
+    def run(self, today: date) -> Dict[str, List[Payout]]:
+        """Выплачивает вклады всех банков; возвращает выплаты по названиям банков"""
+        return {name: pay_out(bank, today, self.batch_size)
+                for name, bank in list(self.server_state.banks.items())}
+
+    async def run_once(self, today: date) -> List[Payout]:
+        """То же, что `run`, но в пуле потоков, и с уведомлением клиентов"""
+        loop = asyncio.get_running_loop()
+        payouts = [payout for bank_payouts in
+                   (await loop.run_in_executor(None, self.run, today)).values()
+                   for payout in bank_payouts]
+        if self.notify is not None:
+            for payout in payouts:
+                await self.notify(payout.deposit.client, payout.message())
+        return payouts
+
+    async def run_daily(self) -> None:
+        """Выплачивает вклады сразу и затем каждый день во время `at`"""
+        while True:
+            await self.run_once(date.today())
+            now = datetime.now()
+            next_run = datetime.combine(now.date(), self.at)
+            if next_run <= now:
+                next_run += timedelta(days=1)
+            await asyncio.sleep((next_run - now).total_seconds())
@@ -0,0 +1,265 @@
+"""Метрики производительности в текстовом формате Prometheus.
+
+По умолчанию выключены и ничего не стоят: команды не обёрнуты,
+а `Transaction.perform` проверяет только, что `core.perform_observer is None`.
+
+После `enable()` собираются:
+    - bank_commands_total{scope, command, status} и bank_command_seconds{scope, command} —
+      число и длительность вызовов каждой команды `ClientCommands` / `SuperuserCommands`
+    - bank_transactions_total{result} и bank_transaction_perform_seconds{phase} —
+      число транзакций и длительность `Transaction.perform` отдельно для проверок (checks)
+      и проведения (apply)
+    - bank_permission_failures_total{code} — коды причин отказов (`core.PermissionFailure.code`)
+    - bank_history_size — распределение размеров историй счетов (считается при чтении метрик)
+
+Использование:
+```python
+registry = metrics.enable(server_state)   # до создания AsyncCommands / серверов
+metrics.serve(9100)                       # GET http://127.0.0.1:9100/metrics
+...
+metrics.disable()
+```
+Метрики также отдаёт `http_server` по `GET /metrics`."""
+
+from bisect import bisect_left
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+from . import core
+from .core import BoolWithReason, Transaction
+from .json_bridge import ClientCommands, ServerState, SuperuserCommands
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4,
+                   1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (0, 1, 10, 100, 1000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple) -> str:
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(str(value))}"'
+                          for name, value in zip(names, values)) + '}'
+
+
+def _format_number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Счётчик с метками"""
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values: Dict[Tuple, int] = {}
+        self._lock = Lock()
+
+    def inc(self, *label_values: Any, amount: int = 1) -> None:
+        """Увеличивает счётчик с данными значениями меток"""
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def get(self, *label_values: Any) -> int:
+        """Текущее значение счётчика"""
+        return self._values.get(label_values, 0)
+
+    def render(self) -> Iterator[str]:
+        """Строки в формате Prometheus"""
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} counter'
+        with self._lock:
+            values = list(self._values.items())
+        for label_values, value in values:
+            yield f'{self.name}{_format_labels(self.labels, label_values)} {value}'
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами корзин"""
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self._series: Dict[Tuple, List] = {}
+        """метки -> [счётчики по корзинам (последняя — +Inf), сумма, количество]"""
+        self._lock = Lock()
+
+    def observe(self, value: float, *label_values: Any) -> None:
+        """Добавляет наблюдение"""
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *label_values: Any) -> int:
+        """Число наблюдений с данными значениями меток"""
+        series = self._series.get(label_values)
+        return 0 if series is None else series[2]
+
+    def render(self) -> Iterator[str]:
+        """Строки в формате Prometheus"""
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} histogram'
+        with self._lock:
+            series = [(labels, (list(counts), total, count))
+                      for labels, (counts, total, count) in self._series.items()]
+        names = self.labels + ('le',)
+        for label_values, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(names, label_values + (_format_number(bound),))
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = _format_labels(self.labels, label_values)
+            yield f'{self.name}_sum{labels} {_format_number(total)}'
+            yield f'{self.name}_count{labels} {count}'
+
+
+class Metrics:
+    """Набор метрик приложения.
+    `server_state` нужен только для размеров историй; без него они не считаются."""
+
+    def __init__(self, server_state: ServerState | None = None):
+        self.server_state = server_state
+        self.commands = Counter('bank_commands_total', 'Command calls by result status',
+                                ('scope', 'command', 'status'))
+        self.command_seconds = Histogram('bank_command_seconds', 'Command latency',
+                                         ('scope', 'command'))
+        self.transactions = Counter('bank_transactions_total',
+                                    'Transaction.perform calls by result', ('result',))
+        self.perform_seconds = Histogram('bank_transaction_perform_seconds',
+                                         'Transaction.perform latency by phase', ('phase',))
+        self.failures = Counter('bank_permission_failures_total',
+                                'Rejected transactions by reason code', ('code',))
+
+    def observe_perform(self, transaction: Transaction) -> BoolWithReason:
+        """Выполняет `transaction.perform()` (блокировки уже захвачены), замеряя фазы"""
+        start = perf_counter()
+        checks = transaction._check_both_sides() # pylint: disable=protected-access
+        checked = perf_counter()
+        self.perform_seconds.observe(checked - start, 'checks')
+        if not checks:
+            self.transactions.inc('rejected')
+            self.failed(checks)
+            return checks
+        result = transaction._perform_without_checking_permissions() # pylint: disable=protected-access
+        self.perform_seconds.observe(perf_counter() - checked, 'apply')
+        self.transactions.inc('ok')
+        return result
+
+    def failed(self, result: BoolWithReason) -> None:
+        """Учитывает коды причин неуспешного результата (`core.PermissionFailure.code`).
+        Текст причин в метку не идёт: в нём суммы и лимиты, и число рядов росло бы без предела.
+        Результат без кодов учитывается как 'other'."""
+        for code in result.codes or ('other',):
+            self.failures.inc(code)
+
+    def history_sizes(self) -> Histogram:
+        """Гистограмма размеров историй всех счетов (строится заново при каждом вызове)"""
+        histogram = Histogram('bank_history_size', 'Transactions in account history',
+                              buckets=SIZE_BUCKETS)
+        if self.server_state is not None:
+            for bank in list(self.server_state.banks.values()):
+                for account in list(bank.accounts.values()):
+                    histogram.observe(len(account.history))
+        return histogram
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        lines: List[str] = []
+        for metric in (self.commands, self.command_seconds, self.transactions,
+                       self.perform_seconds, self.failures, self.history_sizes()):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry: Metrics | None = None
+"""Включённые метрики или None"""
+
+_originals: List[Tuple[type, str, Any]] = []
+
+
+def _timed(function: Callable, scope: str, name: str, metrics: Metrics) -> Callable:
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        try:
+            result = function(*args, **kwargs)
+        except Exception:
+            metrics.commands.inc(scope, name, 'exception')
+            raise
+        finally:
+            metrics.command_seconds.observe(perf_counter() - start, scope, name)
+        metrics.commands.inc(scope, name, result.get('status', '')
+                             if isinstance(result, dict) else '')
+        return result
+    return wrapper
+
+
+def enable(server_state: ServerState | None = None) -> Metrics:
+    """Включает сбор метрик и возвращает их набор (повторный вызов возвращает тот же)"""
+    global registry # pylint: disable=global-statement
+    if registry is not None:
+        return registry
+    registry = Metrics(server_state)
+    for namespace, scope in ((ClientCommands, 'client'), (SuperuserCommands, 'superuser')):
+        for name, attribute in list(vars(namespace).items()):
+            if isinstance(attribute, staticmethod):
+                _originals.append((namespace, name, attribute))
+                setattr(namespace, name,
+                        staticmethod(_timed(attribute.__func__, scope, name, registry)))
+    core.perform_observer = registry
+    return registry
+
+
+def disable() -> None:
+    """Выключает сбор метрик и возвращает команды в исходный вид"""
+    global registry # pylint: disable=global-statement
+    core.perform_observer = None
+    while _originals:
+        namespace, name, attribute = _originals.pop()
+        setattr(namespace, name, attribute)
+    registry = None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self): # pylint: disable=invalid-name,missing-function-docstring
+        if self.path != '/metrics' or registry is None:
+            self.send_error(404)
+            return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        pass
+
+
+def serve(port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+    """Отдаёт метрики по `GET /metrics` из фонового потока.
+    Чтобы остановить, вызовите `.shutdown()` у возвращённого сервера."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    Thread(target=server.serve_forever, daemon=True, name='metrics').start()
+    return server
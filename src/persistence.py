@@ -0,0 +1,528 @@
+"""Сохранение состояния сервера на диск: журнал упреждающей записи (WAL) и снимки.
+
+Каждое изменение (новый банк, клиент, счёт, токен, проведённая транзакция,
+результат команды с ключом идемпотентности, перевод в очереди клиринга)
+дописывается в бинарный журнал.
+Раз в `snapshot_every` записей всё состояние сохраняется в снимок,
+а старые сегменты журнала удаляются. Снимок снимается только между операциями
+(см. `Persistence.operation`): иначе в него попали бы балансы, изменённые
+транзакцией, записи которой ещё не дописаны в журнал, и при восстановлении
+эти транзакции применились бы второй раз.
+При запуске читается снимок и дописанный после него хвост журнала.
+
+Формат записи: `<длина: uint32><тип: uint8><данные><crc32: uint32>`.
+Транзакции (самые частые записи) кодируются структурой фиксированного размера,
+остальные события — JSON-ом.
+
+Использование:
+```python
+server_state = open_server_state('data')
+...
+server_state.journal.close()
+```"""
+
+import inspect
+import json
+import os
+import struct
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import date
+from threading import Condition, Lock, RLock, local
+from typing import Any, BinaryIO, Dict, Iterator, List, Tuple, Type
+from uuid import UUID
+
+from .clearing import Transfer
+from .core import Account, Bank, Client, Transaction
+from .json_bridge import ServerState
+
+
+BANK_CREATED = 1
+CLIENT_CREATED = 2
+CLIENT_UPDATED = 3
+ACCOUNT_CREATED = 4
+TOKEN_ISSUED = 5
+TRANSACTION = 6
+BALANCE = 7
+SNAPSHOT_HEADER = 8
+BANK_UPDATED = 9
+COMMAND_COMPLETED = 10
+TRANSFER_QUEUED = 11
+TRANSFER_DEQUEUED = 12
+
+_HEADER = struct.Struct('<IB')
+_CRC = struct.Struct('<I')
+_TRANSACTION = struct.Struct('<16s16s16sqq')
+
+
+def encode_value(value: Any) -> Any:
+    """`default` для json.dumps: кодирует даты и UUID в параметрах счетов"""
+    if isinstance(value, date):
+        return {'$date': value.isoformat()}
+    if isinstance(value, UUID):
+        return {'$uuid': str(value)}
+    raise TypeError(f'Cannot encode {value!r}')
+
+
+def decode_value(obj: Dict) -> Any:
+    """`object_hook` для json.loads, обратный к `encode_value`"""
+    if '$date' in obj:
+        return date.fromisoformat(obj['$date'])
+    if '$uuid' in obj:
+        return UUID(obj['$uuid'])
+    return obj
+
+
+def _frame(record_type: int, payload: bytes) -> bytes:
+    body = bytes([record_type]) + payload
+    return _HEADER.pack(len(payload), record_type) + payload + _CRC.pack(zlib.crc32(body))
+
+
+def _json_frame(record_type: int, data: Dict) -> bytes:
+    return _frame(record_type, json.dumps(data, default=encode_value).encode())
+
+
+def read_records(file: BinaryIO) -> Iterator[Tuple[int, bytes]]:
+    """Читает записи из файла до конца или до первой повреждённой записи
+    (недописанный хвост после падения просто отбрасывается)."""
+    while True:
+        header = file.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            return
+        length, record_type = _HEADER.unpack(header)
+        payload = file.read(length)
+        crc = file.read(_CRC.size)
+        if len(payload) < length or len(crc) < _CRC.size \
+                or _CRC.unpack(crc)[0] != zlib.crc32(bytes([record_type]) + payload):
+            return
+        yield record_type, payload
+
+
+class WriteAheadLog:
+    """Файл журнала, в который записи только дописываются.
+
+    Каждая запись сразу передаётся ОС (переживает падение процесса),
+    а fsync делается пачками (group commit): когда накопилось `group_size` записей
+    или прошло `group_interval` секунд с прошлого fsync.
+    Так при отказе питания теряется не больше одной пачки,
+    а пропускная способность не упирается в скорость fsync."""
+
+    def __init__(self, path: str, *, group_size: int = 64, group_interval: float = 0.01):
+        self.path = path
+        self.group_size = group_size
+        self.group_interval = group_interval
+        self._file = open(path, 'ab') # pylint: disable=consider-using-with
+        self._lock = Lock()
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def append(self, frame: bytes) -> None:
+        """Дописывает запись и при необходимости делает fsync всей пачки"""
+        with self._lock:
+            self._file.write(frame)
+            self._file.flush()
+            self._pending += 1
+            if self._pending >= self.group_size \
+                    or time.monotonic() - self._last_sync >= self.group_interval:
+                self._sync()
+
+    def sync(self) -> None:
+        """Принудительно сбрасывает накопленные записи на диск"""
+        with self._lock:
+            self._sync()
+
+    def _sync(self) -> None:
+        if self._pending:
+            os.fsync(self._file.fileno())
+            self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def close(self) -> None:
+        with self._lock:
+            self._sync()
+            self._file.close()
+
+
+def account_kwargs(account: Account) -> Dict[str, Any]:
+    """Параметры конструктора счёта, по которым его можно создать заново.
+    Берутся из одноимённых полей счёта."""
+    parameters = list(inspect.signature(type(account).__init__).parameters)[2:]
+    return {name: getattr(account, name) for name in parameters}
+
+
+class Persistence:
+    """Журнал изменений `ServerState` со снимками.
+
+    Подключается к банкам как `Bank.journal` и получает от них события.
+    Файлы в папке `directory`:
+        - `snapshot.bin` — последний снимок состояния
+        - `wal-NNNNNN.log` — сегменты журнала; в снимок входят все сегменты
+            с номером не больше записанного в его заголовке
+
+    Операции, которые меняют балансы и пишут транзакции в журнал, выполняются
+    внутри `operation()` (его захватывает `core.locked`). Когда набирается
+    `snapshot_every` записей, `_append` только отмечает, что снимок нужен,
+    а снимает его последняя завершившаяся операция; новые операции на это время ждут."""
+
+    def __init__(self, directory: str, *, group_size: int = 64,
+                 group_interval: float = 0.01, snapshot_every: int = 100_000):
+        self.directory = directory
+        self.group_size = group_size
+        self.group_interval = group_interval
+        self.snapshot_every = snapshot_every
+        self.server_state: ServerState | None = None
+        self._wal: WriteAheadLog | None = None
+        self._segment = 0
+        self._records_since_snapshot = 0
+        self._lock = RLock() # журнал, номер сегмента и счётчик записей
+        self._idle = Condition(Lock()) # операции и снимки (см. `operation`)
+        self._operations = 0
+        self._snapshotting = False
+        self._snapshot_due = False
+        self._thread = local() # глубина вложенности операций потока и их записи
+        os.makedirs(directory, exist_ok=True)
+
+    # Загрузка
+
+    def open(self) -> ServerState:
+        """Восстанавливает состояние из снимка и журнала и начинает записывать изменения"""
+        server_state = ServerState()
+        restorer = _Restorer(server_state)
+
+        covered_segment = 0
+        snapshot_path = os.path.join(self.directory, 'snapshot.bin')
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, 'rb') as file:
+                for record_type, payload in read_records(file):
+                    if record_type == SNAPSHOT_HEADER:
+                        covered_segment = json.loads(payload)['segment']
+                    else:
+                        restorer.apply(record_type, payload)
+
+        for segment in self._segments():
+            if segment <= covered_segment:
+                os.remove(self._segment_path(segment))
+                continue
+            with open(self._segment_path(segment), 'rb') as file:
+                for record_type, payload in read_records(file):
+                    restorer.apply(record_type, payload)
+                    self._records_since_snapshot += 1
+            self._segment = segment
+
+        self._segment = max(self._segment, covered_segment) + 1
+        self._wal = self._open_segment(self._segment)
+
+        self.server_state = server_state
+        server_state.journal = self
+        for bank in server_state.banks.values():
+            bank.journal = self
+        return server_state
+
+    def _segments(self) -> List[int]:
+        return sorted(int(name[4:-4]) for name in os.listdir(self.directory)
+                      if name.startswith('wal-') and name.endswith('.log'))
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f'wal-{segment:06d}.log')
+
+    def _open_segment(self, segment: int) -> WriteAheadLog:
+        return WriteAheadLog(self._segment_path(segment), group_size=self.group_size,
+                             group_interval=self.group_interval)
+
+    # Снимки
+
+    @contextmanager
+    def operation(self) -> Iterator[None]:
+        """Блок, внутри которого не снимается снимок (вложенные блоки допустимы).
+
+        Транзакции, изменения банков, очереди клиринга и результаты команд, записанные
+        внутри операции, копятся и дописываются в журнал одним вызовом `write` при выходе
+        из внешнего блока: падение процесса не оставит в журнале транзакцию без результата
+        команды (или отметку о начислении процентов без самих списаний).
+        Новые банки, клиенты и счета пишутся сразу, чтобы в журнале они всегда шли раньше транзакций, которые на них ссылаются.
+
+        Если снимок уже нужен, новая операция ждёт, пока завершатся текущие
+        и последняя из них его снимет."""
+        thread = self._thread
+        depth = getattr(thread, 'depth', 0)
+        if depth == 0:
+            with self._idle:
+                while self._snapshotting or (self._snapshot_due and self._operations):
+                    self._idle.wait()
+                self._operations += 1
+            thread.frames = []
+        thread.depth = depth + 1
+        try:
+            yield
+        finally:
+            thread.depth = depth
+            if depth == 0:
+                frames, thread.frames = thread.frames, []
+                if frames:
+                    with self._lock:
+                        assert self._wal is not None, 'Persistence is not opened'
+                        self._wal.append(b''.join(frames))
+                with self._idle:
+                    self._operations -= 1
+                    last = self._operations == 0
+                    if last:
+                        self._idle.notify_all()
+                if last and self._snapshot_due:
+                    self._snapshot(only_if_due=True)
+
+    def snapshot(self) -> None:
+        """Сохраняет всё состояние в снимок и удаляет вошедшие в него сегменты журнала.
+        Ждёт завершения текущих операций (`operation`), поэтому внутри них не вызывается.
+
+        Снимок сначала пишется во временный файл и атомарно переименовывается,
+        поэтому падение в любой момент оставляет либо старый, либо новый снимок."""
+        assert not getattr(self._thread, 'depth', 0), 'Snapshot inside an operation'
+        self._snapshot(only_if_due=False)
+
+    def _snapshot(self, only_if_due: bool) -> None:
+        with self._idle:
+            while self._snapshotting or self._operations:
+                self._idle.wait()
+            if only_if_due and not self._snapshot_due:
+                return
+            self._snapshotting = True
+        try:
+            with self._lock:
+                self._write_snapshot()
+        finally:
+            with self._idle:
+                self._snapshotting = False
+                self._idle.notify_all()
+
+    def _write_snapshot(self) -> None:
+        assert self.server_state is not None and self._wal is not None
+        self._wal.close()
+        covered_segment = self._segment
+        self._segment += 1
+        self._wal = self._open_segment(self._segment)
+
+        snapshot_path = os.path.join(self.directory, 'snapshot.bin')
+        with open(snapshot_path + '.tmp', 'wb') as file:
+            file.write(_json_frame(SNAPSHOT_HEADER, {'segment': covered_segment}))
+            for frame in _snapshot_frames(self.server_state):
+                file.write(frame)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(snapshot_path + '.tmp', snapshot_path)
+
+        for segment in self._segments():
+            if segment <= covered_segment:
+                os.remove(self._segment_path(segment))
+        self._records_since_snapshot = 0
+        self._snapshot_due = False
+
+    def close(self) -> None:
+        """Сбрасывает журнал на диск и закрывает его"""
+        with self._lock:
+            if self._wal is not None:
+                self._wal.close()
+                self._wal = None
+
+    def _append(self, frame: bytes, buffered: bool = False) -> None:
+        in_operation = getattr(self._thread, 'depth', 0) > 0
+        with self._lock:
+            assert self._wal is not None, 'Persistence is not opened'
+            if buffered and in_operation:
+                self._thread.frames.append(frame)
+            else:
+                self._wal.append(frame)
+            self._records_since_snapshot += 1
+            if self._records_since_snapshot >= self.snapshot_every:
+                self._snapshot_due = True
+        # вне операций снимок можно снять сразу
+        if self._snapshot_due and not in_operation:
+            self._snapshot(only_if_due=True)
+
+    # События от ServerState и банков
+
+    def bank_created(self, name: str, bank: Bank) -> None:
+        self._append(_json_frame(BANK_CREATED, _bank_data(name, bank)))
+
+    def bank_updated(self, name: str, bank: Bank) -> None:
+        self._append(_json_frame(BANK_UPDATED, _bank_data(name, bank)), buffered=True)
+
+    def client_created(self, client: Client) -> None:
+        self._append(_json_frame(CLIENT_CREATED, _client_data(client)))
+
+    def client_updated(self, client: Client) -> None:
+        self._append(_json_frame(CLIENT_UPDATED, _client_data(client)))
+
+    def account_created(self, account: Account) -> None:
+        self._append(_json_frame(ACCOUNT_CREATED, _account_data(account)))
+
+    def token_issued(self, token_hash: bytes, client: Client) -> None:
+        self._append(_json_frame(TOKEN_ISSUED, {'token_hash': token_hash.hex(),
+                                                'client': str(client.id)}))
+
+    def transaction_recorded(self, transaction: Transaction) -> None:
+        self._append(_frame(TRANSACTION, _transaction_payload(transaction)), buffered=True)
+
+    def command_completed(self, client: Client, key: str, result: Dict, expires: float,
+                          fingerprint: str) -> None:
+        self._append(_json_frame(COMMAND_COMPLETED,
+                                 _command_data(client.id, key, result, expires, fingerprint)),
+                     buffered=True)
+
+    def transfer_queued(self, transaction: Transaction) -> None:
+        self._append(_json_frame(TRANSFER_QUEUED, _transfer_data(
+            transaction.id, (transaction.From, transaction.To, transaction.amount))),
+                     buffered=True)
+
+    def transfer_dequeued(self, transfer_id: UUID) -> None:
+        self._append(_json_frame(TRANSFER_DEQUEUED, {'id': str(transfer_id)}), buffered=True)
+
+
+def _bank_data(name: str, bank: Bank) -> Dict:
+    return {'id': str(bank.id), 'name': name,
+            'unathorized_withdrawal_limit': bank.unathorized_withdrawal_limit,
+            'withdrawal_limits': bank.withdrawal_limits.info(),
+            'interest_accrued': bank.interest_accrued}
+
+
+def _client_data(client: Client) -> Dict:
+    return {'id': str(client.id), 'bank': str(client.bank.id),
+            'name': client.name, 'surname': client.surname,
+            'passport': client.passport, 'address': client.address,
+            'cash_account': str(client.default_cash_account.id)}
+
+
+def _account_data(account: Account) -> Dict:
+    return {'id': str(account.id), 'client': str(account.client.id),
+            'type': type(account).__name__, 'kwargs': account_kwargs(account)}
+
+
+def _command_data(client_id: UUID, key: str, result: Dict, expires: float,
+                  fingerprint: str) -> Dict:
+    return {'client': str(client_id), 'key': key, 'result': result, 'expires': expires,
+            'fingerprint': fingerprint}
+
+
+def _transfer_data(transfer_id: UUID, transfer: Transfer) -> Dict:
+    From, To, amount = transfer
+    return {'id': str(transfer_id), 'from': str(From.id), 'to': str(To.id), 'amount': amount}
+
+
+def _transaction_payload(transaction: Transaction) -> bytes:
+    return _TRANSACTION.pack(transaction.id.bytes, transaction.From.id.bytes,
+                             transaction.To.id.bytes, transaction.amount,
+                             transaction._timestamp) # pylint: disable=protected-access
+
+
+def _snapshot_frames(server_state: ServerState) -> Iterator[bytes]:
+    transactions: Dict[UUID, Transaction] = {}
+    for name, bank in server_state.banks.items():
+        yield _json_frame(BANK_CREATED, _bank_data(name, bank))
+    for bank in server_state.banks.values():
+        clients = {account.client for account in bank.accounts.values()}
+        for client in clients:
+            yield _json_frame(CLIENT_CREATED, _client_data(client))
+        for account in bank.accounts.values():
+            if account is not account.client.default_cash_account:
+                yield _json_frame(ACCOUNT_CREATED, _account_data(account))
+        for transaction in bank.ledger:
+            transactions[transaction.id] = transaction
+    for token_hash, client in server_state.client_facades.hashed_items():
+        yield _json_frame(TOKEN_ISSUED, {'token_hash': token_hash.hex(),
+                                         'client': str(client.id)})
+    for transaction in sorted(transactions.values()):
+        yield _frame(TRANSACTION, _transaction_payload(transaction))
+    for bank in server_state.banks.values():
+        for account in bank.accounts.values():
+            yield _json_frame(BALANCE, {'id': str(account.id), 'balance': account.balance})
+    for (client_id, key), result, expires, fingerprint in server_state.idempotency.items():
+        yield _json_frame(COMMAND_COMPLETED,
+                          _command_data(client_id, key, result, expires, fingerprint))
+    clearings = {id(clearing): clearing for clearing in
+                 [server_state.clearing, *(bank.clearing for bank in server_state.banks.values())]
+                 if clearing is not None}
+    for clearing in clearings.values():
+        for transfer_id, transfer in clearing.transfers():
+            yield _json_frame(TRANSFER_QUEUED, _transfer_data(transfer_id, transfer))
+
+
+class _Restorer:
+    """Применяет записи журнала к восстанавливаемому `ServerState`"""
+
+    def __init__(self, server_state: ServerState):
+        self.server_state = server_state
+        self.banks: Dict[UUID, Bank] = {}
+        self.clients: Dict[UUID, Client] = {}
+        self.accounts: Dict[UUID, Account] = {}
+        self.account_types: Dict[str, Type[Account]] = \
+            {cls.__name__: cls for cls in Account.__subclasses__()}
+
+    def apply(self, record_type: int, payload: bytes) -> None:
+        if record_type == TRANSACTION:
+            self._transaction(payload)
+            return
+        data = json.loads(payload, object_hook=decode_value)
+        if record_type == BANK_CREATED:
+            bank = Bank(data['unathorized_withdrawal_limit'])
+            bank.id = UUID(data['id'])
+            bank.withdrawal_limits.load(data.get('withdrawal_limits', []))
+            bank.interest_accrued = data.get('interest_accrued')
+            self.banks[bank.id] = bank
+            self.server_state.banks[data['name']] = bank
+        elif record_type == BANK_UPDATED:
+            bank = self.banks[UUID(data['id'])]
+            bank.unathorized_withdrawal_limit = data['unathorized_withdrawal_limit']
+            bank.withdrawal_limits.load(data['withdrawal_limits'])
+            bank.interest_accrued = data['interest_accrued']
+        elif record_type == CLIENT_CREATED:
+            self._client_created(data)
+        elif record_type == CLIENT_UPDATED:
+            client = self.clients[UUID(data['id'])]
+            for key in ['name', 'surname', 'passport', 'address']:
+                setattr(client, key, data[key])
+        elif record_type == ACCOUNT_CREATED:
+            client = self.clients[UUID(data['client'])]
+            account = self.account_types[data['type']](client, **data['kwargs'])
+            account.id = UUID(data['id'])
+            client._add_account(account) # pylint: disable=protected-access
+            self.accounts[account.id] = account
+        elif record_type == TOKEN_ISSUED:
+            client = self.clients[UUID(data['client'])]
+            self.server_state.client_facades.add_hash(bytes.fromhex(data['token_hash']), client)
+        elif record_type == BALANCE:
+            self.accounts[UUID(data['id'])].balance = data['balance']
+        elif record_type == COMMAND_COMPLETED:
+            self.server_state.idempotency.put((UUID(data['client']), data['key']),
+                                              data['result'], data['expires'],
+                                              data['fingerprint'])
+        elif record_type == TRANSFER_QUEUED:
+            self.server_state.clearing._put( # pylint: disable=protected-access
+                UUID(data['id']), (self.accounts[UUID(data['from'])],
+                                   self.accounts[UUID(data['to'])], data['amount']))
+        elif record_type == TRANSFER_DEQUEUED:
+            self.server_state.clearing._take(UUID(data['id'])) # pylint: disable=protected-access
+
+    def _client_created(self, data: Dict) -> None:
+        bank = self.banks[UUID(data['bank'])]
+        client = Client(bank, data['name'], data['surname'], data['passport'], data['address'])
+        client.id = UUID(data['id'])
+
+        cash_account = client.default_cash_account
+        client._rekey_account(cash_account, UUID(data['cash_account'])) # pylint: disable=protected-access
+
+        self.clients[client.id] = client
+        self.accounts[cash_account.id] = cash_account
+
+    def _transaction(self, payload: bytes) -> None:
+        transaction_id, from_id, to_id, amount, timestamp = _TRANSACTION.unpack(payload)
+        transaction = Transaction(self.accounts[UUID(bytes=from_id)],
+                                  self.accounts[UUID(bytes=to_id)], amount)
+        transaction._id = UUID(bytes=transaction_id).int # pylint: disable=protected-access
+        transaction._timestamp = timestamp # pylint: disable=protected-access
+        transaction._perform_without_checking_permissions() # pylint: disable=protected-access
+
+
+def open_server_state(directory: str, **kwargs) -> ServerState:
+    """Создаёт `Persistence` в папке `directory` и восстанавливает из неё `ServerState`.
+    Параметры `kwargs` передаются в конструктор `Persistence`."""
+    return Persistence(directory, **kwargs).open()
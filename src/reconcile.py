@@ -0,0 +1,186 @@
+"""Сверка (аудит) банка: проверка инвариантов по всем счетам.
+
+Проверяется, что
+    - `balance`: баланс счёта равен сумме изменений по его истории;
+    - `mirror`: каждая транзакция из истории счёта есть и в истории второй стороны,
+      причём с противоположной суммой (`Transaction.mirror`);
+    - `ledger`: каждая транзакция из истории есть в реестре банка (`Bank.ledger`);
+    - `conservation`: деньги не появляются и не исчезают — сумма балансов всех счетов банка
+      (вместе с `CashAccount`) равна сумме переводов из других банков за вычетом переводов в них.
+
+Счета делятся на части по `partition_size`, и части проверяются параллельно
+в пуле процессов. Процессы создаются через fork и получают банк в наследство
+(хранилище заново открывает соединения, см. `Storage.reopen`), поэтому
+данные между процессами не копируются. Расхождения отдаются по мере того,
+как части проверены: `discrepancies()` — генератор, `run(file)` пишет их в JSON Lines.
+
+Сверку нужно запускать, когда банк не обслуживает клиентов (например, ночью):
+транзакции, проведённые во время сверки, могут дать ложные расхождения.
+
+Запуск: `python -m src.reconcile --bank Сбер [--processes 8] [--report report.jsonl]`"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List, TextIO, Tuple
+from uuid import UUID
+
+from .core import Account, Bank
+from .export import iter_history
+
+Discrepancy = Dict[str, Any]
+PartitionResult = Tuple[List[Discrepancy], int, int, int]
+
+_bank: Bank | None = None
+"""Банк, который проверяют процессы пула (наследуется при fork)"""
+
+
+def check_account(account: Account,
+                  chunk_size: int = 10_000) -> Tuple[List[Discrepancy], int, int]:
+    """Проверяет счёт. Возвращает расхождения, число записей в истории
+    и сумму переводов из других банков за вычетом переводов в них"""
+    discrepancies: List[Discrepancy] = []
+    bank = account.client.bank
+    total = external = entries = 0
+    for view in iter_history(account.history, chunk_size=chunk_size):
+        entries += 1
+        other = view.From
+        if other is account:
+            continue
+        total += view.amount
+        if other.client.bank is not bank:
+            external += view.amount
+        transaction_id = view.id
+        try:
+            counterpart = other.history[transaction_id].amount
+        except KeyError:
+            counterpart = None
+        if counterpart != -view.amount:
+            discrepancies.append({'check': 'mirror', 'account': str(account.id),
+                                  'transaction': str(transaction_id),
+                                  'expected': -view.amount, 'actual': counterpart})
+        if transaction_id not in bank.ledger:
+            discrepancies.append({'check': 'ledger', 'account': str(account.id),
+                                  'transaction': str(transaction_id)})
+    if account.balance != total:
+        discrepancies.append({'check': 'balance', 'account': str(account.id),
+                              'expected': total, 'actual': account.balance})
+    return discrepancies, entries, external
+
+
+def _check_partition(account_ids: List[UUID]) -> PartitionResult:
+    """Проверяет часть счетов банка `_bank`"""
+    assert _bank is not None
+    discrepancies: List[Discrepancy] = []
+    entries = balances = external = 0
+    for account_id in account_ids:
+        account = _bank.accounts[account_id]
+        found, account_entries, account_external = check_account(account)
+        discrepancies.extend(found)
+        entries += account_entries
+        balances += account.balance
+        external += account_external
+    return discrepancies, entries, balances, external
+
+
+def _init_worker() -> None:
+    assert _bank is not None
+    _bank.storage.reopen()
+
+
+class Reconciler:
+    """Сверка одного банка.
+
+    `processes` — число процессов (0 — проверять в текущем процессе,
+    так же будет, если fork недоступен); `partition_size` — счетов в одной части."""
+
+    def __init__(self, bank: Bank, *, processes: int | None = None, partition_size: int = 1000):
+        self.bank = bank
+        self.processes = (os.cpu_count() or 1) if processes is None else processes
+        self.partition_size = partition_size
+        self.summary: Dict[str, int] = {}
+
+    def partitions(self) -> Iterator[List[UUID]]:
+        """Id счетов банка, разбитые на части"""
+        account_ids = list(self.bank.accounts)
+        for start in range(0, len(account_ids), self.partition_size):
+            yield account_ids[start:start + self.partition_size]
+
+    def _results(self) -> Iterator[PartitionResult]:
+        global _bank # pylint: disable=global-statement
+        if self.processes <= 0 or 'fork' not in multiprocessing.get_all_start_methods():
+            _bank = self.bank
+            try:
+                yield from map(_check_partition, self.partitions())
+            finally:
+                _bank = None
+            return
+
+        self.bank.storage.flush()
+        _bank = self.bank
+        try:
+            with ProcessPoolExecutor(self.processes, initializer=_init_worker,
+                                     mp_context=multiprocessing.get_context('fork')) as pool:
+                futures = [pool.submit(_check_partition, partition)
+                           for partition in self.partitions()]
+                for future in as_completed(futures):
+                    yield future.result()
+        finally:
+            _bank = None
+
+    def discrepancies(self) -> Iterator[Discrepancy]:
+        """Расхождения по мере проверки частей, в конце — проверка сохранения денег.
+        После того как генератор исчерпан, в `summary` лежат итоги сверки."""
+        summary = {'accounts': len(self.bank.accounts), 'entries': 0, 'discrepancies': 0}
+        balances = external = 0
+        for found, entries, partition_balances, partition_external in self._results():
+            summary['entries'] += entries
+            summary['discrepancies'] += len(found)
+            balances += partition_balances
+            external += partition_external
+            yield from found
+        if balances != external:
+            summary['discrepancies'] += 1
+            yield {'check': 'conservation', 'expected': external, 'actual': balances}
+        self.summary = summary
+
+    def run(self, report: TextIO) -> Dict[str, int]:
+        """Пишет расхождения в `report` (по объекту JSON на строку) и возвращает итоги"""
+        for discrepancy in self.discrepancies():
+            report.write(json.dumps(discrepancy, ensure_ascii=False) + '\n')
+            report.flush()
+        return self.summary
+
+
+def main():
+    # pylint: disable=missing-function-docstring
+    from .persistence import open_server_state # pylint: disable=import-outside-toplevel
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    parser.add_argument('--data-dir', default=os.environ.get('BANK_DATA_DIR', 'data'))
+    parser.add_argument('--bank', required=True)
+    parser.add_argument('--processes', type=int)
+    parser.add_argument('--partition-size', type=int, default=1000)
+    parser.add_argument('--report', help='файл для расхождений (по умолчанию — stdout)')
+    args = parser.parse_args()
+
+    server_state = open_server_state(args.data_dir)
+    try:
+        reconciler = Reconciler(server_state.banks[args.bank], processes=args.processes,
+                                partition_size=args.partition_size)
+        if args.report is None:
+            summary = reconciler.run(sys.stdout)
+        else:
+            with open(args.report, 'w', encoding='utf-8') as report:
+                summary = reconciler.run(report)
+        print(summary, file=sys.stderr)
+    finally:
+        server_state.journal.close()
+    sys.exit(1 if summary['discrepancies'] else 0)
+
+
+if __name__ == '__main__':
+    main()
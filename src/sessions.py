@@ -0,0 +1,115 @@
+"""Токены, сессии и кэш `ClientFacade`.
+
+Токены клиентов нигде не хранятся в открытом виде: в памяти, журнале и SQLite
+лежит только их SHA-256 (`hash_token`), а индекс ведёт от хеша к id клиента.
+
+После авторизации клиент получает короткий id сессии (`SessionStore`).
+Его и нужно хранить в состоянии диалога (FSM): это строка, поэтому состояние
+можно держать во внешнем хранилище, а поиск клиента по сессии — одно обращение к словарю.
+Сессии живут в памяти и истекают через `ttl` секунд без обращений.
+
+Объекты `ClientFacade` создаются по требованию и кэшируются (`FacadeCache`, LRU с TTL)."""
+
+import secrets
+from collections import OrderedDict
+from hashlib import sha256
+from threading import Lock
+from time import monotonic
+from typing import Dict, Tuple
+from uuid import UUID
+
+from .core import Client, ClientFacade
+
+
+def hash_token(token: UUID | str) -> bytes:
+    """SHA-256 токена в каноническом виде (строка UUID в нижнем регистре с дефисами)"""
+    text = str(token).strip().lower()
+    if len(text) != 36:
+        text = str(UUID(text))
+    return sha256(text.encode()).digest()
+
+
+class FacadeCache:
+    """LRU-кэш `ClientFacade` по id клиента.
+    Хранит не больше `size` объектов, каждый — не дольше `ttl` секунд."""
+
+    def __init__(self, size: int = 10_000, ttl: float = 600.0):
+        self.size = size
+        self.ttl = ttl
+        self._facades: OrderedDict[UUID, Tuple[ClientFacade, float]] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, client: Client) -> ClientFacade:
+        """Возвращает закэшированный фасад клиента или создаёт новый"""
+        now = monotonic()
+        with self._lock:
+            cached = self._facades.get(client.id)
+            if cached is not None and cached[1] > now and cached[0].client is client:
+                self._facades.move_to_end(client.id)
+                return cached[0]
+            client_facade = ClientFacade(client)
+            self._facades[client.id] = (client_facade, now + self.ttl)
+            self._facades.move_to_end(client.id)
+            if len(self._facades) > self.size:
+                self._facades.popitem(last=False)
+            return client_facade
+
+    def __len__(self) -> int:
+        return len(self._facades)
+
+
+class SessionStore:
+    """Сессии: случайный id -> id клиента.
+    Сессия истекает, если к ней не обращались `ttl` секунд.
+
+    Истёкшие сессии удаляются при открытии новых, но не чаще раза в `ttl` секунд,
+    поэтому число сессий не растёт без ограничений."""
+
+    def __init__(self, ttl: float = 24 * 3600.0):
+        self.ttl = ttl
+        self._sessions: Dict[str, Tuple[UUID, float]] = {}
+        self._lock = Lock()
+        self._next_expire = monotonic() + ttl
+
+    def open(self, client_id: UUID, previous: str | None = None) -> str:
+        """Создаёт сессию клиента и возвращает её id.
+        Сессия `previous` (например, прошлая сессия того же чата) при этом закрывается."""
+        session_id = secrets.token_urlsafe(12)
+        now = monotonic()
+        with self._lock:
+            if previous is not None:
+                self._sessions.pop(previous, None)
+            self._sessions[session_id] = (client_id, now + self.ttl)
+        if now >= self._next_expire:
+            self._next_expire = now + self.ttl
+            self.expire()
+        return session_id
+
+    def resolve(self, session_id: str) -> UUID | None:
+        """id клиента по id сессии (продлевает сессию) или None, если её нет или она истекла"""
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        now = monotonic()
+        if entry[1] <= now:
+            self.close(session_id)
+            return None
+        self._sessions[session_id] = (entry[0], now + self.ttl)
+        return entry[0]
+
+    def close(self, session_id: str) -> None:
+        """Завершает сессию"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def expire(self) -> int:
+        """Удаляет истёкшие сессии и возвращает их число"""
+        now = monotonic()
+        with self._lock:
+            expired = [key for key, (_, deadline) in self._sessions.items() if deadline <= now]
+            for key in expired:
+                del self._sessions[key]
+        return len(expired)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
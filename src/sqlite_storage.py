@@ -0,0 +1,525 @@
+"""Хранилище банковских данных в SQLite (реализация `core.Storage`).
+
+Истории счетов и реестры транзакций читаются из базы индексированными запросами,
+поэтому объём истории не ограничен оперативной памятью.
+Банки, клиенты и счета тоже записываются в базу, а при запуске загружаются из неё
+(сами объекты счетов при этом живут в памяти — их гораздо меньше, чем транзакций).
+
+База открывается в режиме WAL. Записи о транзакциях копятся в буфере
+и вставляются пачками через `executemany` (один и тот же подготовленный запрос);
+буфер сбрасывается, когда наберётся `batch_size` строк, перед любым чтением и в `close()`.
+
+Использование:
+```python
+storage = SQLiteStorage('bank.sqlite3')
+server_state = storage.open_server_state()
+...
+storage.close()
+```
+Все банки одного `ServerState` должны использовать одно хранилище,
+иначе межбанковские переводы не найдут счёт второй стороны."""
+
+import json
+import sqlite3
+import time
+from contextlib import contextmanager
+from threading import RLock
+from typing import Dict, Iterator, List, Set, Tuple, Type
+from uuid import UUID
+from datetime import date, datetime, timedelta
+
+from .core import (Account, Bank, Client, Ledger, Storage, Transaction,
+                   TransactionsHistory, count_withdrawal, to_timestamp)
+from .json_bridge import ServerState
+from .persistence import account_kwargs, decode_value, encode_value
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS banks (
+    id BLOB PRIMARY KEY,
+    name TEXT NOT NULL,
+    unathorized_withdrawal_limit INTEGER NOT NULL,
+    withdrawal_limits TEXT NOT NULL DEFAULT '[]', -- JSON, см. core.WithdrawalLimits.info
+    interest_accrued TEXT -- дата последнего начисления процентов в формате ISO (см. interest.py)
+);
+CREATE TABLE IF NOT EXISTS clients (
+    id BLOB PRIMARY KEY,
+    bank BLOB NOT NULL,
+    name TEXT NOT NULL,
+    surname TEXT NOT NULL,
+    passport TEXT,
+    address TEXT,
+    cash_account BLOB,
+    stats TEXT -- JSON, см. core.Stats.dump
+);
+CREATE TABLE IF NOT EXISTS accounts (
+    id BLOB PRIMARY KEY,
+    client BLOB NOT NULL,
+    bank BLOB NOT NULL,
+    type TEXT NOT NULL,
+    kwargs TEXT NOT NULL,
+    balance INTEGER NOT NULL DEFAULT 0,
+    stats TEXT -- JSON, см. core.Stats.dump
+);
+CREATE INDEX IF NOT EXISTS accounts_by_bank ON accounts (bank);
+CREATE TABLE IF NOT EXISTS tokens (
+    token BLOB PRIMARY KEY, -- SHA-256 токена (sessions.hash_token)
+    client BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS idempotency (
+    client BLOB NOT NULL,
+    key TEXT NOT NULL,
+    result TEXT NOT NULL, -- JSON
+    expires REAL NOT NULL, -- time.time()
+    fingerprint TEXT NOT NULL, -- idempotency.command_fingerprint
+    PRIMARY KEY (client, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS transactions (
+    id BLOB PRIMARY KEY,
+    from_account BLOB NOT NULL,
+    to_account BLOB NOT NULL,
+    amount INTEGER NOT NULL,
+    ts INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transactions_by_ts ON transactions (ts);
+CREATE TABLE IF NOT EXISTS clearing ( -- очередь межбанковских переводов (см. clearing.py)
+    id BLOB PRIMARY KEY, -- id списания на корреспондентский счёт
+    from_account BLOB NOT NULL,
+    to_account BLOB NOT NULL,
+    amount INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS history (
+    account BLOB NOT NULL,
+    ts INTEGER NOT NULL,
+    transaction_id BLOB NOT NULL,
+    PRIMARY KEY (account, ts, transaction_id)
+) WITHOUT ROWID;
+"""
+
+_INSERT_TRANSACTION = 'INSERT OR IGNORE INTO transactions VALUES (?, ?, ?, ?, ?)'
+_INSERT_HISTORY = 'INSERT OR IGNORE INTO history VALUES (?, ?, ?)'
+_UPDATE_ACCOUNT = 'UPDATE accounts SET balance = ?, stats = ? WHERE id = ?'
+_UPDATE_CLIENT_STATS = 'UPDATE clients SET stats = ? WHERE id = ?'
+_INSERT_COMMAND = 'INSERT OR REPLACE INTO idempotency VALUES (?, ?, ?, ?, ?)'
+_INSERT_TRANSFER = 'INSERT OR REPLACE INTO clearing VALUES (?, ?, ?, ?)'
+_DELETE_TRANSFER = 'DELETE FROM clearing WHERE id = ?'
+_SELECT_TRANSACTION = 'SELECT id, from_account, to_account, amount, ts FROM transactions'
+
+_MIN_TIMESTAMP, _MAX_TIMESTAMP = -2**63, 2**63 - 1
+_MIN_ID = bytes(16)
+_IN_BATCH = 500 # параметров в одном `IN (...)` (у старых SQLite предел — 999)
+
+
+def _date(day: "date | None") -> "str | None":
+    return None if day is None else day.isoformat()
+
+
+class SQLiteStorage(Storage):
+    """Хранилище в файле SQLite. Потокобезопасно: соединение защищено блокировкой."""
+
+    def __init__(self, path: str, *, batch_size: int = 1000):
+        self.path = path
+        self.batch_size = batch_size
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.executescript(_SCHEMA)
+        self._lock = RLock()
+        self._accounts: Dict[bytes, Account] = {}
+        self._pending_transactions: List[Tuple] = []
+        self._pending_history: List[Tuple] = []
+        self._pending_balances: Dict[bytes, int] = {}
+        self._pending_commands: List[Tuple] = []
+        self._pending_queued: List[Tuple] = []
+        self._pending_dequeued: List[Tuple] = []
+        self._loading = False
+
+    # Фабрики
+
+    def create_ledger(self, bank: Bank) -> Ledger:
+        return SQLiteLedger(self, bank)
+
+    def create_history(self, account: Account) -> TransactionsHistory:
+        return SQLiteTransactionsHistory(self, account)
+
+    # Уведомления
+
+    def bank_created(self, name: str, bank: Bank) -> None:
+        self._execute('INSERT OR REPLACE INTO banks VALUES (?, ?, ?, ?, ?)',
+                      (bank.id.bytes, name, bank.unathorized_withdrawal_limit,
+                       json.dumps(bank.withdrawal_limits.info()), _date(bank.interest_accrued)))
+
+    def bank_updated(self, name: str, bank: Bank) -> None:
+        # транзакции из буфера должны попасть в базу раньше (например, проценты
+        # раньше отметки о завершённом начислении, см. interest.py)
+        self.flush()
+        self._execute('UPDATE banks SET name = ?, unathorized_withdrawal_limit = ?, '
+                      'withdrawal_limits = ?, interest_accrued = ? WHERE id = ?',
+                      (name, bank.unathorized_withdrawal_limit,
+                       json.dumps(bank.withdrawal_limits.info()),
+                       _date(bank.interest_accrued), bank.id.bytes))
+
+    def client_created(self, client: Client) -> None:
+        self._execute('INSERT INTO clients VALUES (?, ?, ?, ?, ?, ?, NULL, NULL)',
+                      (client.id.bytes, client.bank.id.bytes, client.name, client.surname,
+                       client.passport, client.address))
+
+    def client_updated(self, client: Client) -> None:
+        self._execute('UPDATE clients SET name = ?, surname = ?, passport = ?, address = ? '
+                      'WHERE id = ?', (client.name, client.surname, client.passport,
+                                       client.address, client.id.bytes))
+
+    def account_created(self, account: Account) -> None:
+        if self._loading:
+            return
+        self._accounts[account.id.bytes] = account
+        kwargs = json.dumps(account_kwargs(account), default=encode_value)
+        self._execute('INSERT INTO accounts VALUES (?, ?, ?, ?, ?, ?, NULL)',
+                      (account.id.bytes, account.client.id.bytes, account.client.bank.id.bytes,
+                       type(account).__name__, kwargs, account.balance))
+        if account is account.client.default_cash_account:
+            self._execute('UPDATE clients SET cash_account = ? WHERE id = ?',
+                          (account.id.bytes, account.client.id.bytes))
+
+    def token_issued(self, token_hash: bytes, client: Client) -> None:
+        self._execute('INSERT INTO tokens VALUES (?, ?)', (token_hash, client.id.bytes))
+
+    def command_completed(self, client: Client, key: str, result: Dict,
+                          expires: float, fingerprint: str) -> None:
+        # результат копится в том же буфере, что и транзакции команды, и попадает в базу
+        # одной SQL-транзакцией с ними: иначе после сбоя он мог бы остаться без них,
+        # и повтор команды вернул бы результат, не проведя её
+        with self._lock:
+            self._pending_commands.append(
+                (client.id.bytes, key, json.dumps(result), expires, fingerprint))
+            self._flush_if_full()
+
+    def transfer_queued(self, transaction: Transaction) -> None:
+        # очередь клиринга меняется в том же буфере, что и транзакции списания и зачисления
+        with self._lock:
+            self._pending_queued.append((transaction.id.bytes, transaction.From.id.bytes,
+                                         transaction.To.id.bytes, transaction.amount))
+            self._flush_if_full()
+
+    def transfer_dequeued(self, transfer_id: UUID) -> None:
+        with self._lock:
+            self._pending_dequeued.append((transfer_id.bytes,))
+            self._flush_if_full()
+
+    def _execute(self, query: str, parameters: Tuple) -> None:
+        if self._loading:
+            return
+        with self._lock, self._connection:
+            self._connection.execute(query, parameters)
+
+    # Буфер транзакций
+
+    def _save_transaction(self, transaction: Transaction) -> None:
+        with self._lock:
+            self._pending_transactions.append(
+                (transaction.id.bytes, transaction.From.id.bytes, transaction.To.id.bytes,
+                 transaction.amount, transaction._timestamp)) # pylint: disable=protected-access
+            self._flush_if_full()
+
+    def _save_history_entry(self, account: Account, transaction: Transaction) -> None:
+        with self._lock:
+            account_id = account.id.bytes
+            self._pending_history.append(
+                (account_id, transaction._timestamp, transaction.id.bytes)) # pylint: disable=protected-access
+            self._pending_balances[account_id] = account.balance
+            self._flush_if_full()
+
+    def _flush_if_full(self) -> None:
+        if len(self._pending_transactions) + len(self._pending_history) \
+                + len(self._pending_commands) + len(self._pending_queued) \
+                + len(self._pending_dequeued) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Записывает накопленные транзакции в базу одной SQL-транзакцией,
+        а вместе с ними — балансы и счётчики (`core.Stats`) затронутых счетов и их клиентов,
+        результаты команд с ключом идемпотентности и изменения очереди клиринга"""
+        with self._lock:
+            if not (self._pending_transactions or self._pending_history
+                    or self._pending_commands or self._pending_queued
+                    or self._pending_dequeued):
+                return
+            accounts = [self._accounts[account_id] for account_id in self._pending_balances]
+            clients = {account.client for account in accounts}
+            with self._connection:
+                self._connection.executemany(_INSERT_TRANSACTION, self._pending_transactions)
+                self._connection.executemany(_INSERT_HISTORY, self._pending_history)
+                self._connection.executemany(
+                    _UPDATE_ACCOUNT,
+                    [(balance, json.dumps(account.stats.dump()), account.id.bytes)
+                     for account, balance in zip(accounts, self._pending_balances.values())])
+                self._connection.executemany(
+                    _UPDATE_CLIENT_STATS,
+                    [(json.dumps(client.stats.dump()), client.id.bytes) for client in clients])
+                self._connection.executemany(_INSERT_COMMAND, self._pending_commands)
+                # перевод выходит из очереди только после того, как встал в неё
+                self._connection.executemany(_INSERT_TRANSFER, self._pending_queued)
+                self._connection.executemany(_DELETE_TRANSFER, self._pending_dequeued)
+            self._pending_transactions.clear()
+            self._pending_history.clear()
+            self._pending_balances.clear()
+            self._pending_commands.clear()
+            self._pending_queued.clear()
+            self._pending_dequeued.clear()
+
+    def reopen(self) -> None:
+        """Открывает своё соединение с базой (в дочернем процессе после fork).
+        Буфер родителя отбрасывается: его нужно сбросить до fork."""
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = RLock()
+        self._pending_transactions = []
+        self._pending_history = []
+        self._pending_balances = {}
+        self._pending_commands = []
+        self._pending_queued = []
+        self._pending_dequeued = []
+
+    def close(self) -> None:
+        """Сбрасывает буфер и закрывает базу"""
+        with self._lock:
+            self.flush()
+            self._connection.close()
+
+    # Чтение
+
+    def _query(self, query: str, parameters: Tuple) -> List[Tuple]:
+        with self._lock:
+            self.flush()
+            return self._connection.execute(query, parameters).fetchall()
+
+    def _transaction(self, row: Tuple) -> Transaction:
+        transaction_id, from_id, to_id, amount, timestamp = row
+        transaction = Transaction.__new__(Transaction)
+        transaction.From = self._accounts[from_id]
+        transaction.To = self._accounts[to_id]
+        transaction.amount = amount
+        transaction._id = int.from_bytes(transaction_id, 'big') # pylint: disable=protected-access
+        transaction._timestamp = timestamp # pylint: disable=protected-access
+        return transaction
+
+    def _iterate(self, query: str, parameters: Tuple, *, chunk_size: int = 1000,
+                 start: Tuple[int, bytes] = (_MIN_TIMESTAMP, _MIN_ID)) -> Iterator[Tuple]:
+        """Постранично (по ключу (ts, id)) читает строки запроса,
+        у которого последние два параметра — нижняя граница (ts, id).
+        Запрос должен быть упорядочен по (ts, id) и ограничен через LIMIT ?"""
+        while True:
+            rows = self._query(query, parameters + start + (chunk_size,))
+            yield from rows
+            if len(rows) < chunk_size:
+                return
+            start = (rows[-1][4], rows[-1][0])
+
+    # Загрузка
+
+    @contextmanager
+    def _loading_mode(self) -> Iterator[None]:
+        self._loading = True
+        try:
+            yield
+        finally:
+            self._loading = False
+
+    def open_server_state(self) -> ServerState:
+        """Загружает банки, клиентов, счета, токены и очередь клиринга из базы.
+        Истории при этом не читаются: они остаются в базе."""
+        server_state = ServerState(storage=self)
+        account_types: Dict[str, Type[Account]] = \
+            {cls.__name__: cls for cls in Account.__subclasses__()}
+        banks: Dict[bytes, Bank] = {}
+        clients: Dict[bytes, Client] = {}
+
+        with self._lock, self._loading_mode():
+            for bank_id, name, limit, withdrawal_limits, interest_accrued \
+                    in self._connection.execute('SELECT * FROM banks'):
+                bank = Bank(limit, self)
+                bank.id = UUID(bytes=bank_id)
+                bank.withdrawal_limits.load(json.loads(withdrawal_limits))
+                if interest_accrued is not None:
+                    bank.interest_accrued = date.fromisoformat(interest_accrued)
+                banks[bank_id] = server_state.banks[name] = bank
+
+            for client_id, bank_id, name, surname, passport, address, cash_account_id, stats \
+                    in self._connection.execute('SELECT * FROM clients'):
+                client = Client(banks[bank_id], name, surname, passport, address)
+                client.id = UUID(bytes=client_id)
+                if stats is not None:
+                    client.stats.load(json.loads(stats))
+                client._rekey_account(client.default_cash_account, # pylint: disable=protected-access
+                                      UUID(bytes=cash_account_id))
+                self._accounts[cash_account_id] = client.default_cash_account
+                clients[client_id] = client
+
+            for account_id, client_id, _bank_id, account_type, kwargs, balance, stats \
+                    in self._connection.execute('SELECT * FROM accounts'):
+                client = clients[client_id]
+                if account_id == client.default_cash_account.id.bytes:
+                    account = client.default_cash_account
+                else:
+                    account = account_types[account_type](
+                        client, **json.loads(kwargs, object_hook=decode_value))
+                    account.id = UUID(bytes=account_id)
+                    client._add_account(account) # pylint: disable=protected-access
+                account.balance = balance
+                if stats is not None:
+                    account.stats.load(json.loads(stats))
+                self._accounts[account_id] = account
+
+            for token_hash, client_id in self._connection.execute('SELECT * FROM tokens'):
+                server_state.client_facades.add_hash(token_hash, clients[client_id])
+
+            self._load_withdrawals(list(banks.values()))
+            self._load_idempotency(server_state)
+            for transfer_id, from_id, to_id, amount in self._connection.execute(
+                    'SELECT * FROM clearing ORDER BY rowid'):
+                server_state.clearing._put( # pylint: disable=protected-access
+                    UUID(bytes=transfer_id), (self._accounts[from_id], self._accounts[to_id],
+                                              amount))
+
+        return server_state
+
+    def _load_idempotency(self, server_state: ServerState) -> None:
+        """Загружает неистёкшие результаты команд (см. `idempotency.py`)
+        и удаляет из базы истёкшие"""
+        now = time.time()
+        with self._connection:
+            self._connection.execute('DELETE FROM idempotency WHERE expires <= ?', (now,))
+        for client_id, key, result, expires, fingerprint in self._connection.execute(
+                'SELECT * FROM idempotency ORDER BY expires'):
+            server_state.idempotency.put((UUID(bytes=client_id), key), json.loads(result),
+                                         expires, fingerprint)
+
+    def _load_withdrawals(self, banks: List[Bank]) -> None:
+        """Заполняет счётчики лимитов снятий (`core.WithdrawalLimits`)
+        транзакциями за самое длинное окно среди лимитов банков"""
+        longest = max((bank.withdrawal_limits.longest_window for bank in banks),
+                      default=timedelta(0))
+        if not longest:
+            return
+        for from_id, to_id, amount, timestamp in self._connection.execute(
+                'SELECT from_account, to_account, amount, ts FROM transactions '
+                'WHERE ts >= ? ORDER BY ts', (to_timestamp(datetime.now() - longest),)):
+            count_withdrawal(self._accounts[from_id], self._accounts[to_id], amount, timestamp)
+
+
+class SQLiteTransactionsHistory(TransactionsHistory):
+    """История счёта, хранящаяся в таблице `history` (индекс по (счёт, время, id)).
+    Выборка по времени и постраничный вывод — это диапазонный проход по индексу.
+
+    При равном времени транзакции упорядочены по id (в памяти — по порядку добавления),
+    курсоры у разных хранилищ несовместимы."""
+
+    def __init__(self, storage: SQLiteStorage, account: Account): # pylint: disable=super-init-not-called
+        self._storage = storage
+        self._account: Account = account
+
+    def save(self, transaction: Transaction) -> None:
+        """Записывает транзакцию в историю, а текущий баланс счёта — в таблицу счетов"""
+        self._storage._save_history_entry(self._account, transaction) # pylint: disable=protected-access
+
+    def save_many(self, transactions: List[Transaction]) -> None:
+        for transaction in transactions:
+            self.save(transaction)
+
+    def see(self, *, after: datetime | None = None, before: datetime | None = None,
+            limit: int | None = None, cursor: str | None = None) -> List[Transaction]:
+        if limit is not None and limit < 0:
+            raise ValueError("Limit must be non-negative")
+        start = (_MIN_TIMESTAMP, _MIN_ID)
+        if cursor is not None:
+            timestamp, transaction_id = self._decode_cursor(cursor)
+            start = (timestamp, transaction_id.to_bytes(16, 'big'))
+        rows = self._storage._query( # pylint: disable=protected-access
+            'SELECT t.id, t.from_account, t.to_account, t.amount, t.ts '
+            'FROM history h JOIN transactions t ON t.id = h.transaction_id '
+            'WHERE h.account = ? AND h.ts > ? AND h.ts < ? AND (h.ts, h.transaction_id) > (?, ?) '
+            'ORDER BY h.ts, h.transaction_id LIMIT ?',
+            (self._account.id.bytes,
+             _MIN_TIMESTAMP if after is None else to_timestamp(after),
+             _MAX_TIMESTAMP if before is None else to_timestamp(before),
+             *start, -1 if limit is None else limit))
+        return [self._oriented(self._storage._transaction(row)) for row in rows] # pylint: disable=protected-access
+
+    def __getitem__(self, transaction_id: UUID) -> Transaction:
+        rows = self._storage._query(_SELECT_TRANSACTION + ' WHERE id = ?', # pylint: disable=protected-access
+                                    (transaction_id.bytes,))
+        account_id = self._account.id.bytes
+        if not rows or account_id not in (rows[0][1], rows[0][2]):
+            raise KeyError(transaction_id)
+        return self._oriented(self._storage._transaction(rows[0])) # pylint: disable=protected-access
+
+    def __len__(self) -> int:
+        return self._storage._query('SELECT COUNT(*) FROM history WHERE account = ?', # pylint: disable=protected-access
+                                    (self._account.id.bytes,))[0][0]
+
+    def change_after(self, moment: datetime) -> int:
+        """Сумма изменений баланса после `moment` — агрегат по диапазону индекса `history`
+        (в базе контрольные точки не нужны: читаются только транзакции после `moment`)"""
+        account_id = self._account.id.bytes
+        return self._storage._query( # pylint: disable=protected-access
+            'SELECT COALESCE(SUM((t.to_account = ?) * t.amount '
+            '                    - (t.from_account = ?) * t.amount), 0) '
+            'FROM history h JOIN transactions t ON t.id = h.transaction_id '
+            'WHERE h.account = ? AND h.ts > ?',
+            (account_id, account_id, account_id, to_timestamp(moment)))[0][0]
+
+
+class SQLiteLedger(Ledger):
+    """Реестр транзакций банка поверх таблицы `transactions`.
+    Транзакция относится к банку, если в нём открыт счёт отправителя или получателя."""
+
+    _BANK_FILTER = ('(from_account IN (SELECT id FROM accounts WHERE bank = ?) '
+                    'OR to_account IN (SELECT id FROM accounts WHERE bank = ?))')
+
+    def __init__(self, storage: SQLiteStorage, bank: Bank): # pylint: disable=super-init-not-called
+        self._storage = storage
+        self._bank = bank
+
+    def save(self, transaction: Transaction) -> None:
+        self._storage._save_transaction(transaction) # pylint: disable=protected-access
+
+    def get(self, transaction_id: UUID) -> Transaction | None:
+        rows = self._storage._query(_SELECT_TRANSACTION + ' WHERE id = ?', # pylint: disable=protected-access
+                                    (transaction_id.bytes,))
+        if not rows:
+            return None
+        transaction = self._storage._transaction(rows[0]) # pylint: disable=protected-access
+        if self._bank not in (transaction.From.client.bank, transaction.To.client.bank):
+            return None
+        return transaction
+
+    def existing(self, transaction_ids: List[UUID]) -> Set[UUID]:
+        bank_id = self._bank.id.bytes
+        found: Set[UUID] = set()
+        for start in range(0, len(transaction_ids), _IN_BATCH):
+            batch = [transaction_id.bytes
+                     for transaction_id in transaction_ids[start:start + _IN_BATCH]]
+            rows = self._storage._query( # pylint: disable=protected-access
+                f'SELECT id FROM transactions WHERE id IN ({", ".join("?" * len(batch))}) '
+                'AND ' + self._BANK_FILTER, (*batch, bank_id, bank_id))
+            found.update(UUID(bytes=row[0]) for row in rows)
+        return found
+
+    def __getitem__(self, transaction_id: UUID) -> Transaction:
+        if (transaction := self.get(transaction_id)) is None:
+            raise KeyError(transaction_id)
+        return transaction
+
+    def __contains__(self, transaction_id: object) -> bool:
+        return isinstance(transaction_id, UUID) and self.get(transaction_id) is not None
+
+    def __iter__(self) -> Iterator[Transaction]:
+        bank_id = self._bank.id.bytes
+        rows = self._storage._iterate( # pylint: disable=protected-access
+            _SELECT_TRANSACTION + ' WHERE ' + self._BANK_FILTER +
+            ' AND (ts, id) > (?, ?) ORDER BY ts, id LIMIT ?', (bank_id, bank_id))
+        return map(self._storage._transaction, rows) # pylint: disable=protected-access
+
+    def __len__(self) -> int:
+        bank_id = self._bank.id.bytes
+        return self._storage._query('SELECT COUNT(*) FROM transactions WHERE ' + # pylint: disable=protected-access
+                                    self._BANK_FILTER, (bank_id, bank_id))[0][0]
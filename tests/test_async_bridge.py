@@ -0,0 +1,107 @@
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-module-docstring
+
+# pylint: disable=wrong-import-position
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import inspect
+import threading
+from src.async_bridge import AsyncCommands, TOO_MANY_REQUESTS
+from src.json_bridge import ServerState, ClientCommands, SuperuserCommands
+
+
+def make_client(commands: AsyncCommands):
+    async def create():
+        await commands.superuser('create_bank', {'name': 'Сбер', 'unathorized_withdrawal_limit': 100})
+        return await commands.superuser('create_client',
+                                        {'bank': 'Сбер', 'name': 'Иван', 'surname': 'Иванов'})
+    token = asyncio.run(create())['client_token']
+    return commands.server_state.client_facades[token]
+
+
+class TestAsyncCommands:
+    def test_commands(self):
+        commands = AsyncCommands(ServerState())
+        client_facade = make_client(commands)
+        account_id = str(client_facade.create_account('DebitAccount').id)
+
+        async def run():
+            deposit = await commands.client('deposit', {'account_id': account_id, 'amount': 30},
+                                            client_facade)
+            history = await commands.client('show_history', {'account_id': account_id},
+                                            client_facade)
+            unknown = await commands.client('rob_bank', {}, client_facade)
+            return deposit, history, unknown
+
+        deposit, history, unknown = asyncio.run(run())
+        assert deposit['status'] == 'ok'
+        assert len(history['history']) == 1
+        assert unknown['status'] == 'error'
+
+        for limit in (0, -1):
+            assert ClientCommands.show_history({'account_id': account_id, 'limit': limit},
+                                               client_facade)['status'] == 'error'
+        page = ClientCommands.show_history({'account_id': account_id, 'limit': 1,
+                                            'after': '2000-01-01T00:00:00+00:00'}, client_facade)
+        assert len(page['history']) == 1 and page['next_cursor'] is None
+
+    def test_too_many_requests(self, monkeypatch):
+        commands = AsyncCommands(ServerState(), max_in_flight_per_client=1,
+                                 max_queued_per_client=2)
+        client_facade = make_client(commands)
+        account_id = str(client_facade.create_account('DebitAccount').id)
+
+        release = threading.Event()
+        show_history = ClientCommands.show_history
+        def slow_show_history(command, client_facade):
+            release.wait()
+            return show_history(command, client_facade)
+        monkeypatch.setattr(ClientCommands, 'show_history', staticmethod(slow_show_history))
+
+        async def run():
+            command = {'account_id': account_id}
+            first = asyncio.ensure_future(commands.client('show_history', command, client_facade))
+            second = asyncio.ensure_future(commands.client('show_history', command, client_facade))
+            await asyncio.sleep(0.01)
+            rejected = await commands.client('show_history', command, client_facade)
+            release.set()
+            return rejected, await first, await second
+
+        rejected, first, second = asyncio.run(run())
+        assert rejected == TOO_MANY_REQUESTS
+        assert first['status'] == 'ok' and second['status'] == 'ok'
+
+    def test_offloaded(self, monkeypatch):
+        commands = AsyncCommands(ServerState())
+        client_facade = make_client(commands)
+        account_id = str(client_facade.create_account('DebitAccount').id)
+        threads = {}
+
+        def record(namespace, name):
+            command = getattr(namespace, name)
+            def wrapper(*args, **kwargs):
+                threads[name] = threading.current_thread()
+                return command(*args, **kwargs)
+            wrapper.__signature__ = inspect.signature(command)
+            monkeypatch.setattr(namespace, name, staticmethod(wrapper))
+
+        for name in ('deposit', 'withdraw', 'show_accounts', 'show_stats'):
+            record(ClientCommands, name)
+        record(SuperuserCommands, 'create_client')
+
+        async def run():
+            command = {'account_id': account_id, 'amount': 10}
+            for name in ('deposit', 'withdraw', 'show_accounts', 'show_stats'):
+                assert (await commands.client(name, command, client_facade))['status'] == 'ok'
+            await commands.superuser('create_client',
+                                     {'bank': 'Сбер', 'name': 'Пётр', 'surname': 'Петров'})
+
+        asyncio.run(run())
+        main = threading.main_thread()
+        assert threads['show_accounts'] is main and threads['show_stats'] is main
+        assert all(threads[name] is not main for name in ('deposit', 'withdraw', 'create_client'))
@@ -0,0 +1,105 @@
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-module-docstring
+
+# pylint: disable=redefined-outer-name
+# pylint: disable=wrong-import-position
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime, timedelta
+from uuid import uuid4
+import pytest
+from src.bulk_import import BulkLoader
+from src.core import Bank, Client, ClientFacade
+from src.export import bank_rows, export
+from src.json_bridge import SuperuserCommands
+from src.persistence import open_server_state
+from src.sqlite_storage import SQLiteStorage
+
+
+@pytest.fixture
+def client_facade():
+    return ClientFacade(Client(Bank(), 'Иван', 'Иванов', '0123 456789', 'Москва'))
+
+
+def rows(client_facade: ClientFacade, count: int):
+    cash = client_facade.client.default_cash_account
+    debit = client_facade.create_account('DebitAccount')
+    start = datetime(2023, 1, 1)
+    return debit, [{'id': str(uuid4()), 'from': str(cash.id), 'to': str(debit.id),
+                    'amount': 10, 'datetime': (start + timedelta(hours = i)).isoformat()}
+                   for i in range(count)]
+
+
+class TestBulkLoader:
+    def test_load(self, client_facade: ClientFacade):
+        debit, data = rows(client_facade, 25)
+        data = data[10:] + data[:10]
+        bank = client_facade.client.bank
+        report = BulkLoader(bank, chunk_size = 7).load(data)
+        assert report == {'loaded': 25, 'duplicates': 0, 'rejected': 0}
+        assert debit.balance == 250
+        assert client_facade.client.default_cash_account.balance == -250
+        history = debit.history.see()
+        assert [t.datetime for t in history] == sorted(t.datetime for t in history)
+        assert history[0].datetime == datetime(2023, 1, 1)
+        assert len(bank.ledger) == 25
+        assert (debit.stats.count, debit.stats.credit) == (25, 250)
+
+        assert BulkLoader(bank).load(data) == {'loaded': 0, 'duplicates': 25, 'rejected': 0}
+
+    def test_rejected(self, client_facade: ClientFacade):
+        debit, data = rows(client_facade, 3)
+        data[0]['to'] = str(uuid4())
+        data[1]['amount'] = 'много'
+        assert BulkLoader(client_facade.client.bank).load(data) \
+            == {'loaded': 1, 'duplicates': 0, 'rejected': 2}
+        assert debit.balance == 10
+
+    def test_check_permissions(self, client_facade: ClientFacade):
+        debit, data = rows(client_facade, 3)
+        cash = client_facade.client.default_cash_account
+        withdrawal = {'id': str(uuid4()), 'from': str(debit.id), 'to': str(cash.id),
+                      'amount': 50, 'datetime': datetime(2023, 2, 1).isoformat()}
+        loader = BulkLoader(client_facade.client.bank, check_permissions = True)
+        assert loader.load(data + [withdrawal]) == {'loaded': 3, 'duplicates': 0, 'rejected': 1}
+        assert debit.balance == 30
+
+    def test_restore(self, tmp_path):
+        server_state = open_server_state(str(tmp_path), snapshot_every = 3)
+        SuperuserCommands.create_bank({'name': 'Сбер'}, server_state)
+        token = SuperuserCommands.create_client(
+            {'bank': 'Сбер', 'name': 'Иван', 'surname': 'Иванов'}, server_state)['client_token']
+        debit, data = rows(server_state.client_facades[token], 10)
+        bank = server_state.banks['Сбер']
+        assert BulkLoader(bank).load(data)['loaded'] == 10
+        server_state.journal.close()
+
+        accounts = open_server_state(str(tmp_path)).banks['Сбер'].accounts
+        cash = bank.accounts[debit.id].client.default_cash_account
+        assert (accounts[cash.id].balance, accounts[debit.id].balance) == (-100, 100)
+
+    def test_sqlite(self, tmp_path):
+        storage = SQLiteStorage(str(tmp_path / 'bank.sqlite3'))
+        bank = Bank(storage = storage)
+        client_facade = ClientFacade(Client(bank, 'Иван', 'Иванов', '0123 456789', 'Москва'))
+        debit, data = rows(client_facade, 10)
+        # повтор из прошлой пачки находится в реестре, повтор внутри пачки — сразу
+        report = BulkLoader(bank, chunk_size = 4).load(data + [data[0], data[9], data[9]])
+        assert report == {'loaded': 10, 'duplicates': 3, 'rejected': 0}
+        assert debit.balance == 100
+        assert bank.ledger.existing([debit.history.see()[0].id, uuid4()]) \
+            == {debit.history.see()[0].id}
+        storage.close()
+
+    def test_export_roundtrip(self, client_facade: ClientFacade, tmp_path):
+        debit, data = rows(client_facade, 5)
+        bank = client_facade.client.bank
+        BulkLoader(bank).load(data)
+        path = str(tmp_path / 'bank.csv')
+        assert export(bank_rows(bank), path) == 10
+        assert BulkLoader(bank).load_file(path) == {'loaded': 0, 'duplicates': 10, 'rejected': 0}
+        assert debit.balance == 50
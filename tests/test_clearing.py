@@ -0,0 +1,175 @@
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-module-docstring
+
+# pylint: disable=redefined-outer-name
+# pylint: disable=wrong-import-position
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from src.clearing import ClearingHouse, correspondent
+from src.core import Bank, Client, ClientFacade
+from src.json_bridge import SuperuserCommands
+from src.persistence import open_server_state
+from src.sqlite_storage import SQLiteStorage
+
+
+def open_client(bank: Bank, deposit: int = 0):
+    client_facade = ClientFacade(Client(bank, 'Иван', 'Иванов', '0123 456789', 'Москва'))
+    account = client_facade.create_account('DebitAccount')
+    if deposit:
+        client_facade.deposit(account.id, deposit)
+    return client_facade, account
+
+
+@pytest.fixture
+def banks():
+    first, second = Bank(), Bank()
+    ClearingHouse().attach(first, second)
+    return first, second
+
+
+class TestClearingHouse:
+    def test_netting(self, banks):
+        first, second = banks
+        alice, alice_account = open_client(first, 1000)
+        bob, bob_account = open_client(second, 1000)
+        for _ in range(10):
+            assert alice.transfer(alice_account.id, bob_account.id, 30, second)
+        for _ in range(5):
+            assert bob.transfer(bob_account.id, alice_account.id, 20, first)
+        clearing = first.clearing
+        assert clearing.pending() == 15
+        assert (alice_account.balance, bob_account.balance) == (700, 900)
+        assert correspondent(first, second).balance == 300
+
+        summary = clearing.settle()
+        assert summary == {'transfers': 15, 'returned': 0, 'settlements': 1,
+                           'gross': 400, 'net': 200}
+        assert (alice_account.balance, bob_account.balance) == (800, 1200)
+        assert correspondent(first, second).balance == 0
+        assert correspondent(second, first).balance == 0
+        assert clearing.pending() == 0
+        assert clearing.settle()['settlements'] == 0
+
+        interbank = [t for t in first.ledger if t.To.client.bank is not t.From.client.bank]
+        assert len(interbank) == 1 and interbank[0].amount in (200, -200)
+
+    def test_rejected(self, banks):
+        first, second = banks
+        alice, alice_account = open_client(first, 100)
+        assert not alice.transfer(alice_account.id, alice_account.id, 0, second)
+        assert not alice.transfer(alice_account.id, open_client(second)[1].id, 500, second)
+        assert first.clearing.pending() == 0
+
+    def test_returned(self, banks):
+        first, second = banks
+        alice, alice_account = open_client(first, 100)
+        _, bob_account = open_client(second)
+        assert alice.transfer(alice_account.id, bob_account.id, 40, second)
+        bob_account.balance = -100 # проверка счёта получателя не пройдёт
+        summary = first.clearing.settle()
+        assert (summary['transfers'], summary['returned'], summary['settlements']) == (0, 1, 0)
+        assert alice_account.balance == 100
+        assert correspondent(first, second).balance == 0
+
+    def test_transfer_batch(self, banks):
+        first, second = banks
+        alice, alice_account = open_client(first, 100)
+        _, bob_account = open_client(second)
+        own = alice.create_account('DebitAccount')
+        results = alice.transfer_batch([(alice_account.id, bob_account.id, 30, second),
+                                        (alice_account.id, own.id, 20, None),
+                                        (alice_account.id, bob_account.id, 80, second)])
+        assert [bool(result) for result in results] == [True, True, False]
+        assert (alice_account.balance, own.balance, bob_account.balance) == (50, 20, 0)
+        assert correspondent(first, second).balance == 30
+        assert first.clearing.pending() == 1
+
+        assert not all(alice.transfer_batch([(alice_account.id, bob_account.id, 10, second),
+                                             (alice_account.id, own.id, 100, None)],
+                                            atomic = True))
+        assert correspondent(first, second).balance == 30
+        assert first.clearing.pending() == 1
+
+        first.clearing.settle()
+        assert (alice_account.balance, bob_account.balance) == (50, 30)
+
+    def test_cancel(self, banks):
+        first, second = banks
+        alice, alice_account = open_client(first, 100)
+        _, bob_account = open_client(second)
+        clearing = first.clearing
+        assert alice.transfer(alice_account.id, bob_account.id, 40, second)
+        debit = alice_account.history.see()[-1]
+        # перевод ещё в очереди: отмена возвращает деньги и убирает его из очереди
+        assert clearing.cancel(debit)
+        assert (alice_account.balance, correspondent(first, second).balance) == (100, 0)
+        assert clearing.pending() == 0
+        assert clearing.settle()['transfers'] == 0 and bob_account.balance == 0
+
+        assert alice.transfer(alice_account.id, bob_account.id, 30, second)
+        debit = alice_account.history.see()[-1]
+        clearing.settle()
+        credit = bob_account.history.see()[-1]
+        assert not clearing.cancel(debit)
+        assert not clearing.cancel(credit)
+        assert (alice_account.balance, bob_account.balance) == (70, 30)
+
+        own = alice.create_account('DebitAccount')
+        assert alice.transfer(alice_account.id, own.id, 10)
+        assert clearing.cancel(alice_account.history.see()[-1])
+        assert alice_account.balance == 70
+
+
+@pytest.mark.parametrize('backend', ['journal', 'sqlite'])
+def test_queue_after_restart(tmp_path, backend):
+    def open_state():
+        if backend == 'journal':
+            return open_server_state(str(tmp_path))
+        storage = SQLiteStorage(str(tmp_path / 'bank.sqlite3'))
+        return storage.open_server_state()
+
+    def close(server_state, snapshot):
+        if backend == 'journal':
+            if snapshot:
+                server_state.journal.snapshot()
+            server_state.journal.close()
+        else:
+            server_state.storage.close()
+
+    server_state = open_state()
+    for name in ('Сбер', 'ВТБ'):
+        SuperuserCommands.create_bank({'name': name}, server_state)
+    first, second = server_state.banks['Сбер'], server_state.banks['ВТБ']
+    server_state.clearing.attach(first, second)
+    alice, alice_account = open_client(first, 100)
+    _, bob_account = open_client(second)
+    for amount in (10, 20, 30):
+        assert alice.transfer(alice_account.id, bob_account.id, amount, second)
+    debits = alice_account.history.see()[-3:]
+    command = {'transaction_id': str(debits[1].id)}
+    assert SuperuserCommands.cancel_transaction(command, server_state)['status'] == 'ok'
+    close(server_state, snapshot=False) # очередь восстанавливается из журнала
+
+    restored = open_state()
+    first, second = restored.banks['Сбер'], restored.banks['ВТБ']
+    clearing = restored.clearing.attach(first, second)
+    assert clearing.pending() == 2
+    assert SuperuserCommands.cancel_transaction(command, restored)['status'] == 'error'
+    assert clearing.settle()['gross'] == 40
+    assert first.accounts[alice_account.id].balance == 60
+    assert second.accounts[bob_account.id].balance == 40
+    assert correspondent(first, second).balance == 0
+    alice = ClientFacade(first.accounts[alice_account.id].client)
+    assert alice.transfer(alice_account.id, bob_account.id, 5, second)
+    close(restored, snapshot=True) # и из снимка
+
+    restored = open_state()
+    assert restored.clearing.pending() == 1
+    assert restored.clearing.settle()['gross'] == 5
+    assert restored.banks['ВТБ'].accounts[bob_account.id].balance == 45
+    close(restored, snapshot=False)
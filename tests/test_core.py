@@ -11,7 +11,8 @@ import os
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from datetime import timedelta
+from datetime import date, datetime, timedelta, timezone
+from threading import Thread
 import pytest
 from src.core import *
 
@@ -146,6 +147,33 @@ class TestCashAccount:
         assert transaction.check_permissions(), 'Можно вносить деньги без ограничений'
 
 
+class TestPermissionPlan:
+    def test_codes(self, client: Client):
+        cash = client.default_cash_account
+        deposit = client.create_account(DepositAccount, end_date = date(9999, 1, 1))
+        transaction = Transaction(deposit, cash, 2000)
+        result = transaction.perform()
+        assert result.codes == ('before_end_date', 'not_enough_money')
+        assert result.reason == "Can't withdraw money before end date\nNot enough money\n"
+
+        client.passport = None
+        assert Transaction(cash, deposit, -2000).perform().codes \
+            == ('before_end_date', 'not_enough_money', 'unverified_client')
+        assert transaction.mirror.check_permissions()
+        assert permission_plan(DepositAccount, False) is permission_plan(DepositAccount, False)
+
+    def test_custom_account(self, client: Client):
+        class FrozenAccount(DebitAccount):
+            def check_withdraw_permissions(self, transaction):
+                return BoolWithReason('Frozen\n' if transaction.amount > 0 else '')
+
+        frozen = client.create_account(FrozenAccount)
+        frozen.balance = 100
+        result = Transaction(frozen, client.default_cash_account, 10).perform()
+        assert result.codes == ('account_rules',) and result.reason == 'Frozen\n'
+        assert Transaction(client.default_cash_account, frozen, 10).perform()
+
+
 
 @pytest.fixture
 def transaction(client: Client):
@@ -187,6 +215,23 @@ class TestTransaction:
         assert transaction.From.balance == 10_000
         assert transaction.To.balance == 10_000
 
+    def test_mirror_is_view(self, transaction: Transaction):
+        mirror = transaction.mirror
+        assert mirror.From is transaction.To and mirror.To is transaction.From
+        assert mirror.amount == -transaction.amount
+        assert mirror.id == transaction.id and mirror.datetime == transaction.datetime
+        assert mirror.mirror is transaction
+        assert mirror.info() == {**transaction.info(), 'from': transaction.To.id,
+                                 'to': transaction.From.id, 'amount': -transaction.amount}
+
+        mirror.amount = -500
+        assert transaction.amount == 500
+
+    def test_compact(self, transaction: Transaction):
+        assert not hasattr(transaction, '__dict__')
+        assert not hasattr(transaction.mirror, '__dict__')
+        assert isinstance(transaction.id, UUID)
+
     def test_hash(self, transaction: Transaction):
         assert hash(transaction) == hash(transaction.mirror)
 
@@ -195,11 +240,34 @@ class TestTransaction:
         transaction2.datetime = transaction.datetime + timedelta(seconds = 1)
         assert transaction < transaction2
 
+    def test_concurrent_perform(self, client: Client):
+        accounts = [client.create_account(DebitAccount) for _ in range(4)]
+        for account in accounts:
+            account.balance = 100
+
+        def worker(seed: int):
+            for i in range(2000):
+                From = accounts[(seed + i) % 4]
+                To = accounts[(seed + 3 * i + 1) % 4]
+                Transaction(From, To, 7).perform()
+
+        threads = [Thread(target = worker, args = (seed,)) for seed in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert sum(account.balance for account in accounts) == 400
+        assert all(account.balance >= 0 for account in accounts)
+        for account in accounts:
+            assert account.balance == 100 + sum(t.amount for t in account.history.see())
+
 class TestTransactionsHistory:
     def test_save(self, transaction: Transaction):
         transaction.perform()
         assert transaction.From.history[transaction.id] == transaction.mirror
         assert transaction.To.history[transaction.id] == transaction
+        assert transaction.From.history.see() == [transaction.mirror]
 
     def test_multiple_save(self, transaction: Transaction):
         history = transaction.From.history
@@ -208,6 +276,173 @@ class TestTransactionsHistory:
         history.save(transaction.mirror)
         assert len(history.see()) == 1
 
+    def test_see_is_sorted(self, transaction: Transaction):
+        history = TransactionsHistory()
+        transactions = [Transaction(transaction.From, transaction.To, i) for i in range(5)]
+        for i, shift in enumerate([0, 3, 1, 4, 2]):
+            transactions[i].datetime = transaction.datetime + timedelta(seconds = shift)
+        for t in transactions:
+            history.save(t)
+        assert history.see() == sorted(transactions)
+
+        history.save(transactions[1])
+        assert len(history) == 5
+
+    def test_pages(self, transaction: Transaction):
+        history = TransactionsHistory()
+        start = transaction.datetime
+        transactions = [Transaction(transaction.From, transaction.To, i) for i in range(10)]
+        for i, t in enumerate(transactions):
+            t.datetime = start + timedelta(seconds = i // 2)
+            history.save(t)
+
+        assert history.see(after = start, before = start + timedelta(seconds = 3)) \
+            == transactions[2:6]
+        aware = start.astimezone(timezone.utc)
+        assert history.see(after = aware, before = aware + timedelta(seconds = 3)) \
+            == transactions[2:6]
+
+        pages, cursor = [], None
+        while page := history.see(limit = 3, cursor = cursor):
+            pages.append(page)
+            cursor = TransactionsHistory.cursor(page[-1])
+        assert [len(page) for page in pages] == [3, 3, 3, 1]
+        assert sum(pages, []) == transactions
+
+        with pytest.raises(ValueError):
+            history.see(cursor = 'garbage')
+
+
+
+class TestBalanceAt:
+    def test_balance_at(self, client: Client, monkeypatch):
+        monkeypatch.setattr(TransactionsHistory, 'CHECKPOINT_EVERY', 4)
+        debit = client.create_account(DebitAccount)
+        start = datetime(2023, 1, 1)
+        for day in range(20):
+            transaction = Transaction(client.default_cash_account, debit, 10)
+            transaction.datetime = start + timedelta(days = day)
+            assert transaction.perform()
+        assert debit.balance_at(start - timedelta(days = 1)) == 0
+        assert debit.balance_at(start) == 10
+        assert debit.balance_at(start + timedelta(days = 9, hours = 1)) == 100
+        assert client.default_cash_account.balance_at(start + timedelta(days = 9)) == -100
+
+        # вставка в середину истории сбрасывает контрольные точки после неё
+        transaction = Transaction(debit, client.default_cash_account, 5)
+        transaction.datetime = start + timedelta(days = 2, hours = 12)
+        assert transaction.perform()
+        assert debit.balance_at(start + timedelta(days = 2)) == 30
+        assert debit.balance_at(start + timedelta(days = 3)) == 35
+        assert debit.balance_at(start + timedelta(days = 30)) == debit.balance == 195
+
+    def test_get_balance_at(self, client: Client):
+        client_facade = ClientFacade(client)
+        account = client_facade.create_account('DebitAccount')
+        client_facade.deposit(account.id, 100)
+        assert client_facade.get_balance_at(account.id, datetime.now()) == 100
+        with pytest.raises(ValueError):
+            client_facade.get_balance_at(uuid4(), datetime.now())
+
+
+class TestLedger:
+    def test_save(self, transaction: Transaction, bank: Bank):
+        transaction.perform()
+        assert bank.ledger[transaction.id] is transaction
+        assert transaction.id in bank.ledger
+        assert len(bank.ledger) == 1
+
+    def test_another_bank(self, transaction: Transaction, bank: Bank):
+        other_bank = Bank()
+        To = Client(other_bank, 'Альберт', 'Эйнштейн').create_account(DebitAccount)
+        transaction = Transaction(transaction.From, To, 1000)
+        transaction.perform()
+        assert bank.ledger[transaction.id] is other_bank.ledger[transaction.id]
+
+
+class TestWithdrawalLimits:
+    def test_sliding_window(self):
+        window = SlidingWindow(60 * 10**6, buckets = 60)
+        window.add(10, 0)
+        window.add(20, 30 * 10**6)
+        assert window.total(59 * 10**6) == 30
+        assert window.total(61 * 10**6) == 20
+        window.add(5, 0)  # старше окна
+        assert window.total(61 * 10**6) == 20
+        assert window.total(10**9) == 0
+
+    def test_many_small_withdrawals(self, bank: Bank):
+        bank.withdrawal_limits.set('client', timedelta(days = 1), 1500)
+        client = Client(bank, 'Пётр', 'Петров')
+        client_facade = ClientFacade(client)
+        account = client_facade.create_account('DebitAccount')
+        other = client_facade.create_account('DebitAccount')
+        client_facade.deposit(account.id, 10000)
+        assert client_facade.withdraw(account.id, 1000)
+        assert not client_facade.withdraw(account.id, 1000)
+        assert client_facade.withdraw(account.id, 500)
+        assert not client_facade.withdraw(other.id, 1)
+        assert client_facade.transfer(account.id, other.id, 5000)
+        assert account.balance == 3500
+
+        verified = ClientFacade(Client(bank, 'Иван', 'Иванов', '0123 456789', 'Москва'))
+        verified_account = verified.create_account('DebitAccount')
+        verified.deposit(verified_account.id, 5000)
+        assert verified.withdraw(verified_account.id, 5000)
+
+    def test_account_scope(self, client_facade: ClientFacade, bank: Bank):
+        bank.withdrawal_limits.set('account', timedelta(hours = 1), 100, unverified_only = False)
+        account = client_facade.create_account('DebitAccount')
+        other = client_facade.create_account('DebitAccount')
+        client_facade.deposit(account.id, 1000)
+        client_facade.deposit(other.id, 1000)
+        assert client_facade.withdraw(account.id, 100)
+        assert not client_facade.withdraw(account.id, 1)
+        assert client_facade.withdraw(other.id, 100)
+
+        results = client_facade.transfer_batch(
+            [(other.id, client_facade.client.default_cash_account.id, 1, None)] * 2)
+        assert not any(results)
+
+    def test_counters(self, bank: Bank):
+        limits = bank.withdrawal_limits
+        limits.set('client', timedelta(days = 1), 1500)
+        limits.set('account', timedelta(hours = 1), 1000, unverified_only = False)
+        verified = ClientFacade(Client(bank, 'Иван', 'Иванов', '0123 456789', 'Москва'))
+        account = verified.create_account('DebitAccount')
+        verified.deposit(account.id, 5000)
+        assert verified.withdraw(account.id, 100)
+        # клиентский лимит действует только на клиентов без документов
+        counters = limits._counters # pylint: disable=protected-access
+        assert list(counters) == [('account', 3600 * 10**6, account.id)]
+
+        cash = verified.client.default_cash_account
+        withdrawal = Transaction(account, cash, 100)
+        withdrawal.datetime = datetime.now() + timedelta(hours = 2)
+        assert withdrawal.perform()
+        assert len(counters) == 1
+        limits._sweep(to_timestamp(datetime.now() + timedelta(hours = 4))) # pylint: disable=protected-access
+        assert not counters
+
+    def test_rolling(self, client_facade: ClientFacade, bank: Bank):
+        bank.withdrawal_limits.set('client', timedelta(hours = 1), 100, unverified_only = False)
+        account = client_facade.create_account('DebitAccount')
+        client_facade.deposit(account.id, 1000)
+        cash = client_facade.client.default_cash_account
+        old = Transaction(account, cash, 100)
+        old.datetime = datetime.now() - timedelta(hours = 2)
+        assert old.perform()
+        assert client_facade.withdraw(account.id, 100)
+        assert not client_facade.withdraw(account.id, 100)
+
+    def test_settings(self, bank: Bank):
+        with pytest.raises(ValueError):
+            bank.withdrawal_limits.set('bank', timedelta(days = 1), 100)
+        bank.withdrawal_limits.set('client', timedelta(days = 1), 100)
+        assert bank.withdrawal_limits.info() == [
+            {'scope': 'client', 'window': 86400, 'amount': 100, 'unverified_only': True}]
+        bank.withdrawal_limits.set('client', timedelta(days = 1), None)
+        assert not bank.withdrawal_limits
 
 
 @pytest.fixture
@@ -261,3 +496,65 @@ class TestClientFacade:
         assert client_facade.transfer(account1.id, account2.id, 1000, client_facade2.client.bank)
         assert account1.balance == 0
         assert account2.balance == 1000
+
+    def test_transfer_batch(self, client_facade: ClientFacade):
+        account1 = client_facade.create_account('DebitAccount')
+        account2 = client_facade.create_account('DebitAccount')
+        account1.balance = 1000
+
+        results = client_facade.transfer_batch([
+            (account1.id, account2.id, 600, None),
+            (account1.id, account2.id, 600, None),
+            (account2.id, account1.id, 100, None),
+            (uuid4(), account1.id, 1, None),
+        ])
+        assert [bool(result) for result in results] == [True, False, True, False]
+        assert (account1.balance, account2.balance) == (500, 500)
+        assert len(account1.history) == 2
+
+    def test_transfer_batch_atomic(self, client_facade: ClientFacade):
+        account1 = client_facade.create_account('DebitAccount')
+        account2 = client_facade.create_account('DebitAccount')
+        account1.balance = 1000
+
+        results = client_facade.transfer_batch([
+            (account1.id, account2.id, 600, None),
+            (account1.id, account2.id, 600, None),
+            (account2.id, account1.id, 100, None),
+        ], atomic = True)
+        assert not any(results)
+        assert (account1.balance, account2.balance) == (1000, 0)
+        assert len(account1.history) == 0
+
+    def test_stats(self, client_facade: ClientFacade):
+        account1 = client_facade.create_account('DebitAccount')
+        account2 = client_facade.create_account('DebitAccount')
+        client_facade.deposit(account1.id, 1000)
+        client_facade.transfer(account1.id, account2.id, 300)
+        client_facade.withdraw(account2.id, 100)
+        client_facade.withdraw(account2.id, 10**6)
+
+        stats = client_facade.get_stats(account1.id)
+        assert (stats.count, stats.debit, stats.credit) == (2, 300, 1000)
+        assert stats.day(date.today()) == (300, 1000)
+        assert stats.day(date.today() - timedelta(days = 1)) == (0, 0)
+        assert stats.last_activity == account1.history.see()[-1].datetime
+
+        client_stats = client_facade.get_stats()
+        assert (client_stats.count, client_stats.debit, client_stats.credit) == (3, 1400, 1400)
+
+        account2.history.see()[-1].cancel()
+        assert (client_facade.get_stats(account2.id).debit,
+                client_facade.get_stats(account2.id).credit) == (100, 400)
+        with pytest.raises(ValueError):
+            client_facade.get_stats(uuid4())
+
+    def test_stats_days_kept(self):
+        stats = Stats()
+        start = to_timestamp(datetime(2023, 1, 1))
+        for day in range(Stats.DAYS_KEPT + 5):
+            stats.add(day, 0, start + day * DAY)
+        assert stats.day(date(2023, 1, 1)) == (0, 0)
+        assert stats.day(date(2023, 1, 1) + timedelta(days = Stats.DAYS_KEPT + 4)) \
+            == (Stats.DAYS_KEPT + 4, 0)
+        assert stats.count == Stats.DAYS_KEPT + 5
@@ -0,0 +1,112 @@
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-module-docstring
+
+# pylint: disable=redefined-outer-name
+# pylint: disable=wrong-import-position
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from threading import Thread
+from types import SimpleNamespace
+import pytest
+from src import core
+from src.core import Bank, Client, ClientFacade, DebitAccount, Transaction
+from src.engine import ShardedEngine
+from src.json_bridge import SuperuserCommands
+from src.persistence import open_server_state
+
+
+@pytest.fixture
+def engine():
+    engine = ShardedEngine(4)
+    yield engine
+    engine.close()
+
+
+@pytest.fixture
+def client_facade(engine: ShardedEngine):
+    bank = Bank()
+    bank.engine = engine
+    return ClientFacade(Client(bank, 'Иван', 'Иванов', '0123 456789', 'Москва'))
+
+
+class TestShardedEngine:
+    def test_transfers(self, client_facade: ClientFacade):
+        accounts = [client_facade.create_account('DebitAccount') for _ in range(8)]
+        for account in accounts:
+            assert client_facade.deposit(account.id, 100)
+
+        def worker(seed: int):
+            for i in range(300):
+                client_facade.transfer(accounts[(seed + i) % 8].id,
+                                       accounts[(seed + i + 1 + i % 7) % 8].id, 9)
+
+        threads = [Thread(target = worker, args = (seed,)) for seed in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert sum(account.balance for account in accounts) == 800
+        for account in accounts:
+            assert account.balance >= 0
+            assert account.balance == sum(t.amount for t in account.history.see())
+
+    def test_cross_shard_rollback(self, client_facade: ClientFacade, engine: ShardedEngine):
+        client = client_facade.client
+        From = client.create_account(DebitAccount)
+        To = client.create_account(DebitAccount)
+        while engine.shard_of(To) == engine.shard_of(From):
+            To = client.create_account(DebitAccount)
+
+        assert not engine.perform(Transaction(From, To, -5)), \
+            'Получатель не может отдать деньги, которых у него нет'
+        assert (From.balance, To.balance) == (0, 0)
+        assert len(From.history) == 0
+
+    def test_snapshots(self, engine: ShardedEngine, tmp_path):
+        # снимок не снимается между резервом и зачислением: после восстановления
+        # балансы сходятся с историями
+        server_state = open_server_state(str(tmp_path), snapshot_every = 3)
+        SuperuserCommands.create_bank({'name': 'Сбер'}, server_state)
+        bank = server_state.banks['Сбер']
+        bank.engine = engine
+        client_facade = ClientFacade(Client(bank, 'Иван', 'Иванов', '0123 456789', 'Москва'))
+        accounts = [client_facade.create_account('DebitAccount') for _ in range(8)]
+        for account in accounts:
+            assert client_facade.deposit(account.id, 100)
+
+        def worker(seed: int):
+            for i in range(100):
+                client_facade.transfer(accounts[(seed + i) % 8].id,
+                                       accounts[(seed + 3 * i + 1) % 8].id, 7)
+
+        threads = [Thread(target = worker, args = (seed,)) for seed in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        balances = {account.id: account.balance for account in accounts}
+        server_state.journal.close()
+
+        restored = open_server_state(str(tmp_path)).banks['Сбер']
+        for account_id, balance in balances.items():
+            account = restored.accounts[account_id]
+            assert account.balance == balance
+            assert balance == sum(t.amount for t in account.history.see())
+
+    def test_perform_observer(self, client_facade: ClientFacade, monkeypatch):
+        observed = []
+
+        def observe_perform(transaction):
+            observed.append(transaction)
+            return transaction._perform_without_checking_permissions() # pylint: disable=protected-access
+
+        monkeypatch.setattr(core, 'perform_observer',
+                            SimpleNamespace(observe_perform = observe_perform))
+        account = client_facade.create_account('DebitAccount')
+        assert client_facade.deposit(account.id, 10)
+        assert len(observed) == 1 and account.balance == 10
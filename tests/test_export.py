@@ -0,0 +1,90 @@
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-module-docstring
+
+# pylint: disable=redefined-outer-name
+# pylint: disable=wrong-import-position
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+import pytest
+from src.core import Bank, Client, ClientFacade, DebitAccount, Transaction
+from src.export import (FIELDS, account_rows, bank_rows, export, iter_history,
+                        write_csv, write_jsonl)
+
+
+@pytest.fixture
+def bank():
+    bank = Bank()
+    client_facade = ClientFacade(Client(bank, 'Иван', 'Иванов', '0123 456789', 'Москва'))
+    debit = client_facade.create_account('DebitAccount')
+    credit = client_facade.create_account('CreditAccount', credit_limit = 1000,
+                                          interest_rate = 0.1)
+    start = datetime(2023, 1, 1)
+    for day in range(10):
+        transaction = Transaction(client_facade.client.default_cash_account, debit, 100 + day)
+        transaction.datetime = start + timedelta(days = day)
+        assert transaction.perform()
+    transaction = Transaction(debit, credit, 50)
+    transaction.datetime = start + timedelta(days = 20)
+    assert transaction.perform()
+    return bank
+
+
+def debit_account(bank: Bank):
+    return [a for a in bank.accounts.values() if isinstance(a, DebitAccount)][0]
+
+
+class TestExport:
+    def test_iter_history_pages(self, bank: Bank):
+        account = debit_account(bank)
+        assert list(iter_history(account.history, chunk_size = 3)) == account.history.see()
+        assert len(list(iter_history(account.history, chunk_size = 11))) == 11
+
+    def test_filters(self, bank: Bank):
+        rows = list(account_rows(debit_account(bank), after = datetime(2023, 1, 3),
+                                 before = datetime(2023, 1, 6), chunk_size = 2))
+        assert [row['amount'] for row in rows] == [103, 104]
+        assert {row['account_type'] for row in bank_rows(bank)} \
+            == {'CashAccount', 'DebitAccount', 'CreditAccount'}
+        rows = list(bank_rows(bank, account_types = {'CreditAccount'}))
+        assert len(rows) == 1 and rows[0]['amount'] == 50
+
+    def test_csv(self, bank: Bank):
+        file = io.StringIO(newline = '')
+        assert write_csv(bank_rows(bank, account_types = {'DebitAccount'}), file,
+                         chunk_size = 4) == 11
+        file.seek(0)
+        rows = list(csv.DictReader(file))
+        assert list(rows[0]) == FIELDS
+        assert [int(row['amount']) for row in rows][-2:] == [109, -50]
+
+    def test_jsonl(self, bank: Bank, tmp_path):
+        path = str(tmp_path / 'bank.jsonl')
+        assert export(bank_rows(bank), path, chunk_size = 5) == 22
+        with open(path, encoding = 'utf-8') as file:
+            rows = [json.loads(line) for line in file]
+        assert rows == list(bank_rows(bank))
+        assert sum(row['amount'] for row in rows) == 0
+
+        buffer = io.StringIO()
+        write_jsonl(iter([]), buffer)
+        assert buffer.getvalue() == ''
+
+    def test_parquet(self, bank: Bank, tmp_path):
+        parquet = pytest.importorskip('pyarrow.parquet')
+        path = str(tmp_path / 'bank.parquet')
+        assert export(bank_rows(bank), path, chunk_size = 5) == 22
+        table = parquet.read_table(path)
+        assert table.num_rows == 22
+        assert table.column_names == FIELDS
+
+    def test_unknown_format(self, bank: Bank, tmp_path):
+        with pytest.raises(ValueError):
+            export(bank_rows(bank), str(tmp_path / 'bank.xlsx'))
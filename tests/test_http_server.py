@@ -0,0 +1,106 @@
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-module-docstring
+
+# pylint: disable=wrong-import-position
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import json
+from datetime import datetime
+from uuid import uuid4
+from src.http_server import JSONServer, dumps
+from src.json_bridge import ServerState
+
+
+def post(path: str, body, headers: dict | None = None) -> bytes:
+    data = json.dumps(body).encode()
+    head = ''.join(f'{name}: {value}\r\n' for name, value in (headers or {}).items())
+    return (f'POST {path} HTTP/1.1\r\nContent-Length: {len(data)}\r\n{head}\r\n').encode() + data
+
+
+async def read_response(reader: asyncio.StreamReader):
+    head = (await reader.readuntil(b'\r\n\r\n')).decode()
+    status = int(head.split(' ')[1])
+    length = int(head.lower().split('content-length: ')[1].split('\r\n')[0])
+    return status, json.loads(await reader.readexactly(length))
+
+
+def serve(scenario):
+    async def run():
+        server = await JSONServer(ServerState(), 'secret').start('127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        try:
+            return await scenario(reader, writer)
+        finally:
+            writer.close()
+            server.close()
+            await server.wait_closed()
+    return asyncio.run(run())
+
+
+class TestJSONServer:
+    def test_pipelined_keep_alive(self):
+        async def scenario(reader, writer):
+            sudo = {'X-Superuser-Key': 'secret'}
+            writer.write(post('/superuser/create_bank', {'name': 'Сбер'}, sudo)
+                         + post('/superuser/create_client',
+                                {'bank': 'Сбер', 'name': 'Иван', 'surname': 'Иванов'}, sudo))
+            _, bank = await read_response(reader)
+            _, client = await read_response(reader)
+            assert bank['status'] == client['status'] == 'ok'
+
+            token = {'X-Client-Token': client['client_token']}
+            writer.write(post('/client/create_account', {'account_type': 'DebitAccount'}, token))
+            _, account = await read_response(reader)
+            account_id = account['info']['id']
+
+            writer.write(post('/client/deposit', [{'account_id': account_id, 'amount': 10},
+                                                  {'account_id': account_id, 'amount': 5},
+                                                  'garbage'], token)
+                         + post('/client/show_history', {'account_id': account_id}, token))
+            status, batch = await read_response(reader)
+            _, history = await read_response(reader)
+            assert status == 200
+            assert [result['status'] for result in batch] == ['ok', 'ok', 'error']
+            assert len(history['history']) == 2
+            datetime.fromisoformat(history['history'][0]['datetime'])
+
+        serve(scenario)
+
+    def test_errors(self):
+        async def scenario(reader, writer):
+            writer.write(post('/superuser/create_bank', {'name': 'Сбер'}, {'X-Superuser-Key': 'x'})
+                         + post('/client/show_accounts', {}, {'X-Client-Token': str(uuid4())})
+                         + post('/nowhere', {})
+                         + b'POST /client/show_accounts HTTP/1.1\r\nContent-Length: 1\r\n\r\n{')
+            statuses = [(await read_response(reader))[0] for _ in range(4)]
+            assert statuses == [403, 401, 404, 401]
+
+            writer.write(post('/client/show_accounts', {}, {'Connection': 'close'}))
+            await read_response(reader)
+            assert await reader.read() == b''
+
+        serve(scenario)
+
+    def test_encoder(self):
+        transaction_id = uuid4()
+        moment = datetime(2023, 5, 1, 12, 30)
+        assert json.loads(dumps({'id': transaction_id, 'datetime': moment})) \
+            == {'id': str(transaction_id), 'datetime': moment.isoformat()}
+
+    def test_command_exception(self):
+        async def scenario(reader, writer):
+            sudo = {'X-Superuser-Key': 'secret'}
+            writer.write(post('/superuser/create_client',
+                              {'bank': 'Нет такого', 'name': 'Иван', 'surname': 'Иванов'}, sudo)
+                         + post('/superuser/create_bank', {'name': 'Сбер'}, sudo))
+            return await read_response(reader), await read_response(reader)
+
+        (status, failed), (_, created) = serve(scenario)
+        assert status == 500 and failed['status'] == 'error'
+        assert created['status'] == 'ok'
@@ -0,0 +1,140 @@
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-module-docstring
+
+# pylint: disable=wrong-import-position
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import io
+import sqlite3
+from uuid import uuid4
+from src import idempotency
+from src.async_bridge import AsyncCommands
+from src.idempotency import IdempotencyCache
+from src.json_bridge import ClientCommands, ServerState, SuperuserCommands
+from src.persistence import (COMMAND_COMPLETED, TRANSACTION, WriteAheadLog,
+                             open_server_state, read_records)
+from src.sqlite_storage import SQLiteStorage
+
+
+def create_client(server_state: ServerState):
+    SuperuserCommands.create_bank({'name': 'Сбер', 'unathorized_withdrawal_limit': '1000'},
+                                  server_state)
+    token = SuperuserCommands.create_client(
+        {'bank': 'Сбер', 'name': 'Иван', 'surname': 'Иванов'}, server_state)['client_token']
+    client_facade = server_state.get_client_facade_by_token(token)
+    assert client_facade is not None
+    debit = client_facade.create_account('DebitAccount')
+    return token, client_facade, debit
+
+
+class TestIdempotency:
+    def test_repeated_commands(self):
+        server_state = ServerState()
+        _, client_facade, debit = create_client(server_state)
+        command = {'account_id': str(debit.id), 'amount': '100', 'idempotency_key': 'a'}
+        first = ClientCommands.deposit(command, client_facade, server_state)
+        assert ClientCommands.deposit(command, client_facade, server_state) == first
+        assert debit.balance == 100
+
+        # тот же ключ с другой суммой или в другой команде — ошибка, а не чужой результат
+        reused = ClientCommands.deposit(dict(command, amount = '200'), client_facade, server_state)
+        assert reused['status'] == 'error'
+        assert ClientCommands.withdraw(command, client_facade, server_state) == reused
+        assert debit.balance == 100
+
+        command = {'account_id': str(debit.id), 'amount': '500', 'idempotency_key': 'b'}
+        assert ClientCommands.withdraw(command, client_facade, server_state)['status'] == 'error'
+        debit.balance = 1000
+        assert ClientCommands.withdraw(command, client_facade, server_state)['status'] == 'error'
+        assert debit.balance == 1000
+
+        # без ключа или без server_state команда выполняется каждый раз
+        command = {'account_id': str(debit.id), 'amount': '100'}
+        ClientCommands.deposit(command, client_facade, server_state)
+        ClientCommands.deposit(command, client_facade)
+        assert debit.balance == 1200
+
+    def test_async_commands(self):
+        server_state = ServerState()
+        _, client_facade, debit = create_client(server_state)
+        commands = AsyncCommands(server_state)
+        command = {'account_id': str(debit.id), 'amount': '100', 'idempotency_key': str(uuid4())}
+
+        async def run():
+            return await asyncio.gather(*[commands.client('deposit', dict(command), client_facade)
+                                          for _ in range(5)])
+
+        results = asyncio.run(run())
+        assert all(result == results[0] for result in results)
+        assert debit.balance == 100
+
+    def test_cache_bounds(self, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr(idempotency, 'time', lambda: now[0])
+        cache = IdempotencyCache(size = 2, ttl = 10)
+        client_id = uuid4()
+        for key in 'abc':
+            cache.put((client_id, key), {'status': key})
+        assert len(cache) == 2 and cache.get((client_id, 'a')) is None
+        assert cache.get((client_id, 'c')) == {'status': 'c'}
+        now[0] += 10
+        assert cache.get((client_id, 'c')) is None
+        calls = []
+        assert cache.run((client_id, 'c'), lambda: calls.append(1) or {'status': 'ok'}) \
+            == {'status': 'ok'}
+        assert len(cache) == 1 and calls == [1]
+
+    def test_persistence(self, tmp_path):
+        server_state = open_server_state(str(tmp_path))
+        token, client_facade, debit = create_client(server_state)
+        command = {'account_id': str(debit.id), 'amount': '100', 'idempotency_key': 'a'}
+        result = ClientCommands.deposit(command, client_facade, server_state)
+        server_state.journal.snapshot()
+        ClientCommands.deposit(dict(command, idempotency_key = 'b'), client_facade, server_state)
+        server_state.journal.close()
+
+        restored = open_server_state(str(tmp_path))
+        client_facade = restored.get_client_facade_by_token(token)
+        assert ClientCommands.deposit(command, client_facade, restored) == result
+        assert ClientCommands.withdraw(command, client_facade, restored)['status'] == 'error'
+        ClientCommands.deposit(dict(command, idempotency_key = 'b'), client_facade, restored)
+        assert client_facade.client.bank.accounts[debit.id].balance == 200
+        restored.journal.close()
+
+    def test_journal_operation(self, tmp_path, monkeypatch):
+        server_state = open_server_state(str(tmp_path))
+        _, client_facade, debit = create_client(server_state)
+        writes = []
+        monkeypatch.setattr(WriteAheadLog, 'append', lambda self, frame: writes.append(frame))
+        command = {'account_id': str(debit.id), 'amount': '100', 'idempotency_key': 'a'}
+        ClientCommands.deposit(command, client_facade, server_state)
+        # транзакция и результат команды дописываются в журнал одной записью
+        assert [[record_type for record_type, _ in read_records(io.BytesIO(frames))]
+                for frames in writes] == [[TRANSACTION, COMMAND_COMPLETED]]
+        monkeypatch.undo()
+        server_state.journal.close()
+
+    def test_sqlite(self, tmp_path):
+        storage = SQLiteStorage(str(tmp_path / 'bank.sqlite3'))
+        server_state = storage.open_server_state()
+        token, client_facade, debit = create_client(server_state)
+        command = {'account_id': str(debit.id), 'amount': '100', 'idempotency_key': 'a'}
+        result = ClientCommands.deposit(command, client_facade, server_state)
+        # результат команды попадает в базу только вместе с её транзакцией
+        with sqlite3.connect(str(tmp_path / 'bank.sqlite3')) as connection:
+            for table in ('idempotency', 'transactions'):
+                assert connection.execute(f'SELECT COUNT(*) FROM {table}').fetchone() == (0,)
+        storage.close()
+
+        storage = SQLiteStorage(str(tmp_path / 'bank.sqlite3'))
+        restored = storage.open_server_state()
+        client_facade = restored.get_client_facade_by_token(token)
+        assert ClientCommands.deposit(command, client_facade, restored) == result
+        assert ClientCommands.withdraw(command, client_facade, restored)['status'] == 'error'
+        assert client_facade.client.bank.accounts[debit.id].balance == 100
+        storage.close()
@@ -0,0 +1,122 @@
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-module-docstring
+
+# pylint: disable=wrong-import-position
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import date
+from threading import Barrier, Thread
+from src.core import Bank, Client, ClientFacade
+from src.interest import InterestAccrual, SERVICE_ACCOUNT
+from src.json_bridge import SuperuserCommands
+from src.persistence import open_server_state
+from src.sqlite_storage import SQLiteStorage
+
+
+class TestInterestAccrual:
+    def test_run_is_idempotent(self):
+        bank = Bank()
+        client_facade = ClientFacade(Client(bank, 'Иван', 'Иванов', '1', '2'))
+        indebted = client_facade.create_account('CreditAccount', credit_limit=10**6,
+                                                interest_rate=0.365)
+        positive = client_facade.create_account('CreditAccount', credit_limit=10**6,
+                                                interest_rate=0.365)
+        client_facade.withdraw(indebted.id, 10_000)
+        client_facade.deposit(positive.id, 10_000)
+
+        accrual = InterestAccrual(bank)
+        assert accrual.run(date(2023, 5, 1)) \
+            == {'date': date(2023, 5, 1), 'charged': 1, 'skipped': 0, 'total': 10}
+        assert indebted.balance == -10_010
+        assert positive.balance == 10_000
+        service = bank.service_account(SERVICE_ACCOUNT)
+        assert service.balance == 10
+
+        assert accrual.run(date(2023, 5, 1)) \
+            == {'date': date(2023, 5, 1), 'charged': 0, 'skipped': 2, 'total': 0}
+        assert InterestAccrual(bank).run(date(2023, 5, 1))['skipped'] == 2
+        assert indebted.balance == -10_010
+
+        # прерванный запуск: отметки о дате нет, но списание уже в реестре
+        bank.interest_accrued = None
+        assert accrual.run(date(2023, 5, 1))['skipped'] == 1
+        assert indebted.balance == -10_010
+
+        accrual.run(date(2023, 5, 2))
+        assert indebted.balance == -10_020
+        assert [t.amount for t in service.history.see()] == [10, 10]
+        assert service.stats.count == 2
+        # более ранняя дата уже пройдена
+        assert accrual.run(date(2023, 4, 30))['charged'] == 0
+        assert bank.interest_accrued == date(2023, 5, 2)
+
+    def test_concurrent_runs(self):
+        bank = Bank()
+        client_facade = ClientFacade(Client(bank, 'Иван', 'Иванов', '1', '2'))
+        for _ in range(50):
+            account = client_facade.create_account('CreditAccount', credit_limit=10**6,
+                                                   interest_rate=0.365)
+            client_facade.withdraw(account.id, 10_000)
+        accruals = [InterestAccrual(bank) for _ in range(8)]
+        barrier = Barrier(len(accruals))
+        results = []
+
+        def run(accrual):
+            barrier.wait()
+            results.append(accrual.run(date(2023, 5, 1))['charged'])
+
+        threads = [Thread(target=run, args=(accrual,)) for accrual in accruals]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sorted(results) == [0] * 7 + [50]
+        assert bank.service_account(SERVICE_ACCOUNT).balance == 500
+
+    def test_command_after_restart(self, tmp_path):
+        server_state = open_server_state(str(tmp_path))
+        SuperuserCommands.create_bank({'name': 'Сбер'}, server_state)
+        token = SuperuserCommands.create_client(
+            {'bank': 'Сбер', 'name': 'Иван', 'surname': 'Иванов',
+             'passport': '1', 'address': '2'}, server_state)['client_token']
+        client_facade = server_state.client_facades[token]
+        account = client_facade.create_account('CreditAccount', credit_limit=1000,
+                                               interest_rate=0.365)
+        client_facade.withdraw(account.id, 1000)
+        command = {'bank': 'Сбер', 'date': '2023-05-01'}
+        assert SuperuserCommands.accrue_interest(command, server_state)['charged'] == 1
+        server_state.journal.close()
+
+        restored = open_server_state(str(tmp_path))
+        answer = SuperuserCommands.accrue_interest(command, restored)
+        assert (answer['charged'], answer['skipped'], answer['total']) == (0, 1, 0)
+        bank = restored.banks['Сбер']
+        assert bank.accounts[account.id].balance == -1001
+        assert bank.service_account(SERVICE_ACCOUNT).balance == 1
+        assert SuperuserCommands.accrue_interest({'bank': 'ВТБ'}, restored)['status'] == 'error'
+
+    def test_command_with_sqlite(self, tmp_path):
+        storage = SQLiteStorage(str(tmp_path / 'bank.sqlite3'))
+        server_state = storage.open_server_state()
+        SuperuserCommands.create_bank({'name': 'Сбер'}, server_state)
+        token = SuperuserCommands.create_client(
+            {'bank': 'Сбер', 'name': 'Иван', 'surname': 'Иванов',
+             'passport': '1', 'address': '2'}, server_state)['client_token']
+        client_facade = server_state.client_facades[token]
+        account = client_facade.create_account('CreditAccount', credit_limit=1000,
+                                               interest_rate=0.365)
+        client_facade.withdraw(account.id, 1000)
+        command = {'bank': 'Сбер', 'date': '2023-05-01'}
+        assert SuperuserCommands.accrue_interest(command, server_state)['charged'] == 1
+        storage.close()
+
+        storage = SQLiteStorage(str(tmp_path / 'bank.sqlite3'))
+        restored = storage.open_server_state()
+        assert restored.banks['Сбер'].interest_accrued == date(2023, 5, 1)
+        assert SuperuserCommands.accrue_interest(command, restored)['skipped'] == 1
+        assert restored.banks['Сбер'].accounts[account.id].balance == -1001
+        storage.close()
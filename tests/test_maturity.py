@@ -0,0 +1,65 @@
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-module-docstring
+
+# pylint: disable=wrong-import-position
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+from datetime import date
+from src.core import Bank, Client, ClientFacade, DepositAccount
+from src.json_bridge import ServerState
+from src.maturity import MaturityScheduler, pay_out
+
+
+class TestMaturity:
+    def test_index_order(self):
+        bank = Bank()
+        client = Client(bank, 'Иван', 'Иванов', '1', '2')
+        dates = [date(2021, 3, 1), date(2020, 1, 1), date(2022, 1, 1), date(2020, 6, 1)]
+        for end_date in dates:
+            client.create_account(DepositAccount, end_date=end_date)
+        client.create_account(DepositAccount, end_date=date(2999, 1, 1))
+
+        assert [a.end_date for a in bank.maturities.pop_matured(date(2021, 12, 31))] \
+            == sorted(dates)[:3]
+        assert bank.maturities.pop_matured(date(2021, 12, 31)) == []
+        assert bank.maturities.next_date() == date(2022, 1, 1)
+        assert len(bank.maturities) == 2
+
+    def test_pay_out(self):
+        bank = Bank()
+        client_facade = ClientFacade(Client(bank, 'Иван', 'Иванов'))
+        debit = client_facade.create_account('DebitAccount')
+        deposit = client_facade.create_account('DepositAccount', end_date=date(2020, 1, 1),
+                                               payout_account_id=debit.id)
+        to_cash = client_facade.create_account('DepositAccount', end_date=date(2020, 1, 1))
+        client_facade.deposit(deposit.id, 100)
+        client_facade.deposit(to_cash.id, 50)
+
+        payouts = pay_out(bank, date.today(), batch_size=1)
+        assert [(p.deposit, p.target, p.amount, bool(p.result)) for p in payouts] \
+            == [(deposit, debit, 100, True),
+                (to_cash, client_facade.client.default_cash_account, 50, False)]
+        assert debit.balance == 100 and deposit.balance == 0
+        # неудавшаяся выплата (нет паспорта) повторится в следующий раз
+        assert bank.maturities.pop_matured(date.today()) == [to_cash]
+
+    def test_scheduler_notifies(self):
+        server_state = ServerState()
+        server_state.banks['Сбер'] = bank = Bank()
+        client_facade = ClientFacade(Client(bank, 'Иван', 'Иванов', '1', '2'))
+        deposit = client_facade.create_account('DepositAccount', end_date=date(2020, 1, 1))
+        client_facade.deposit(deposit.id, 10)
+
+        sent = []
+        async def notify(client, text):
+            sent.append((client, text))
+
+        payouts = asyncio.run(MaturityScheduler(server_state, notify).run_once(date.today()))
+        assert len(payouts) == 1
+        assert sent == [(client_facade.client, payouts[0].message())]
+        assert asyncio.run(MaturityScheduler(server_state, notify).run_once(date.today())) == []
@@ -0,0 +1,63 @@
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-module-docstring
+
+# pylint: disable=redefined-outer-name
+# pylint: disable=wrong-import-position
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from urllib.request import urlopen
+import pytest
+from src import core, metrics
+from src.json_bridge import ClientCommands, ServerState, SuperuserCommands
+
+
+@pytest.fixture
+def registry():
+    server_state = ServerState()
+    yield metrics.enable(server_state)
+    metrics.disable()
+
+
+class TestMetrics:
+    def test_disabled_by_default(self):
+        assert metrics.registry is None
+        assert core.perform_observer is None
+        assert not hasattr(ClientCommands.withdraw, '__wrapped__')
+
+    def test_commands_and_perform(self, registry):
+        server_state = registry.server_state
+        SuperuserCommands.create_bank({'name': 'Сбер'}, server_state)
+        token = SuperuserCommands.create_client(
+            {'bank': 'Сбер', 'name': 'Иван', 'surname': 'Иванов'}, server_state)['client_token']
+        client_facade = server_state.client_facades[token]
+        account = client_facade.create_account('DebitAccount')
+        command = {'account_id': str(account.id), 'amount': '10'}
+        ClientCommands.deposit(command, client_facade)
+        ClientCommands.withdraw({**command, 'amount': '100'}, client_facade)
+
+        assert registry.commands.get('client', 'deposit', 'ok') == 1
+        assert registry.commands.get('client', 'withdraw', 'error') == 1
+        assert registry.transactions.get('ok') == 1
+        assert registry.transactions.get('rejected') == 1
+        assert registry.failures.get('not_enough_money') == 1
+        assert registry.perform_seconds.count('checks') == 2
+        assert registry.perform_seconds.count('apply') == 1
+
+        text = registry.render()
+        assert 'bank_commands_total{scope="client",command="deposit",status="ok"} 1' in text
+        assert 'bank_transaction_perform_seconds_count{phase="apply"} 1' in text
+        assert 'bank_history_size_bucket{le="1"} 2' in text
+
+    def test_endpoint(self, registry):
+        server = metrics.serve(0)
+        try:
+            port = server.server_address[1]
+            with urlopen(f'http://127.0.0.1:{port}/metrics') as response:
+                assert b'# TYPE bank_commands_total counter' in response.read()
+        finally:
+            server.shutdown()
+        assert registry is metrics.registry
@@ -0,0 +1,185 @@
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-module-docstring
+
+# pylint: disable=redefined-outer-name
+# pylint: disable=wrong-import-position
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from threading import Thread
+from uuid import UUID
+import pytest
+from src.core import DepositAccount
+from src.json_bridge import ServerState, SuperuserCommands, ClientCommands
+from src.persistence import open_server_state
+
+
+def fill(server_state: ServerState) -> UUID:
+    SuperuserCommands.create_bank({'name': 'Сбер', 'unathorized_withdrawal_limit': '100'},
+                                  server_state)
+    token = SuperuserCommands.create_client(
+        {'bank': 'Сбер', 'name': 'Иван', 'surname': 'Иванов'}, server_state)['client_token']
+    client_facade = server_state.client_facades[token]
+
+    debit = client_facade.create_account('DebitAccount')
+    client_facade.create_account('DepositAccount', end_date = date(2030, 1, 1))
+    client_facade.deposit(debit.id, 1000)
+    client_facade.withdraw(debit.id, 50)
+    SuperuserCommands.update_client({'passport': '0123 456789', 'address': 'Москва'},
+                                    client_facade)
+    client_facade.withdraw(debit.id, 500)
+    SuperuserCommands.cancel_transaction(
+        {'transaction_id': str(debit.history.see()[-1].id)}, server_state)
+    return token
+
+
+def dump(server_state: ServerState):
+    return {
+        name: sorted((str(account.id), type(account).__name__, account.balance,
+                      [t.info() for t in account.history.see()])
+                     for account in bank.accounts.values())
+        for name, bank in server_state.banks.items()
+    }
+
+
+@pytest.fixture
+def directory(tmp_path):
+    return str(tmp_path / 'data')
+
+
+class TestPersistence:
+    def test_replay_wal(self, directory):
+        server_state = open_server_state(directory)
+        token = fill(server_state)
+        expected = dump(server_state)
+        server_state.journal.close()
+
+        restored = open_server_state(directory)
+        assert dump(restored) == expected
+        client = restored.client_facades[token].client
+        assert client.passport == '0123 456789'
+        deposit = [a for a in client.accounts.values() if isinstance(a, DepositAccount)][0]
+        assert deposit.end_date == date(2030, 1, 1)
+
+    def test_snapshot_and_tail(self, directory):
+        server_state = open_server_state(directory, snapshot_every = 5)
+        token = fill(server_state)
+        client_facade = server_state.client_facades[token]
+        account = client_facade.get_accounts()[0]
+        client_facade.deposit(account.id, 7)
+        expected = dump(server_state)
+        server_state.journal.close()
+
+        assert os.path.exists(os.path.join(directory, 'snapshot.bin'))
+        restored = open_server_state(directory)
+        assert dump(restored) == expected
+
+        ClientCommands.deposit({'account_id': str(account.id), 'amount': '3'},
+                               restored.client_facades[token])
+        expected = dump(restored)
+        restored.journal.snapshot()
+        restored.journal.close()
+        assert dump(open_server_state(directory)) == expected
+
+    def test_snapshot_during_batch(self, directory):
+        server_state = open_server_state(directory, snapshot_every = 3)
+        token = fill(server_state)
+        client_facade = server_state.client_facades[token]
+        debit = client_facade.get_accounts()[0]
+        other = client_facade.create_account('DebitAccount')
+        snapshot = os.path.join(directory, 'snapshot.bin')
+        os.remove(snapshot)
+        # порог снимка пересекается посреди пачки: снимок снимается после неё
+        results = client_facade.transfer_batch([(debit.id, other.id, 10, None)] * 5)
+        assert all(results) and os.path.exists(snapshot)
+        expected = dump(server_state)
+        server_state.journal.close()
+
+        restored = open_server_state(directory)
+        assert dump(restored) == expected
+        accounts = restored.banks['Сбер'].accounts
+        assert (accounts[debit.id].balance, accounts[other.id].balance) == (900, 50)
+
+    def test_snapshots_with_threads(self, directory):
+        server_state = open_server_state(directory, snapshot_every = 7)
+        token = fill(server_state)
+        client_facade = server_state.client_facades[token]
+        debit = client_facade.get_accounts()[0]
+        others = [client_facade.create_account('DebitAccount') for _ in range(4)]
+
+        def transfers(other):
+            for _ in range(50):
+                client_facade.transfer(debit.id, other.id, 1)
+                client_facade.transfer(other.id, debit.id, 1)
+
+        with ThreadPoolExecutor(4) as executor:
+            list(executor.map(transfers, others))
+        expected = dump(server_state)
+        server_state.journal.close()
+        assert dump(open_server_state(directory)) == expected
+
+    def test_create_during_snapshot(self, directory, monkeypatch):
+        server_state = open_server_state(directory)
+        token = fill(server_state)
+        client_facade = server_state.client_facades[token]
+        snapshots = []
+
+        def account_created(account):
+            # снимок из другого потока посреди создания счёта ждёт его окончания:
+            # иначе счёт попадёт и в снимок, и в журнал после него
+            snapshot = Thread(target=server_state.journal.snapshot)
+            snapshot.start()
+            snapshot.join(0.2)
+            snapshots.append(snapshot)
+            assert snapshot.is_alive()
+
+        monkeypatch.setattr(server_state.storage, 'account_created', account_created)
+        account = client_facade.create_account('DebitAccount')
+        SuperuserCommands.create_client(
+            {'bank': 'Сбер', 'name': 'Пётр', 'surname': 'Петров'}, server_state)
+        for snapshot in snapshots:
+            snapshot.join()
+        assert len(snapshots) == 2
+        client_facade.deposit(account.id, 10)
+        expected = dump(server_state)
+        server_state.journal.close()
+        assert dump(open_server_state(directory)) == expected
+
+    def test_torn_tail(self, directory):
+        server_state = open_server_state(directory)
+        fill(server_state)
+        expected = dump(server_state)
+        server_state.journal.close()
+
+        segment = os.path.join(directory, sorted(os.listdir(directory))[-1])
+        with open(segment, 'ab') as file:
+            file.write(b'\x10\x00\x00\x00\x06garbage')
+        assert dump(open_server_state(directory)) == expected
+
+    def test_withdrawal_limits(self, directory):
+        server_state = open_server_state(directory)
+        SuperuserCommands.create_bank({'name': 'Сбер', 'unathorized_withdrawal_limit': '100'},
+                                      server_state)
+        answer = SuperuserCommands.set_withdrawal_limit(
+            {'bank': 'Сбер', 'scope': 'client', 'window': 'day', 'amount': 150}, server_state)
+        assert answer['status'] == 'ok'
+        assert SuperuserCommands.set_withdrawal_limit(
+            {'bank': 'Сбер', 'scope': 'bank', 'window': 'day', 'amount': 1},
+            server_state)['status'] == 'error'
+        token = SuperuserCommands.create_client(
+            {'bank': 'Сбер', 'name': 'Иван', 'surname': 'Иванов'}, server_state)['client_token']
+        client_facade = server_state.client_facades[token]
+        debit = client_facade.create_account('DebitAccount')
+        client_facade.deposit(debit.id, 1000)
+        assert client_facade.withdraw(debit.id, 100)
+        server_state.journal.close()
+
+        restored = open_server_state(directory)
+        assert restored.banks['Сбер'].withdrawal_limits.info() == answer['limits']
+        assert not restored.client_facades[token].withdraw(debit.id, 100)
+        assert restored.client_facades[token].withdraw(debit.id, 50)
@@ -0,0 +1,82 @@
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-module-docstring
+
+# pylint: disable=redefined-outer-name
+# pylint: disable=wrong-import-position
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import io
+import json
+import pytest
+from src.core import Bank, Client, ClientFacade, Transaction, TransactionsHistory
+from src.reconcile import Reconciler
+from src.sqlite_storage import SQLiteStorage
+from src.json_bridge import SuperuserCommands
+
+
+def fill(bank: Bank, other_bank: Bank):
+    accounts = []
+    for i in range(6):
+        client_facade = ClientFacade(Client(bank, 'Иван', str(i), '0123 456789', 'Москва'))
+        account = client_facade.create_account('DebitAccount')
+        client_facade.deposit(account.id, 1000)
+        accounts.append(account)
+    for i in range(5):
+        assert Transaction(accounts[i], accounts[i + 1], 100).perform()
+    stranger = ClientFacade(Client(other_bank, 'Альберт', 'Эйнштейн')).create_account('DebitAccount')
+    assert Transaction(accounts[0], stranger, 300).perform()
+    return accounts
+
+
+@pytest.fixture
+def bank():
+    bank = Bank()
+    fill(bank, Bank())
+    return bank
+
+
+class TestReconciler:
+    def test_clean(self, bank: Bank):
+        reconciler = Reconciler(bank, processes = 0, partition_size = 4)
+        assert list(reconciler.discrepancies()) == []
+        assert reconciler.summary == {'accounts': 12, 'entries': 23, 'discrepancies': 0}
+
+    def test_discrepancies(self, bank: Bank):
+        account = [a for a in bank.accounts.values() if a.balance == 1000][0]
+        account.balance += 5
+        report = io.StringIO()
+        summary = Reconciler(bank, processes = 0, partition_size = 4).run(report)
+        found = [json.loads(line) for line in report.getvalue().splitlines()]
+        assert {item['check'] for item in found} == {'balance', 'conservation'}
+        assert found[0] == {'check': 'balance', 'account': str(account.id),
+                            'expected': 1000, 'actual': 1005}
+        assert summary['discrepancies'] == 2
+
+    def test_missing_mirror(self, bank: Bank):
+        account = [a for a in bank.accounts.values() if a.balance == 600][0]
+        view = account.history.see()[-1]
+        view.From.history = TransactionsHistory(view.From)
+        found = list(Reconciler(bank, processes = 0).discrepancies())
+        assert found == [{'check': 'mirror', 'account': str(account.id),
+                          'transaction': str(view.id), 'expected': 300, 'actual': None}]
+
+    def test_processes(self, bank: Bank):
+        bank.accounts[next(iter(bank.accounts))].balance += 1
+        reconciler = Reconciler(bank, processes = 2, partition_size = 3)
+        assert len(list(reconciler.discrepancies())) == 2
+        assert reconciler.summary['entries'] == 23
+
+    def test_sqlite(self, tmp_path):
+        storage = SQLiteStorage(str(tmp_path / 'bank.sqlite3'))
+        server_state = storage.open_server_state()
+        SuperuserCommands.create_bank({'name': 'Сбер'}, server_state)
+        SuperuserCommands.create_bank({'name': 'Тинькофф'}, server_state)
+        fill(server_state.banks['Сбер'], server_state.banks['Тинькофф'])
+        reconciler = Reconciler(server_state.banks['Сбер'], processes = 2)
+        assert list(reconciler.discrepancies()) == []
+        assert reconciler.summary['entries'] == 23
+        storage.close()
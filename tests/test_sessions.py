@@ -0,0 +1,89 @@
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-module-docstring
+
+# pylint: disable=wrong-import-position
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src import sessions
+from src.core import Bank, Client
+from src.json_bridge import ServerState, SuperuserCommands
+from src.persistence import open_server_state
+from src.sessions import FacadeCache, SessionStore, hash_token
+
+
+def create_client(server_state: ServerState) -> str:
+    SuperuserCommands.create_bank({'name': 'Сбер'}, server_state)
+    return str(SuperuserCommands.create_client(
+        {'bank': 'Сбер', 'name': 'Иван', 'surname': 'Иванов'}, server_state)['client_token'])
+
+
+class TestSessions:
+    def test_tokens_are_hashed(self, tmp_path):
+        server_state = open_server_state(str(tmp_path))
+        token = create_client(server_state)
+        client_facade = server_state.get_client_facade_by_token(token)
+        assert client_facade is not None
+        assert server_state.get_client_facade_by_token(token.upper()) is client_facade
+        assert server_state.get_client_facade_by_token(token.replace('-', '')) is client_facade
+        assert server_state.get_client_facade_by_token('not a token') is None
+        assert list(server_state.client_facades.token_hashes) == [hash_token(token)]
+        server_state.journal.close()
+
+        for name in os.listdir(tmp_path):
+            with open(tmp_path / name, 'rb') as file:
+                assert token.encode() not in file.read()
+        restored = open_server_state(str(tmp_path))
+        assert restored.get_client_facade_by_token(token).client.id == client_facade.client.id
+
+    def test_session(self):
+        server_state = ServerState()
+        token = create_client(server_state)
+        session_id = server_state.open_session(token)
+        assert server_state.open_session('0' * 36) is None
+        assert isinstance(session_id, str) and token not in session_id
+
+        client_facade = server_state.get_client_facade_by_session(session_id)
+        assert client_facade is server_state.get_client_facade_by_token(token)
+        assert server_state.get_client_facade_by_session('unknown') is None
+        server_state.sessions.close(session_id)
+        assert server_state.get_client_facade_by_session(session_id) is None
+
+    def test_session_ttl(self, monkeypatch):
+        now = [100.0]
+        monkeypatch.setattr(sessions, 'monotonic', lambda: now[0])
+        store = SessionStore(ttl=10)
+        first, second = store.open('client1'), store.open('client2') # type: ignore
+        now[0] = 105
+        assert store.resolve(first) == 'client1'
+        now[0] = 112
+        assert store.resolve(first) == 'client1'
+        assert store.resolve(second) is None
+        now[0] = 200
+        assert store.expire() == 1 and len(store) == 0
+
+        store.open('client1') # type: ignore
+        now[0] = 300
+        third = store.open('client1') # type: ignore
+        assert len(store) == 1, 'истёкшие сессии удаляются при открытии новых'
+        assert store.resolve(store.open('client1', previous = third)) == 'client1' # type: ignore
+        assert store.resolve(third) is None and len(store) == 1
+
+    def test_facade_cache(self, monkeypatch):
+        now = [0.0]
+        monkeypatch.setattr(sessions, 'monotonic', lambda: now[0])
+        bank = Bank()
+        clients = [Client(bank, str(i), 'x') for i in range(3)]
+        cache = FacadeCache(size=2, ttl=10)
+        first = cache.get(clients[0])
+        assert cache.get(clients[0]) is first
+        cache.get(clients[1])
+        cache.get(clients[2])
+        assert len(cache) == 2
+        assert cache.get(clients[0]) is not first
+        now[0] = 20
+        again = cache.get(clients[0])
+        assert again.client is clients[0] and cache.get(clients[0]) is again
@@ -0,0 +1,137 @@
+# pylint: disable=missing-function-docstring
+# pylint: disable=missing-class-docstring
+# pylint: disable=missing-module-docstring
+
+# pylint: disable=redefined-outer-name
+# pylint: disable=wrong-import-position
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sqlite3
+from datetime import date, datetime, timedelta
+import pytest
+from src.core import ClientFacade, DepositAccount, Transaction, TransactionsHistory
+from src.json_bridge import ClientCommands, SuperuserCommands
+from src.sqlite_storage import SQLiteStorage
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'bank.sqlite3')
+
+
+@pytest.fixture
+def storage(path):
+    storage = SQLiteStorage(path, batch_size = 4)
+    yield storage
+    storage.close()
+
+
+@pytest.fixture
+def client_facade(storage: SQLiteStorage):
+    server_state = storage.open_server_state()
+    SuperuserCommands.create_bank({'name': 'Сбер'}, server_state)
+    token = SuperuserCommands.create_client(
+        {'bank': 'Сбер', 'name': 'Иван', 'surname': 'Иванов',
+         'passport': '0123 456789', 'address': 'Москва'}, server_state)['client_token']
+    return server_state.client_facades[token]
+
+
+class TestSQLiteStorage:
+    def test_history(self, client_facade):
+        account1 = client_facade.create_account('DebitAccount')
+        account2 = client_facade.create_account('DebitAccount')
+        assert client_facade.deposit(account1.id, 100)
+        assert client_facade.transfer(account1.id, account2.id, 30)
+
+        history = account1.history.see()
+        assert len(account1.history) == 2
+        assert [t.amount for t in history] == [100, -30]
+        assert account1.history[history[1].id] == account2.history[history[1].id].mirror
+
+        bank = client_facade.client.bank
+        assert bank.ledger[history[1].id] == account2.history.see()[0]
+        assert len(bank.ledger) == 2
+        assert list(bank.ledger) == [history[0], account2.history.see()[0]]
+
+    def test_pages(self, client_facade):
+        account = client_facade.create_account('DebitAccount')
+        cash = client_facade.client.default_cash_account
+        start = Transaction(cash, account, 0).datetime
+        for i in range(10):
+            transaction = Transaction(cash, account, i)
+            transaction.datetime = start + timedelta(seconds = i // 2)
+            transaction._perform_without_checking_permissions() # pylint: disable=protected-access
+
+        assert sorted(t.amount for t in account.history.see(
+            after = start, before = start + timedelta(seconds = 3))) == [2, 3, 4, 5]
+
+        pages, cursor = [], None
+        while page := account.history.see(limit = 3, cursor = cursor):
+            pages.append(page)
+            cursor = TransactionsHistory.cursor(page[-1])
+        assert sorted(t.amount for t in sum(pages, [])) == list(range(10))
+        assert [len(page) for page in pages] == [3, 3, 3, 1]
+
+    def test_reopen(self, client_facade, storage: SQLiteStorage, path):
+        account = client_facade.create_account('DepositAccount', end_date = date(2030, 1, 1))
+        client_facade.deposit(account.id, 100)
+        history = account.history.see()
+        storage.flush()
+
+        reopened = SQLiteStorage(path)
+        server_state = reopened.open_server_state()
+        bank = server_state.banks['Сбер']
+        restored = bank.accounts[account.id]
+        assert isinstance(restored, DepositAccount)
+        assert restored.balance == 100
+        assert restored.end_date == date(2030, 1, 1)
+        assert restored.history.see() == history
+        assert restored.client.default_cash_account.balance == -100
+        assert len(server_state.client_facades) == 1
+        assert (restored.stats.count, restored.stats.credit) == (1, 100)
+        assert restored.stats.day(date.today()) == (0, 100)
+        assert restored.client.stats.info() == client_facade.client.stats.info()
+        reopened.close()
+
+        # счётчики хранятся в таблицах счетов и клиентов, а не пересчитываются по транзакциям
+        with sqlite3.connect(path) as connection:
+            connection.execute('DELETE FROM transactions')
+        reopened = SQLiteStorage(path)
+        restored = reopened.open_server_state().banks['Сбер'].accounts[account.id]
+        assert (restored.stats.count, restored.stats.credit) == (1, 100)
+        reopened.close()
+
+    def test_balance_at(self, client_facade, storage: SQLiteStorage):
+        account = client_facade.create_account('DebitAccount')
+        cash = client_facade.client.default_cash_account
+        for day in range(5):
+            transaction = Transaction(cash, account, 10)
+            transaction.datetime = datetime(2023, 1, 1 + day)
+            assert transaction.perform()
+        assert account.balance_at(datetime(2023, 1, 2, 12)) == 20
+        assert cash.balance_at(datetime(2023, 1, 2, 12)) == -20
+        answer = ClientCommands.show_balance(
+            {'account_id': str(account.id), 'datetime': '2023-01-03T00:00:00'}, client_facade)
+        assert answer['balance'] == 30
+        assert ClientCommands.show_balance({'account_id': str(account.id)},
+                                           client_facade)['status'] == 'error'
+
+    def test_withdrawal_limits(self, client_facade, storage: SQLiteStorage, path):
+        bank = client_facade.client.bank
+        bank.withdrawal_limits.set('account', timedelta(hours = 1), 150, unverified_only = False)
+        storage.bank_updated('Сбер', bank)
+        account = client_facade.create_account('DebitAccount')
+        client_facade.deposit(account.id, 1000)
+        assert client_facade.withdraw(account.id, 100)
+        storage.flush()
+
+        reopened = SQLiteStorage(path)
+        restored_bank = reopened.open_server_state().banks['Сбер']
+        restored = ClientFacade(restored_bank.accounts[account.id].client)
+        assert restored.client.bank.withdrawal_limits.info() == bank.withdrawal_limits.info()
+        assert not restored.withdraw(account.id, 100)
+        assert restored.withdraw(account.id, 50)
+        reopened.close()